@@ -49,6 +49,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hotels.instrumentation.InstrumentationMiddleware',
 )
 
 ROOT_URLCONF = 'HotelReservationsWebsite.urls'
@@ -68,6 +69,35 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/1.6/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cache for the hotel pages (see hotels/page_cache.py). To share it between
+# worker processes without external services use a FileBasedCache.
+PAGE_CACHE = 'default'
+
+# Worker threads making the variants of the uploaded photos (see hotels/images.py),
+# 0 to make them in the request.
+PHOTO_WORKERS = 2
+
+# Timing of the requests and their phases, logged and shown at
+# /hotels/instrumentation/ (see hotels/instrumentation.py).
+INSTRUMENTATION = False
+
+# Queue the reservation requests instead of making them in the request;
+# they are made by the process_bookings workers (see hotels/booking_queue.py).
+BOOKING_QUEUE = False
+
+# Users in this group (and staff users) may post batches of reservations to
+# /hotels/reserve/batch/ with HTTP Basic authentication, which needs HTTPS.
+PARTNERS_GROUP = 'partners'
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
@@ -2,9 +2,24 @@ from django.contrib import admin
 from hotels.models import *
 
 
+class RoomAdmin(admin.ModelAdmin):
+    # Room.__str__ shows the type and the hotel of the room
+    list_select_related = ('type', 'hotel')
+
+
+class ReservationAdmin(admin.ModelAdmin):
+    # Reservation.__str__ shows the user and the room (see RoomAdmin)
+    list_select_related = ('user', 'room__type', 'room__hotel')
+
+    def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
+        if db_field.name == 'room':
+            kwargs['queryset'] = Room.objects.select_related('type', 'hotel')
+        return super(ReservationAdmin, self).formfield_for_foreignkey(db_field, request, **kwargs)
+
+
 admin.site.register(Hotel)
 admin.site.register(Tag)
 admin.site.register(Photo)
 admin.site.register(RoomType)
-admin.site.register(Room)
-admin.site.register(Reservation)
+admin.site.register(Room, RoomAdmin)
+admin.site.register(Reservation, ReservationAdmin)
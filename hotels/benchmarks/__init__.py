@@ -0,0 +1,15 @@
+"""
+Benchmarks of the hot paths of the reservation system (see the benchmark
+command): a deterministic generator of synthetic hotels with reservations
+(hotels.benchmarks.generator) and timed scenarios run on them
+(hotels.benchmarks.scenarios), reported as latency percentiles and
+numbers of queries, also as JSON to compare runs with each other.
+
+The data is written in a transaction which is rolled back at the end,
+so the benchmarks can run on any database, e.g. a local SQLite file.
+"""
+
+
+class Rollback(Exception):
+    """Raised to roll back the transaction of a benchmark."""
+    pass
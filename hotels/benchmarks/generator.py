@@ -0,0 +1,156 @@
+"""
+Deterministic generator of synthetic hotels: the same seed and parameters
+give the same hotels, rooms and reservations.
+
+Every room is booked by consecutive stays with gaps between them, so
+that the room is taken on about the given part of the days. A stay is
+0 - MAX_STAY nights from its start to its end date (exponentially
+distributed, MEAN_STAY on average, so mostly short ones). The occupancy changes with the season, higher in
+the summer and lower in the winter.
+"""
+
+import math
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+
+from hotels.models import Tag, Hotel, RoomType, Room, Reservation
+from hotels import search, cache, page_cache, inventory_days
+
+SYLLABLES = ['ka', 'ri', 'mo', 'la', 'ne', 'vo', 'sta', 'dru', 'pel', 'zan', 'bor', 'vik', 'ten', 'gra', 'lis', 'mar', 'sol', 'hu', 'bel', 'ord']
+NAME_WORDS = ['Grand', 'Royal', 'Park', 'Palace', 'Central', 'Plaza', 'Garden', 'Golden', 'Inn', 'Lodge', 'Resort', 'Spa']
+COUNTRIES = ['Bulgaria', 'Serbia', 'Romania', 'Greece', 'Turkey', 'Macedonia']
+TEXT_WORDS = ['pool', 'breakfast', 'parking', 'wifi', 'beach', 'center', 'quiet', 'family', 'pets', 'mountain', 'view', 'restaurant']
+ROOM_TYPES = ['Single', 'Double', 'Twin', 'Suite', 'Family', 'Apartment']
+
+# the mean length of a stay, in nights, and the longest one
+MEAN_STAY = 3.0
+MAX_STAY = 21
+
+# how much the occupancy goes up in the summer and down in the winter
+SEASON_AMPLITUDE = 0.25
+
+# users who make the synthetic reservations
+USERS = 20
+
+# rows written by one INSERT
+ROWS_PER_INSERT = 500
+
+
+def word(rand, syllables):
+    return "".join(rand.choice(SYLLABLES) for i in range(syllables)).capitalize()
+
+
+def synthetic_hotel(rand):
+    """
+    Returns: Hotel object (not saved) with a random name, stars, location and text
+    """
+    name = "%s %s" % (word(rand, 3), rand.choice(NAME_WORDS))
+    location = "%s, %s" % (word(rand, 2), rand.choice(COUNTRIES))
+    text = " ".join(rand.sample(TEXT_WORDS, 4))
+    return Hotel(name=name[:25], stars=rand.randint(1, 5), location=location, text=text)
+
+
+def seasonal_occupancy(occupancy_rate, day):
+    """
+    Returns: the occupancy on the day, occupancy_rate on average over a year
+    """
+    season = math.sin(2 * math.pi * (day.timetuple().tm_yday - 105) / 365.0)    # the highest in mid-July
+    return min(max(occupancy_rate * (1 + SEASON_AMPLITUDE * season), 0.01), 0.99)
+
+
+def stays(rand, first_day, last_day, occupancy_rate):
+    """
+    Generates the reservations of one room.
+
+    Returns: generator of (start date, end date) tuples between first_day and last_day
+    """
+    day = first_day + timedelta(days=rand.randint(0, int(MEAN_STAY)))
+    while True:
+        end_date = day + timedelta(days=min(int(rand.expovariate(1 / MEAN_STAY)), MAX_STAY))
+        if end_date > last_day:
+            return
+        yield day, end_date
+
+        # a stay takes its last day too, so the next one starts at least a day later
+        rate = seasonal_occupancy(occupancy_rate, end_date)
+        mean_gap = (MEAN_STAY + 1) * (1 - rate) / rate
+        day = end_date + timedelta(days=1 + int(rand.expovariate(1 / mean_gap)))
+
+
+def _bulk_create(model, objects):
+    for i in range(0, len(objects), ROWS_PER_INSERT):
+        model.objects.bulk_create(objects[i:i + ROWS_PER_INSERT])
+
+
+def generate(rand, hotels=20, room_types=3, rooms_per_type=20, years=2, occupancy_rate=0.7, tags=30):
+    """
+    Writes synthetic hotels with their rooms and reservations.
+
+    Args:
+    rand (random.Random) -> the random generator, seeded
+    hotels (int) -> number of hotels
+    room_types (int) -> number of room types in every hotel (at most len(ROOM_TYPES))
+    rooms_per_type (int) -> rooms of every type in every hotel
+    years (int) -> years covered by the reservations, from half a year ago
+    occupancy_rate (float) -> part of the days on which a room is taken, on average
+    tags (int) -> number of tags, every hotel has some of them
+
+    Returns: dict with the ids of the 'hotels', their 'locations', the names of the 'room_types',
+    the 'user' who makes the reservations (and whose password is 'benchmark'),
+    the 'first_day' and 'last_day' of the reservations, the numbers of
+    'rooms' and 'reservations', the real 'occupancy' and the 'seconds' taken
+    """
+    start = time.time()
+    first_day = date.today() - timedelta(days=182)
+    last_day = first_day + timedelta(days=365 * years - 1)
+    first_hotel_id = (Hotel.objects.order_by('-id').values_list('id', flat=True)[:1] or [0])[0] + 1
+
+    user = User.objects.create_user('benchmark-%d' % rand.randint(0, 10 ** 9), 'benchmark@example.com', 'benchmark')
+    users = [user] + [User.objects.create(username='%s-%d' % (user.username, i)) for i in range(1, USERS)]
+    tag_ids = [Tag.objects.create(tag='Benchmark tag %d' % i).id for i in range(tags)]
+    type_names = ROOM_TYPES[:room_types]
+    # the names of the types are not unique, the first one is used
+    type_ids = [(RoomType.objects.filter(type=name).order_by('id').first() or RoomType.objects.create(type=name)).id for name in type_names]
+
+    _bulk_create(Hotel, [synthetic_hotel(rand) for i in range(hotels)])
+    hotel_ids = list(Hotel.objects.filter(id__gte=first_hotel_id).order_by('id').values_list('id', flat=True))
+    _bulk_create(Hotel.tags.through, [Hotel.tags.through(hotel_id=hotel_id, tag_id=tag_id)
+                                      for hotel_id in hotel_ids for tag_id in rand.sample(tag_ids, min(rand.randint(1, 6), len(tag_ids)))])
+    _bulk_create(Room, [Room(number=100 * (i + 1) + number, type_id=type_id, hotel_id=hotel_id)
+                        for hotel_id in hotel_ids for i, type_id in enumerate(type_ids) for number in range(1, rooms_per_type + 1)])
+
+    reservations = []
+    taken_days = 0
+    for room_id, hotel_id, type_id in Room.objects.filter(hotel__id__in=hotel_ids).order_by('id').values_list('id', 'hotel', 'type'):
+        for start_date, end_date in stays(rand, first_day, last_day, occupancy_rate):
+            reservations.append(Reservation(start_date=start_date, end_date=end_date, user=rand.choice(users),
+                                            room_id=room_id, hotel_id=hotel_id, room_type_id=type_id))
+            taken_days += (end_date - start_date).days + 1
+        if len(reservations) >= ROWS_PER_INSERT:
+            _bulk_create(Reservation, reservations)
+            reservations = []
+    _bulk_create(Reservation, reservations)
+
+    # the bulk inserts do not send signals
+    search.index_hotels(Hotel.objects.filter(id__in=hotel_ids))
+    for hotel_id in hotel_ids:
+        inventory_days.rebuild(hotel_id)
+    cache.invalidate_room_types()
+    page_cache.invalidate_all()
+    inventory_days.occupancy_changed(hotel_ids)
+
+    rooms = len(hotel_ids) * len(type_ids) * rooms_per_type
+    return {
+        'hotels': hotel_ids,
+        'locations': list(Hotel.objects.filter(id__in=hotel_ids).order_by('id').values_list('location', flat=True)),
+        'room_types': type_names,
+        'user': user,
+        'first_day': first_day,
+        'last_day': last_day,
+        'rooms': rooms,
+        'reservations': Reservation.objects.filter(hotel__id__in=hotel_ids).count(),
+        'occupancy': taken_days / float(max(rooms * ((last_day - first_day).days + 1), 1)),
+        'seconds': time.time() - start,
+    }
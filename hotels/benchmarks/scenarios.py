@@ -0,0 +1,129 @@
+"""
+Timed scenarios of the hot paths, run on the data of
+hotels.benchmarks.generator.
+
+A scenario is a function (data, rand) -> operation: it picks the random
+arguments (untimed) and returns the operation to time, a function
+without arguments. Every run is made in a transaction which is rolled
+back, so the writes of a run do not change the data of the next ones.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+
+from hotels.models import Room
+from hotels.helper_views import get_free_rooms_of_type, choose_best_room, interval_scheduling
+from hotels.benchmarks import Rollback
+
+# how far ahead the benchmark reservations start, in days, and how long they are
+AHEAD_DAYS = 120
+MAX_NIGHTS = 7
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def _interval(data, rand):
+    start_date = max(data['first_day'], date.today()) + timedelta(days=rand.randint(0, AHEAD_DAYS))
+    return start_date, start_date + timedelta(days=rand.randint(1, MAX_NIGHTS))
+
+
+def _client(data):
+    if 'client' not in data:
+        data['client'] = Client()
+        data['client'].login(username=data['user'].username, password='benchmark')
+    return data['client']
+
+
+def index_search(data, rand):
+    """GET of the index filtered by a part of a location and stars."""
+    location = rand.choice(data['locations'])
+    offset = rand.randint(0, max(len(location) - 4, 0))
+    params = {'location': location[offset:offset + 4], 'stars': rand.randint(1, 3)}
+    return lambda: _client(data).get('/hotels/', params)
+
+
+def free_rooms_of_type(data, rand):
+    """get_free_rooms_of_type of a random hotel, type and interval."""
+    hotel_id, room_type = rand.choice(data['hotels']), rand.choice(data['room_types'])
+    start_date, end_date = _interval(data, rand)
+    return lambda: get_free_rooms_of_type(hotel_id, start_date, end_date, room_type)
+
+
+def best_room(data, rand):
+    """choose_best_room among the free rooms of a random hotel, type and interval."""
+    hotel_id, room_type = rand.choice(data['hotels']), rand.choice(data['room_types'])
+    start_date, end_date = _interval(data, rand)
+    free_rooms = get_free_rooms_of_type(hotel_id, start_date, end_date, room_type) or list(Room.objects.filter(hotel__id=hotel_id, type__type=room_type))
+    return lambda: choose_best_room(free_rooms, start_date, end_date)
+
+
+def scheduling(data, rand):
+    """interval_scheduling of a new reservation in a random hotel, type and interval."""
+    hotel_id, room_type = rand.choice(data['hotels']), rand.choice(data['room_types'])
+    start_date, end_date = _interval(data, rand)
+    return lambda: interval_scheduling(hotel_id, room_type, start_date, end_date, data['user'])
+
+
+def reserve(data, rand):
+    """POST of the reserve form with 1 - 2 rooms of a random type."""
+    hotel_id, room_type = rand.choice(data['hotels']), rand.choice(data['room_types'])
+    start_date, end_date = _interval(data, rand)
+    params = dict((other_type, 0) for other_type in data['room_types'])
+    params.update({'start_date': str(start_date), 'end_date': str(end_date), room_type: rand.randint(1, 2)})
+    client = _client(data)
+    return lambda: client.post('/hotels/reserve/%d/' % hotel_id, params)
+
+
+SCENARIOS = OrderedDict([
+    ('index_search', index_search),
+    ('get_free_rooms_of_type', free_rooms_of_type),
+    ('choose_best_room', best_room),
+    ('interval_scheduling', scheduling),
+    ('reserve', reserve),
+])
+
+
+def percentile(values, p):
+    """
+    Returns: the p-th percentile of the sorted values (nearest rank)
+    """
+    return values[min(int(len(values) * p / 100.0), len(values) - 1)]
+
+
+def summary(values):
+    values = sorted(values)
+    result = OrderedDict([('mean', sum(values) / float(len(values)))])
+    for p in PERCENTILES:
+        result['p%d' % p] = percentile(values, p)
+    result['max'] = values[-1]
+    return result
+
+
+def run(name, data, rand, runs):
+    """
+    Runs the scenario runs times.
+
+    Returns: dict with the number of 'runs' and the summaries (mean,
+    percentiles and max) of the latency in 'ms' and of the 'queries'
+    """
+    scenario = SCENARIOS[name]
+    _client(data)   # logged in outside of the rolled back runs
+    latencies, queries = [], []
+    for i in range(runs):
+        try:
+            with transaction.atomic():
+                operation = scenario(data, rand)
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.time()
+                    operation()
+                    latencies.append(1000 * (time.time() - start))
+                queries.append(len(captured))
+                raise Rollback()
+        except Rollback:
+            pass
+    return OrderedDict([('runs', runs), ('ms', summary(latencies)), ('queries', summary(queries))])
@@ -0,0 +1,140 @@
+"""
+Queue of the reservation requests, for busy hotels.
+
+When settings.BOOKING_QUEUE is on, the reserve view does not make the
+reservations: it checks the daily inventory, saves the request as a
+BookingRequest and returns, and the client polls views.booking_status.
+The process_bookings command runs a worker for some hotels, which makes
+the requests of every hotel one after another (see process_batch), so
+the requests of a hotel do not wait for each other's locks in the web
+processes and the rescheduling does not run in them.
+
+The queue is the BookingRequest table, so it survives restarts. A
+worker claims a batch of the pending requests of a hotel with one
+UPDATE (see claim), which two workers cannot both do for a request.
+Every request is made in one transaction together with its new status,
+so a request is made at most once even if the worker stops; requests
+claimed by a worker which stopped are put back by requeue_stale.
+"""
+
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from hotels.models import BookingRequest
+from hotels.helper_views import reserve_rooms
+
+logger = logging.getLogger(__name__)
+
+# requests claimed at once by a worker
+BATCH_SIZE = 20
+
+# seconds after which the requests claimed by a worker are given to another one
+STALE_SECONDS = 600
+
+# what the reserve view and the status of a request say
+MESSAGES = {
+    BookingRequest.PENDING: "Your reservation is waiting to be processed.",
+    BookingRequest.PROCESSING: "Your reservation is being processed.",
+    BookingRequest.DONE: "Success!",
+    BookingRequest.FAILED: "Not enough free rooms!",
+}
+
+
+def worker_name():
+    """Returns: unique name of a worker of this process."""
+    return "%s:%d:%s" % (socket.gethostname()[:25], os.getpid(), uuid.uuid4().hex[:8])
+
+
+def enqueue(hotel_id, rooms, start_date, end_date, user):
+    """
+    Args:
+    hotel_id (int) -> database id of the hotel
+    rooms (dict) -> room type -> number of rooms of that type
+    start_date (date) -> start date
+    end_date (date) -> end date
+    user (User object) -> the user making the reservations
+
+    Returns: the new BookingRequest
+    """
+    return BookingRequest.objects.create(hotel_id=hotel_id, user=user, start_date=start_date, end_date=end_date,
+                                         rooms=json.dumps(rooms, sort_keys=True))
+
+
+def claim(hotel_id, worker, limit=BATCH_SIZE):
+    """
+    Takes the oldest pending requests of the hotel for the worker.
+
+    Returns: list of the claimed BookingRequests, oldest first
+    """
+    pending = BookingRequest.objects.filter(hotel__id=hotel_id, status=BookingRequest.PENDING)
+    ids = list(pending.order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    # the requests claimed by another worker meanwhile are not pending any more
+    pending.filter(id__in=ids).update(status=BookingRequest.PROCESSING, worker=worker, claimed=timezone.now())
+    return list(BookingRequest.objects.filter(id__in=ids, worker=worker, status=BookingRequest.PROCESSING).select_related('user').order_by('id'))
+
+
+def process(booking):
+    """
+    Makes the reservations of a claimed request and sets its status.
+
+    Returns: True if they are made
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                success = reserve_rooms(booking.hotel_id, json.loads(booking.rooms), booking.start_date, booking.end_date, booking.user)
+        except Exception:
+            logger.exception("Booking request %d failed", booking.id)
+            success = False
+        booking.status = BookingRequest.DONE if success else BookingRequest.FAILED
+        updated = BookingRequest.objects.filter(id=booking.id, worker=booking.worker, status=BookingRequest.PROCESSING).update(status=booking.status)
+        if not updated:
+            # put back meanwhile (see requeue_stale) and given to another worker
+            transaction.set_rollback(True)
+            success = False
+    return success
+
+
+def process_batch(hotel_id, worker, limit=BATCH_SIZE):
+    """
+    Claims the oldest pending requests of the hotel and makes them,
+    one after another, in the order they came.
+
+    Returns: number of processed requests
+    """
+    batch = claim(hotel_id, worker, limit)
+    done = sum(1 for booking in batch if process(booking))
+    if batch:
+        logger.info("Hotel %s: %d booking requests, %d done", hotel_id, len(batch), done)
+    return len(batch)
+
+
+def requeue_stale(hotel_id, seconds=STALE_SECONDS):
+    """
+    Puts back the requests of the hotel claimed more than seconds ago
+    and not processed (e.g. by a worker which was stopped).
+
+    Returns: number of the requests put back
+    """
+    return BookingRequest.objects.filter(hotel__id=hotel_id, status=BookingRequest.PROCESSING,
+                                         claimed__lt=timezone.now() - timedelta(seconds=seconds)).update(status=BookingRequest.PENDING, worker='')
+
+
+def status(booking):
+    """Returns: dict with the status of the request, for the client."""
+    return {
+        'id': booking.id,
+        'hotel': booking.hotel_id,
+        'status': booking.get_status_display(),
+        'done': booking.status in (BookingRequest.DONE, BookingRequest.FAILED),
+        'log': MESSAGES[booking.status],
+    }
@@ -0,0 +1,91 @@
+"""
+Per-process caches of data which rarely changes.
+
+Unlike the caches in settings.CACHES these live in the memory of the
+process, so a hit costs no query and no unpickling. They are invalidated
+by the signals in hotels.signals, which only reach the current process,
+so the entries also expire after a timeout to bound how stale they can
+get when several processes serve the site.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from hotels.models import RoomType
+
+# hotels whose room types are kept
+ROOM_TYPES_CACHE_SIZE = 1000
+
+# seconds before the room types of a hotel are fetched again
+ROOM_TYPES_TIMEOUT = 5 * 60
+
+
+class LRUCache(object):
+    """
+    Dict-like cache with at most max_size entries, which drops the least
+    recently used entry when full and the entries older than timeout seconds.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()   # key -> (expiry time, value), the least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return default
+            self._entries[key] = entry  # the most recently used now
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.timeout, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_room_types = LRUCache(ROOM_TYPES_CACHE_SIZE, ROOM_TYPES_TIMEOUT)
+
+
+def room_types_of_hotel(hotel_id):
+    """
+    Args:
+    hotel_id (int) -> database id of the hotel
+
+    Returns: list of the RoomType objects of the rooms in the hotel, ordered by id
+    (fetched with one query, or none if they are in the cache)
+    """
+    hotel_id = int(hotel_id)
+    room_types = _room_types.get(hotel_id)
+    if room_types is None:
+        room_types = list(RoomType.objects.filter(room__hotel__id=hotel_id).distinct().order_by('id'))
+        _room_types.set(hotel_id, room_types)
+    return list(room_types)
+
+
+def invalidate_room_types(hotel_id=None):
+    """
+    Removes the room types of the hotel from the cache,
+    or of all hotels if hotel_id is None (e.g. when a room type changes).
+    """
+    if hotel_id is None:
+        _room_types.clear()
+    else:
+        _room_types.delete(int(hotel_id))
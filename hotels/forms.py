@@ -3,18 +3,65 @@ from django import forms
 from hotels.models import Hotel, Tag, RoomType, Room, Reservation
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from hotels.search import MATCH_ALL_TAGS, MATCH_ANY_TAG
+from hotels.room_calendar import MAX_CALENDAR_DAYS, CALENDAR_DAYS
+from datetime import date
 
 class SearchHotelForm(ModelForm):
     name = forms.CharField(label='Hotel name', required=False)
     stars = forms.IntegerField(label='Stars (minimum)', initial=1)
     location = forms.CharField(label='Location', required=False)
     tags = forms.ModelMultipleChoiceField(widget=forms.CheckboxSelectMultiple(), queryset=Tag.objects.all(), required=False)
+    tag_match = forms.ChoiceField(label='Hotels with', widget=forms.RadioSelect(), choices=[(MATCH_ALL_TAGS, 'all of the tags'), (MATCH_ANY_TAG, 'any of the tags')], initial=MATCH_ALL_TAGS, required=False)
 
     class Meta:
         model = Hotel
         exclude = ['text', 'photo']
 
 
+class AvailabilityForm(SearchHotelForm):
+    """
+    The search criteria of SearchHotelForm and the rooms needed,
+    e.g. rooms='Double:2,Single:1' (see views.availability).
+    """
+    stars = forms.IntegerField(label='Stars (minimum)', required=False)
+    start_date = forms.DateField(label='First day')
+    end_date = forms.DateField(label='Last day')
+    rooms = forms.CharField(label='Rooms (type:count, ...)')
+    after = forms.IntegerField(required=False, min_value=0)
+
+    def clean_rooms(self):
+        rooms = dict()
+        for part in self.cleaned_data['rooms'].split(','):
+            room_type, separator, count = part.rpartition(':')
+            room_type = room_type.strip()
+            if not separator or not room_type or not count.strip().isdigit() or int(count) < 1:
+                raise forms.ValidationError("Give the rooms as type:count, separated by commas.")
+            rooms[room_type] = rooms.get(room_type, 0) + int(count)
+        return rooms
+
+    def clean(self):
+        cleaned_data = super(AvailabilityForm, self).clean()
+        if cleaned_data.get('start_date') and cleaned_data.get('end_date') and cleaned_data['end_date'] < cleaned_data['start_date']:
+            raise forms.ValidationError("The last day is before the first day.")
+        return cleaned_data
+
+
+class CalendarForm(forms.Form):
+    """
+    The window of the calendar of a hotel (see views.calendar),
+    from today for CALENDAR_DAYS days by default.
+    """
+    start_date = forms.DateField(label='First day', required=False)
+    days = forms.IntegerField(label='Days', required=False, min_value=1, max_value=MAX_CALENDAR_DAYS)
+
+    def clean_start_date(self):
+        return self.cleaned_data['start_date'] or date.today()
+
+    def clean_days(self):
+        return self.cleaned_data['days'] or CALENDAR_DAYS
+
+
 class ReservationForm(ModelForm):
     start_date = forms.DateField(label='First day')
     end_date = forms.DateField(label='Last day')
@@ -23,8 +70,7 @@ class ReservationForm(ModelForm):
         extra = kwargs.pop('extra') if 'extra' in kwargs else {}
         super(ReservationForm, self).__init__(*args, **kwargs)
         
-        for room_type in extra:
-            room_type = RoomType.objects.get(id=room_type['type'])    # query gets the room type as object
+        for room_type in extra:     # RoomType objects
             self.fields[room_type.type] = forms.IntegerField(label=room_type.type, initial=0)
     
     class Meta:
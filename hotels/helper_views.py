@@ -1,6 +1,181 @@
 from hotels.models import Hotel, Tag, RoomType, Room, Reservation
-from datetime import timedelta
-from operator import attrgetter
+from django.db import connection, transaction
+from django.db.models import Q, Min, Max, Count
+from django.core.exceptions import ValidationError
+from django.utils import six
+from hotels.scheduling import select_intervals, assign_rooms, min_moves_placement
+from hotels import inventory_days
+from hotels.instrumentation import span
+from hotels.search import search_hotels, filter_by_tags, MATCH_ALL_TAGS
+from datetime import date, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# days by which choose_best_room shifts the interval it checks for reservations
+INTERVAL_TO_CHECK = 3
+
+# hotels on one page of the index
+HOTELS_PER_PAGE = 10
+
+# hotels on one page of the availability search
+AVAILABLE_HOTELS_PER_PAGE = 50
+
+# reservations written by one UPDATE statement in move_reservations
+# (keeps the number of query parameters under the SQLite limit)
+MOVES_PER_UPDATE = 300
+
+
+def page_of_hotels(hotels, page_num=1, after=None):
+    """
+    Cuts one page out of the hotels, ordered by id by default.
+
+    Args:
+    hotels (queryset of Hotel objects) -> all hotels to show
+    page_num (int) -> number of the page (from 1), if after is None
+    after (int) -> keyset mode: the page starts after the hotel with this
+        database id, so deep pages cost the same as the first one
+
+    Returns: (list of the hotels on the page, True if there is a next page)
+
+    One hotel more than the page size is fetched to know if there is
+    a next page, so the hotels never have to be counted.
+    Already ordered hotels (e.g. ranked search results) keep their order,
+    except in keyset mode.
+    """
+    if after is not None:
+        page = list(hotels.order_by('id').filter(id__gt=after)[:HOTELS_PER_PAGE + 1])
+    else:
+        if not hotels.ordered:
+            hotels = hotels.order_by('id')
+        offset = (page_num - 1) * HOTELS_PER_PAGE
+        page = list(hotels[offset:offset + HOTELS_PER_PAGE + 1])
+    return page[:HOTELS_PER_PAGE], len(page) > HOTELS_PER_PAGE
+
+
+def search_hotels_by_form(search):
+    """
+    Args:
+    search (dict) -> cleaned data of a SearchHotelForm
+
+    Returns: queryset of the hotels matching the search (see search.search_hotels)
+    """
+    hotels = Hotel.objects.filter(stars__gte=search['stars'] or 1)
+    hotels = filter_by_tags(hotels, search['tags'], search['tag_match'] or MATCH_ALL_TAGS)
+    return search_hotels(hotels, name=search['name'], location=search['location'])
+
+
+def available_hotels(hotels, start_date, end_date, rooms, after=None, per_page=AVAILABLE_HOTELS_PER_PAGE):
+    """
+    Availability search across hotels: finds the hotels which have the
+    rooms free for the whole time.
+
+    Args:
+    hotels (queryset of Hotel objects) -> the hotels to search in
+    start_date (date) -> start date
+    end_date (date) -> end date
+    rooms (dict) -> room type -> number of free rooms needed
+    after (int) -> only hotels with greater ids (keyset pagination)
+    per_page (int) -> hotels on a page
+
+    Returns: list of (Hotel object, dict room type -> number of free rooms)
+    tuples ordered by hotel id, and whether there are more hotels after them
+
+    A room is free under the same condition as in get_free_rooms. The
+    hotels are found with one query, whatever their number: for every
+    room type a subquery groups its free rooms by hotel and keeps the
+    hotels with enough of them. A second grouped query counts the free
+    rooms of the hotels on the page.
+    """
+    def free_rooms(room_types, hotel_ids=None):
+        busy_rooms = Reservation.objects.filter(start_date__lte=end_date, end_date__gte=start_date, room_type__type__in=room_types)
+        rooms = Room.objects.filter(type__type__in=room_types)
+        if hotel_ids is not None:
+            busy_rooms = busy_rooms.filter(hotel__id__in=hotel_ids)
+            rooms = rooms.filter(hotel__id__in=hotel_ids)
+        return rooms.exclude(id__in=busy_rooms.values('room'))
+
+    for room_type, count in rooms.items():
+        hotels_with_rooms = free_rooms([room_type]).values('hotel').annotate(free=Count('id')).filter(free__gte=count).values('hotel')
+        hotels = hotels.filter(id__in=hotels_with_rooms)
+
+    page = list(hotels.filter(id__gt=after or 0).order_by('id')[:per_page + 1])
+    page, has_next = page[:per_page], len(page) > per_page
+
+    hotel_ids = [hotel.id for hotel in page]
+    free_counts = dict(((hotel_id, room_type), 0) for hotel_id in hotel_ids for room_type in rooms)
+    if hotel_ids:
+        for hotel_id, room_type, free in free_rooms(list(rooms), hotel_ids).values_list('hotel', 'type__type').annotate(Count('id')):
+            free_counts[hotel_id, room_type] = free
+
+    return [(hotel, dict((room_type, free_counts[hotel.id, room_type]) for room_type in rooms)) for hotel in page], has_next
+
+
+class NotEnoughRooms(Exception):
+    """
+    Raised inside a reservation transaction when a requested room
+    cannot be reserved, so that the whole transaction is rolled back.
+    """
+
+
+def lock_rooms(hotel_id, room_types):
+    """
+    Locks the rooms (in that hotel of those types) until the end of the
+    current transaction (SELECT ... FOR UPDATE), so that concurrent
+    reservations for them are made one after another.
+
+    Must be the first query of the transaction: on MySQL (REPEATABLE READ)
+    the reads that follow it then see everything committed before the
+    lock was acquired. The rows are locked in the order of their ids,
+    so two transactions cannot deadlock on them.
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    room_types (list of strings) -> types of the rooms
+
+    Returns: list of the ids of the locked rooms
+    """
+    return list(Room.objects.select_for_update().filter(hotel__id=hotel_id, type__type__in=list(room_types)).order_by('id').values_list('id', flat=True))
+
+
+def _free_rooms_queryset(hotel_id, start_date, end_date):
+    """
+    Queryset of all rooms in the hotel which are unoccupied between
+    start_date and end_date.
+
+    A room is occupied if it has a reservation which starts on or before
+    end_date and will not be released before start_date (the end day of
+    a reservation is taken, as in the scheduling and hotels.inventory_days). The reservations are
+    excluded with a single subquery (NOT IN), so the whole check is one
+    round trip to the database.
+    """
+    busy_rooms = Reservation.objects.filter(hotel__id=hotel_id, start_date__lte=end_date, end_date__gte=start_date).values('room')
+    return Room.objects.filter(hotel__id=hotel_id).exclude(id__in=busy_rooms)
+
+
+def get_free_rooms(hotel_id, start_date, end_date, room_types):
+    """
+    Availability engine: for every given room type retrieves all rooms
+    (in that hotel of that type) that are unoccupied for that time.
+    All room types are answered with one query.
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    start_date (date) -> start date
+    end_date (date) -> end date
+    room_types (list of strings) -> types of the rooms
+
+    Returns: dict room type -> list of unoccupied Room objects (ordered by id);
+    every requested type is present, possibly with an empty list
+    """
+    free_rooms = dict((room_type, []) for room_type in room_types)
+
+    rooms = _free_rooms_queryset(hotel_id, start_date, end_date).filter(type__type__in=list(free_rooms)).select_related('type').order_by('id')
+    for room in rooms:
+        free_rooms[room.type.type].append(room)
+
+    return free_rooms
+
 
 def get_free_rooms_of_type(hotel_id, start_date, end_date, room_type):
     """
@@ -15,28 +190,8 @@ def get_free_rooms_of_type(hotel_id, start_date, end_date, room_type):
     room_type (string) -> type of the room_type
 
     Returns: list of all unoccupied rooms for the given period
-    
-    Algorithm:
-    1. Get all rooms in that hotel of that type (roomtype.id)
-    2. Get all rooms in the hotel which are taken before start_date and
-    will not be released before end_date
-    3. Get all rooms in the hotel which will be taken taken after start_date and
-    before end_date
-    4. Union of the querysets in 2. & 3.
-    5. Difference of the querysets 1. & 4.
-    """
-    room_type = RoomType.objects.get(type=room_type)
-    room_type = room_type.id
-
-    all_rooms = Room.objects.filter(hotel=hotel_id, type=room_type)
-    
-    ids_rooms_taken_already = Reservation.objects.filter(room__type=room_type, room__hotel__id=hotel_id, start_date__lt=start_date, end_date__gte=start_date).values('room').distinct()
-    ids_rooms_to_be_taken_soon = Reservation.objects.filter(room__type=room_type, room__hotel__id=hotel_id, start_date__lt=end_date, end_date__gte=start_date).values('room').distinct()
-    
-    unavailable_rooms = ids_rooms_taken_already | ids_rooms_to_be_taken_soon
-    unavailable_rooms = [i['room'] for i in unavailable_rooms]
-    
-    return [x for x in all_rooms if x.id not in unavailable_rooms]
+    """
+    return list(_free_rooms_queryset(hotel_id, start_date, end_date).filter(type__type=room_type).order_by('id'))
 
 
 def choose_best_room(free_rooms_of_type, start_date, end_date):
@@ -76,17 +231,124 @@ def choose_best_room(free_rooms_of_type, start_date, end_date):
     start_date & end_date. We count the number of reservations for that room
     in the interval (start_date - several days) & (end_date + several days).
     We choose the room that has the maximum value.
+
+    The busyness of all candidates is computed at once (see choose_best_room_id).
     """
-    INTERVAL_TO_CHECK = 3
-    
-    busyness_of_rooms = []
-    for room in free_rooms_of_type:
-        reservations_starting_in_interval = Reservation.objects.filter(room__id=room.id, start_date__gte = start_date + timedelta(days=INTERVAL_TO_CHECK), start_date__lte =  end_date + timedelta(days=INTERVAL_TO_CHECK)).count()
-        reservations_ending_in_interval = Reservation.objects.filter(room__id=room.id, end_date__gte = start_date + timedelta(days=INTERVAL_TO_CHECK), end_date__lte =  end_date + timedelta(days=INTERVAL_TO_CHECK)).count()
-        busyness_of_rooms.append(reservations_starting_in_interval + reservations_ending_in_interval)
-    
-    index_of_best = busyness_of_rooms.index(max(busyness_of_rooms))
-    return free_rooms_of_type[index_of_best]
+    best_room_id = choose_best_room_id([room.id for room in free_rooms_of_type], start_date, end_date)
+    return [room for room in free_rooms_of_type if room.id == best_room_id][0]
+
+
+def choose_best_room_id(room_ids, start_date, end_date):
+    """
+    Same heuristic as choose_best_room, but works on room ids.
+
+    Args:
+    room_ids (list of int) -> database ids of the candidate rooms
+    start_date (date) -> start date
+    end_date (date) -> end date
+
+    Returns: id of the best room (the first one on a tie)
+
+    The reservations which start or end in the checked interval are
+    fetched for all candidates with one query and counted per room.
+    A reservation which both starts and ends there counts twice.
+    """
+    window_start = start_date + timedelta(days=INTERVAL_TO_CHECK)
+    window_end = end_date + timedelta(days=INTERVAL_TO_CHECK)
+
+    busyness_of_rooms = dict((room_id, 0) for room_id in room_ids)
+    reservations_in_interval = Reservation.objects.filter(room__id__in=room_ids).filter(Q(start_date__gte=window_start, start_date__lte=window_end) | Q(end_date__gte=window_start, end_date__lte=window_end)).values_list('room', 'start_date', 'end_date')
+    for room_id, res_start, res_end in reservations_in_interval:
+        if window_start <= res_start <= window_end:
+            busyness_of_rooms[room_id] += 1
+        if window_start <= res_end <= window_end:
+            busyness_of_rooms[room_id] += 1
+
+    return max(room_ids, key=lambda room_id: busyness_of_rooms[room_id])
+
+
+class SchedulingResult(object):
+    """
+    Outcome of interval_scheduling.
+    It is true if the new reservation fits; moves is a dict
+    reservation id -> id of its new room of the previous reservations
+    which were put in another room, and moved is their number.
+    """
+    def __init__(self, success, moves=None):
+        self.success = success
+        self.moves = moves or dict()
+        self.moved = len(self.moves)
+
+    def __bool__(self):
+        return self.success
+    __nonzero__ = __bool__
+
+
+def move_reservations(new_rooms):
+    """
+    Puts reservations in other rooms with one UPDATE statement
+    (SET room_id = CASE id WHEN ... END) per chunk of reservations.
+
+    Args:
+    new_rooms (dict) -> reservation id -> id of its new room
+
+    Returns: number of updated reservations
+    """
+    table = connection.ops.quote_name(Reservation._meta.db_table)
+    id_column = connection.ops.quote_name(Reservation._meta.pk.column)
+    room_column = connection.ops.quote_name(Reservation._meta.get_field('room').column)
+
+    moves = sorted(new_rooms.items())
+    cursor = connection.cursor()
+    updated = 0
+    for i in range(0, len(moves), MOVES_PER_UPDATE):
+        chunk = moves[i:i + MOVES_PER_UPDATE]
+        sql = "UPDATE {0} SET {1} = CASE {2} {3} END WHERE {2} IN ({4})".format(
+            table, room_column, id_column,
+            " ".join(["WHEN %s THEN %s"] * len(chunk)),
+            ", ".join(["%s"] * len(chunk)))
+        params = [value for move in chunk for value in move] + [res_id for res_id, room_id in chunk]
+        cursor.execute(sql, params)
+        updated += cursor.rowcount
+
+    return updated
+
+
+def overlapping_cluster(hotel_id, room_type, start_date, end_date, since):
+    """
+    Retrieves the reservations (in that hotel of that type) which are
+    connected to the interval start_date - end_date by a chain of
+    overlapping reservations. Only they may need another room if a new
+    reservation is put in that interval; all the others keep their rooms.
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    room_type (string) -> type of the rooms
+    start_date (date) -> start date
+    end_date (date) -> end date
+    since (date) -> reservations which end before that day are never
+        included (and not counted as overlapping)
+
+    Returns: list of (id, start_date, end_date, room id) tuples, ordered by id
+
+    The interval is widened to the earliest start and the latest end of
+    the reservations overlapping it until it stops growing. Every step is
+    one aggregate query, so the cost depends on the local occupancy and
+    not on the whole history of the hotel.
+    """
+    reservations = Reservation.objects.filter(hotel__id=hotel_id, room_type__type=room_type)
+
+    while True:
+        bounds = reservations.filter(start_date__lte=end_date, end_date__gte=max(start_date, since)).aggregate(Min('start_date'), Max('end_date'))
+        if bounds['start_date__min'] is None:
+            break
+        new_start_date = max(min(start_date, bounds['start_date__min']), since)
+        new_end_date = max(end_date, bounds['end_date__max'])
+        if (new_start_date, new_end_date) == (start_date, end_date):
+            break
+        start_date, end_date = new_start_date, new_end_date
+
+    return list(reservations.filter(start_date__lte=end_date, end_date__gte=max(start_date, since)).order_by('id').values_list('id', 'start_date', 'end_date', 'room'))
 
 
 def interval_scheduling(hotel_id, room_type, start_date, end_date, user):
@@ -97,7 +359,11 @@ def interval_scheduling(hotel_id, room_type, start_date, end_date, user):
     to host the previous reservations and the new one.
     Also, edit the database according to the new schedule.
 
-    The soultion is greedy but optimal.
+    The soultion is greedy but optimal (see scheduling.assign_rooms).
+    Before it, the placement which moves the fewest previous reservations
+    is searched for, over the reservations in conflict only (see
+    scheduling.min_moves_placement); all of them are placed again only
+    if it needs too many moves. The running ones are never moved.
 
     Args:
     hotel_id (int) -> database id of the hotel
@@ -106,50 +372,317 @@ def interval_scheduling(hotel_id, room_type, start_date, end_date, user):
     end_date (date) -> end date
     user (User object) -> the user making the new reservation
 
-    Returns:
-    True, if the reservations can be rearranged to fit
-    False, else
+    Returns: SchedulingResult
+    true, if the reservations can be rearranged to fit (with the moves)
+    false, else
 
     Side effects!:
     Entries in the database are rearranged (if True).
     New reservation is inserted (if True).
+    Only the reservations which change their room are written,
+    all in one transaction, which locks the rooms of that type
+    (see lock_rooms); nothing is written if False.
+    Reservations which ended before today (or before start_date, for a
+    reservation in the past) are never moved, and only the ones
+    overlapping the new reservation directly or through other
+    reservations are rearranged (see overlapping_cluster).
+    """
+    start_date = Reservation._meta.get_field('start_date').to_python(start_date)
+    end_date = Reservation._meta.get_field('end_date').to_python(end_date)
+    since = min(date.today(), start_date)
+
+    with transaction.atomic():
+        with span('availability'):
+            rooms = lock_rooms(hotel_id, [room_type])
+
+            # reschedule only the reservations around the new one,
+            # as if the ones which are running already started on 'since'
+            reservations = overlapping_cluster(hotel_id, room_type, start_date, end_date, since)
+
+        with span('partitioning'):
+            # first the placement which moves the fewest reservations,
+            # keeping the ones which are running; if there is none with
+            # few moves, all the others are placed again around them
+            pinned = [res for res in reservations if res[1] < since]
+            movable = [res for res in reservations if res[1] >= since]
+            new_schedule = min_moves_placement(pinned, movable, [(None, start_date, end_date)], rooms)
+            if new_schedule is None:
+                new_schedule = assign_rooms(pinned, movable, [(None, start_date, end_date)], rooms)
+        if new_schedule is None:
+            return SchedulingResult(False)    # the reservations cannot fit
+
+        with span('write-back'):
+            # rearrange the reservations which changed their room
+            new_rooms = dict((res_id, new_schedule[res_id]) for res_id, start, end, room_id in movable if new_schedule.get(res_id, room_id) != room_id)
+            move_reservations(new_rooms)
+            if new_rooms:
+                inventory_days.occupancy_changed([hotel_id])  # the update does not send signals
+
+            new_reserv = Reservation(start_date=start_date, end_date=end_date, room_id=new_schedule[None], user=user)
+            new_reserv.save()
+
+    return SchedulingResult(True, new_rooms)
+
+
+def assign_request(hotel_id, rooms, start_date, end_date, user):
+    """
+    Makes all the reservations of a request at once, rearranging the
+    previous reservations of the hotel if they do not fit as they are.
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    rooms (dict) -> room type -> number of rooms of that type
+    start_date (date) -> start date
+    end_date (date) -> end date
+    user (User object) -> the user making the reservations
+
+    Returns: SchedulingResult
+    true, if all the reservations fit (and are made)
+    false, else (and nothing is written)
+
+    Unlike calling interval_scheduling for every room, the rooms of a type
+    are placed together with one pass of scheduling.assign_rooms over
+    the reservations connected to the request (see overlapping_cluster),
+    so a request fits whenever some arrangement of the reservations
+    fits it. The reservations of the guests who checked in (started
+    before today, or before start_date for a request in the past) keep
+    their rooms. The rooms are first put where they move the fewest
+    reservations (see scheduling.min_moves_placement), and only if that
+    needs too many moves the others keep theirs whenever they can.
+    Every room type is decided before anything is written, in one
+    transaction which locks the rooms of the types.
     """
-    room_type_str = room_type
-    room_type = RoomType.objects.get(type=room_type)
-    room_type = room_type.id
+    start_date = Reservation._meta.get_field('start_date').to_python(start_date)
+    end_date = Reservation._meta.get_field('end_date').to_python(end_date)
+    since = min(date.today(), start_date)
+    rooms = dict((room_type, count) for room_type, count in rooms.items() if count)
 
-    rooms = Room.objects.filter(hotel__id=hotel_id, type__type=room_type_str)
-    rooms = [r.id for r in rooms]
-    rooms.sort()
+    with transaction.atomic():
+        with span('availability'):
+            lock_rooms(hotel_id, rooms)
+            rooms_of_type = dict((room_type, []) for room_type in rooms)
+            for room_id, room_type in Room.objects.filter(hotel__id=hotel_id, type__type__in=list(rooms)).order_by('id').values_list('id', 'type__type'):
+                rooms_of_type[room_type].append(room_id)
+            clusters = dict((room_type, overlapping_cluster(hotel_id, room_type, start_date, end_date, since)) for room_type in rooms)
 
-    random_room_for_new_reserv = Room.objects.filter(hotel__id=hotel_id, type__type=room_type_str)[:1][0]
-    new_reserv = Reservation(start_date=start_date, end_date=end_date, room=random_room_for_new_reserv, user=user)
-    new_reserv.save()
+        new_rooms = dict()
+        new_reservations = []   # list of (room id, room type)
+        with span('partitioning'):
+            for room_type, count in sorted(rooms.items()):
+                pinned = [res for res in clusters[room_type] if res[1] < since]
+                movable = [res for res in clusters[room_type] if res[1] >= since]
+                new = [((None, i), start_date, end_date) for i in range(count)]
+                schedule = min_moves_placement(pinned, movable, new, rooms_of_type[room_type])
+                if schedule is None:
+                    schedule = assign_rooms(pinned, movable, new, rooms_of_type[room_type])
+                if schedule is None:
+                    return SchedulingResult(False)    # the reservations cannot fit
+                new_rooms.update((res_id, schedule[res_id]) for res_id, start, end, room_id in movable if schedule.get(res_id, room_id) != room_id)
+                new_reservations += [(schedule[(None, i)], room_type) for i in range(count)]
 
-    reservations = list(Reservation.objects.filter(room__type=room_type, room__hotel__id=hotel_id))
-    reservations.sort(key=attrgetter('start_date'))
+        with span('write-back'):
+            move_reservations(new_rooms)
+            # bulk_create does not call Reservation.save, which copies these from the room
+            room_type_ids = dict(Room.objects.filter(id__in=[room_id for room_id, room_type in new_reservations]).values_list('id', 'type'))
+            Reservation.objects.bulk_create([
+                Reservation(start_date=start_date, end_date=end_date, user=user, room_id=room_id,
+                            hotel_id=hotel_id, room_type_id=room_type_ids[room_id])
+                for room_id, room_type in new_reservations])
+            inventory_days.book_many(hotel_id, [(room_type_ids[room_id], start_date, end_date) for room_id, room_type in new_reservations])
+            inventory_days.occupancy_changed([hotel_id])  # the bulk queries do not send signals
 
-    new_schedule = dict()
-    for res in reservations:
-        q = [r for r in reservations if reservations.index(r) < reservations.index(res) and r.end_date >= res.start_date and r.start_date <= res.start_date]
-        q_ids = [x.id for x in q]
-        taken_rooms = [new_schedule[x] for x in new_schedule if x in q_ids]
+    return SchedulingResult(True, new_rooms)
 
-        # select an available room to put the current reservation there
-        put_res_in_this_room_id = False
-        for id in rooms:
-            if id not in taken_rooms:
-                put_res_in_this_room_id = id
 
-        if not put_res_in_this_room_id:
-            new_reserv.delete()
-            return False    # the reservations cannot fit
+def request_fully_booked(hotel_id, rooms, start_date, end_date):
+    """
+    Checks the daily inventory (see hotels.inventory_days) without locking.
 
-        new_schedule[res.id] = put_res_in_this_room_id
+    Args:
+    hotel_id (int) -> database id of the hotel
+    rooms (dict) -> room type -> number of rooms of that type
+    start_date (date) -> start date
+    end_date (date) -> end date
+
+    Returns: True if some type has fewer free rooms than requested on some
+    of the days (the request cannot be made)
+    """
+    with span('availability'):
+        return any(count and inventory_days.fully_booked(hotel_id, room_type, start_date, end_date, count)
+                   for room_type, count in sorted(rooms.items()))
 
-    # rearrange the reservations
-    for res in reservations:
-        res.room = Room.objects.get(id=new_schedule[res.id])
-        res.save()
 
+def reserve_rooms(hotel_id, rooms, start_date, end_date, user):
+    """
+    Makes the reservations of a request (of the reserve view, or of the
+    booking queue, see hotels.booking_queue).
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    rooms (dict) -> room type -> number of rooms of that type
+    start_date (date) -> start date
+    end_date (date) -> end date
+    user (User object) -> the user making the reservations
+
+    Returns: True if all the reservations are made, False if none is
+
+    Either all reservations of the request succeed or none does: they are
+    made in one transaction, which holds a lock on the rooms of the
+    requested types in this hotel. The free rooms get them one by one
+    (see choose_best_room); if they are not enough, all the rooms are
+    placed together with the previous reservations (see assign_request).
+    """
+    rooms = dict((room_type, count) for room_type, count in rooms.items() if count)
+    if request_fully_booked(hotel_id, rooms, start_date, end_date):
+        return False
+
+    try:
+        with transaction.atomic():
+            with span('availability'):
+                lock_rooms(hotel_id, rooms)
+
+                # free rooms of all requested types, fetched at once
+                free_rooms = get_free_rooms(hotel_id, start_date, end_date, set(rooms))
+
+            if all(len(free_rooms[room_type]) >= count for room_type, count in rooms.items()):
+                # foreach room make a separate reservation
+                for room_type, count in sorted(rooms.items()):
+                    for i in range(count):
+                        free_rooms_of_type = free_rooms[room_type]
+                        with span('scoring'):
+                            best_room_for_this = choose_best_room(free_rooms_of_type, start_date, end_date)
+                        free_rooms_of_type.remove(best_room_for_this)
+                        with span('write-back'):
+                            reservation = Reservation(start_date=start_date, end_date=end_date, user=user, room=best_room_for_this)
+                            reservation.save()
+            else:
+                # the reservations are not possible as the rooms are,
+                # but we try to rearrange the previous ones together
+                # with all the requested rooms and see if they fit
+                with span('scheduling'):
+                    scheduling = assign_request(hotel_id, rooms, start_date, end_date, user)
+                if not scheduling:
+                    raise NotEnoughRooms(", ".join(sorted(rooms)))
+                logger.info("Rearranged %d reservations for %d rooms in hotel %s", scheduling.moved, sum(rooms.values()), hotel_id)
+    except NotEnoughRooms:
+        return False
     return True
+
+
+def _parse_batch_item(item):
+    """
+    Returns: (hotel id, room type, start date, end date) tuple of an item
+    of reserve_batch, or None if it is not valid
+    """
+    try:
+        hotel_id = int(item['hotel'])
+        room_type = item['room_type']
+        start_date = Reservation._meta.get_field('start_date').to_python(item['start_date'])
+        end_date = Reservation._meta.get_field('end_date').to_python(item['end_date'])
+    except (KeyError, TypeError, ValueError, ValidationError):
+        return None
+    if not isinstance(room_type, six.string_types):
+        return None
+    if start_date is None or end_date is None or end_date < start_date:
+        return None
+    return hotel_id, room_type, start_date, end_date
+
+
+def reserve_batch(items, user):
+    """
+    Makes many reservations at once (e.g. the bookings of a partner).
+
+    Args:
+    items (list of dicts) -> the reservations, each one of a room, with keys
+        'hotel' (hotel id), 'room_type', 'start_date' and 'end_date'
+    user (User object) -> the user making the reservations
+
+    Returns: list of results in the order of the items, dicts with
+    'accepted' (bool) and 'room' (room id) or 'reason'
+
+    The items are grouped by hotel and room type and every group is
+    placed with one pass, in one transaction which locks its rooms:
+    - the reservations connected to the items by a chain of overlapping
+      ones are loaded (see overlapping_cluster)
+    - as many items as possible are chosen so that they fit together with
+      them (see scheduling.select_intervals); the others are rejected
+    - the chosen items get rooms moving the fewest previous reservations
+      (see scheduling.min_moves_placement, or scheduling.assign_rooms if
+      that needs too many moves); the reservations of the guests who
+      checked in are never moved, and only the moves are written
+    - the new reservations are inserted with bulk_create and added to
+      the daily inventory at once (see inventory_days.book_many)
+
+    Unlike a sequence of reservations, the batch accepts the most items
+    which fit, not the ones which come first. The items of a group whose
+    previous reservations already conflict with each other are rejected.
+    """
+    results = [None] * len(items)
+    groups = dict()     # (hotel id, room type) -> list of (key, start date, end date)
+    for index, item in enumerate(items):
+        parsed = _parse_batch_item(item) if isinstance(item, dict) else None
+        if parsed is None:
+            results[index] = {'accepted': False, 'reason': 'invalid'}
+            continue
+        hotel_id, room_type, start_date, end_date = parsed
+        # the new reservations are keyed (None, index), apart from the ids of the previous ones
+        groups.setdefault((hotel_id, room_type), []).append(((None, index), start_date, end_date))
+
+    # the groups are locked in a fixed order, like the rooms (see lock_rooms)
+    for (hotel_id, room_type), candidates in sorted(groups.items()):
+        since = min(date.today(), min(start for key, start, end in candidates))
+
+        with transaction.atomic():
+            with span('availability'):
+                rooms = lock_rooms(hotel_id, [room_type])
+                if not rooms:
+                    for (none, index), start, end in candidates:
+                        results[index] = {'accepted': False, 'reason': 'no rooms of that type'}
+                    continue
+
+                first_day = min(start for key, start, end in candidates)
+                last_day = max(end for key, start, end in candidates)
+                reservations = overlapping_cluster(hotel_id, room_type, first_day, last_day, since)
+
+            with span('scheduling'):
+                fixed = [(res_id, max(start, since), end) for res_id, start, end, room_id in reservations]
+                try:
+                    chosen = select_intervals(fixed, candidates, len(rooms))
+                except ValueError:
+                    # the previous reservations already take more rooms than there are
+                    logger.error("Conflicting reservations of %s in hotel %s between %s and %s", room_type, hotel_id, first_day, last_day)
+                    for (none, index), start, end in candidates:
+                        results[index] = {'accepted': False, 'reason': 'conflicting reservations'}
+                    continue
+                accepted = [candidate for candidate in candidates if candidate[0] in chosen]
+
+                # the reservations of the guests who checked in keep their rooms,
+                # the others move only if the accepted items need it
+                pinned = [res for res in reservations if res[1] < since]
+                movable = [res for res in reservations if res[1] >= since]
+                new_schedule = min_moves_placement(pinned, movable, accepted, rooms)
+                if new_schedule is None:
+                    # the chosen items fit (see select_intervals), assign_rooms finds where
+                    new_schedule = assign_rooms(pinned, movable, accepted, rooms)
+
+            with span('write-back'):
+                new_rooms = dict((res_id, new_schedule[res_id]) for res_id, start, end, room_id in movable if new_schedule.get(res_id, room_id) != room_id)
+                move_reservations(new_rooms)
+
+                # bulk_create does not call Reservation.save, which copies these from the room
+                room_type_ids = dict(Room.objects.filter(id__in=rooms).values_list('id', 'type'))
+                Reservation.objects.bulk_create([
+                    Reservation(start_date=start, end_date=end, user=user, room_id=new_schedule[key],
+                                hotel_id=hotel_id, room_type_id=room_type_ids[new_schedule[key]])
+                    for key, start, end in accepted])
+                inventory_days.book_many(hotel_id, [(room_type_ids[new_schedule[key]], start, end) for key, start, end in accepted])
+                if accepted or new_rooms:
+                    inventory_days.occupancy_changed([hotel_id])  # the bulk queries do not send signals
+
+        for key, start, end in candidates:
+            if key in chosen:
+                results[key[1]] = {'accepted': True, 'room': new_schedule[key]}
+            else:
+                results[key[1]] = {'accepted': False, 'reason': 'no free room'}
+
+    return results
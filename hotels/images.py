@@ -0,0 +1,179 @@
+"""
+Processing of the uploaded photos of the hotels.
+
+For every photo resized and compressed variants (see PhotoVariant) are
+made with Pillow: a thumbnail for the album and a medium one for bigger
+screens, each as JPEG and, if Pillow supports it, as WebP. The templates
+serve them instead of the original, with their width and height.
+
+Making the variants takes much longer than a request should, so when a
+photo is uploaded (see hotels.signals) they are made by a pool of worker
+threads (settings.PHOTO_WORKERS, 0 to make them on the spot). Until they
+are ready the templates show the original.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction, DatabaseError
+
+from hotels.models import Photo, PhotoVariant
+from hotels import page_cache
+
+logger = logging.getLogger(__name__)
+
+# longest side of the variants, in pixels
+VARIANT_SIZES = [
+    (PhotoVariant.MEDIUM, 800),
+    (PhotoVariant.THUMBNAIL, 200),
+]
+
+# compression of the variants (1 - 100)
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+# attempts to save the variants of a photo, e.g. while the transaction
+# which added the photo is not committed yet (it is retried after 1, 2, 4... s)
+SAVE_ATTEMPTS = 5
+
+_pool = None
+_pool_lock = threading.Lock()
+_webp = None
+
+
+def webp_supported():
+    """
+    Returns: True if Pillow can save WebP images (it depends on how it was built)
+    """
+    global _webp
+    if _webp is None:
+        try:
+            Image.new('RGB', (1, 1)).save(io.BytesIO(), PhotoVariant.WEBP)
+            _webp = True
+        except (IOError, KeyError):
+            _webp = False
+    return _webp
+
+
+def _encode(image, format):
+    data = io.BytesIO()
+    if format == PhotoVariant.WEBP:
+        image.save(data, format, quality=WEBP_QUALITY)
+    else:
+        image.save(data, format, quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return data.getvalue()
+
+
+def resize(original, formats):
+    """
+    Makes the variants of an image.
+
+    Args:
+    original (file) -> the original image
+    formats (list of strings) -> formats of the variants (PhotoVariant.JPEG, PhotoVariant.WEBP)
+
+    Returns: the size of the original (width, height) and a list of
+    (size, format, encoded image, width, height) tuples for the variants
+
+    The variants are made from the biggest one down, so each resize
+    works on an already smaller image. JPEG originals are also decoded
+    at a reduced scale when they are much bigger than the biggest variant.
+    """
+    image = Image.open(original)
+    original_size = image.size
+    image.draft('RGB', (VARIANT_SIZES[0][1], VARIANT_SIZES[0][1]))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    variants = []
+    for size, longest_side in VARIANT_SIZES:
+        image = image.copy()
+        image.thumbnail((longest_side, longest_side), Image.ANTIALIAS)
+        for format in formats:
+            variants.append((size, format, _encode(image, format), image.size[0], image.size[1]))
+    return original_size, variants
+
+
+def make_variants(photo_id):
+    """
+    Makes the variants of the photo and saves them, replacing the old ones.
+
+    Args:
+    photo_id (int) -> database id of the photo
+
+    Returns: the number of variants made, or None if there is no such photo
+    (e.g. deleted, or not committed yet)
+    """
+    photo = Photo.objects.filter(id=photo_id).first()
+    if photo is None:
+        return None
+
+    formats = [PhotoVariant.JPEG] + ([PhotoVariant.WEBP] if webp_supported() else [])
+    photo.image.open('rb')
+    try:
+        original_size, variants = resize(photo.image, formats)
+    finally:
+        photo.image.close()
+
+    name = os.path.splitext(os.path.basename(photo.image.name))[0]
+    photo_variants = []
+    for size, format, data, width, height in variants:
+        variant = PhotoVariant(photo=photo, size=size, format=format, width=width, height=height)
+        extension = 'webp' if format == PhotoVariant.WEBP else 'jpg'
+        variant.image.save('%s-%s.%s' % (name, variant.get_size_display(), extension), ContentFile(data), save=False)
+        photo_variants.append(variant)
+
+    with transaction.atomic():
+        old_variants = list(PhotoVariant.objects.filter(photo=photo))
+        PhotoVariant.objects.filter(photo=photo).delete()
+        PhotoVariant.objects.bulk_create(photo_variants)
+        Photo.objects.filter(id=photo.id).update(width=original_size[0], height=original_size[1])
+    # the files of the old variants, once nothing refers to them
+    for variant in old_variants:
+        variant.image.delete(save=False)
+    page_cache.invalidate_hotel_content(photo.hotel_id)
+    return len(photo_variants)
+
+
+def _make_variants_in_worker(photo_id):
+    try:
+        for attempt in range(SAVE_ATTEMPTS):
+            try:
+                if make_variants(photo_id) is not None:
+                    return
+            except DatabaseError:
+                logger.warning("Could not save the variants of photo %s, attempt %d", photo_id, attempt + 1, exc_info=True)
+            time.sleep(2 ** attempt)
+        logger.error("Gave up making the variants of photo %s", photo_id)
+    except Exception:
+        logger.exception("Could not make the variants of photo %s", photo_id)
+    finally:
+        connection.close()  # every worker thread has its own connection
+
+
+def process_photo(photo_id):
+    """
+    Makes the variants of the photo in a worker thread,
+    or on the spot if settings.PHOTO_WORKERS is 0.
+    """
+    global _pool
+    workers = getattr(settings, 'PHOTO_WORKERS', 2)
+    if not workers:
+        try:
+            make_variants(photo_id)
+        except Exception:
+            # the photo is saved anyway and shown without variants
+            logger.exception("Could not make the variants of photo %s", photo_id)
+        return
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(workers)
+    _pool.apply_async(_make_variants_in_worker, (photo_id,))
@@ -0,0 +1,210 @@
+"""
+Timing of the requests and of their phases.
+
+InstrumentationMiddleware records for every request the time it took, the
+number of its queries and the time spent in them, and the spans of its
+phases: the code marks them with
+
+    with span('availability'):
+        ...
+
+A span inside another one is named after both, e.g.
+'scheduling/write-back'. Every request is logged as one JSON line
+(logger hotels.instrumentation) and added to per-view histograms kept in
+the memory of the process, see stats() and views.instrumentation_stats.
+
+It is turned on by settings.INSTRUMENTATION. When it is off the middleware
+is not loaded and span() returns a shared object which does nothing, so
+the marked code runs almost as fast as without it.
+
+The queries are counted through connection.queries, which Django fills
+only with the debug cursor, so the debug cursor is used for the time of
+an instrumented request.
+"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the buckets of the histograms
+MS_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+_local = threading.local()
+
+
+class Histogram(object):
+    """
+    Number of values in each of the buckets (the last bucket is of the
+    values above the biggest bound), with their count and sum.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def as_dict(self):
+        buckets = OrderedDict(('<=%s' % bound, count) for bound, count in zip(self.bounds, self.counts))
+        buckets['>%s' % self.bounds[-1]] = self.counts[-1]
+        return OrderedDict([('count', self.count), ('mean', self.total / float(self.count) if self.count else 0), ('buckets', buckets)])
+
+
+class _Recording(object):
+    """What is recorded about the current request."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.first_query = len(connection.queries)
+        self.use_debug_cursor = connection.use_debug_cursor
+        self.view = None
+        self.names = []     # of the spans which are open
+        self.spans = []     # list of (name, ms, queries) tuples
+
+
+class _Span(object):
+    def __init__(self, recording, name):
+        self.recording = recording
+        self.name = name
+
+    def __enter__(self):
+        self.recording.names.append(self.name)
+        self.start = time.time()
+        self.first_query = len(connection.queries)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        name = "/".join(self.recording.names)
+        self.recording.names.pop()
+        self.recording.spans.append((name, 1000 * (time.time() - self.start), len(connection.queries) - self.first_query))
+
+
+class _NoSpan(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+def span(name):
+    """
+    Returns: context manager which records the time and the queries of
+    the code in it as a phase of the current request (when the request
+    is instrumented)
+    """
+    recording = getattr(_local, 'recording', None)
+    if recording is None:
+        return _no_span
+    return _Span(recording, name)
+
+
+class _Stats(object):
+    def __init__(self):
+        self.views = dict()     # view -> dict metric -> Histogram
+        self.spans = dict()     # view -> dict span -> dict metric -> Histogram
+        self.lock = threading.Lock()
+
+    def add(self, view, ms, db_ms, queries, spans):
+        with self.lock:
+            if view not in self.views:
+                self.views[view] = {'ms': Histogram(MS_BUCKETS), 'db_ms': Histogram(MS_BUCKETS), 'queries': Histogram(QUERY_BUCKETS)}
+                self.spans[view] = dict()
+            self.views[view]['ms'].add(ms)
+            self.views[view]['db_ms'].add(db_ms)
+            self.views[view]['queries'].add(queries)
+            for name, span_ms, span_queries in spans:
+                if name not in self.spans[view]:
+                    self.spans[view][name] = {'ms': Histogram(MS_BUCKETS), 'queries': Histogram(QUERY_BUCKETS)}
+                self.spans[view][name]['ms'].add(span_ms)
+                self.spans[view][name]['queries'].add(span_queries)
+
+    def as_dict(self):
+        with self.lock:
+            return dict((view, OrderedDict(
+                [(metric, histogram.as_dict()) for metric, histogram in sorted(self.views[view].items())] +
+                [('spans', dict((name, dict((metric, histogram.as_dict()) for metric, histogram in metrics.items()))
+                                for name, metrics in self.spans[view].items()))]))
+                for view in self.views)
+
+
+_stats = _Stats()
+
+
+def stats():
+    """
+    Returns: dict view -> histograms of the time ('ms'), the time of the
+    queries ('db_ms') and the number of queries ('queries') of its
+    requests, and of the time and queries of their 'spans' by name,
+    in this process
+    """
+    return _stats.as_dict()
+
+
+def reset():
+    """Forgets the histograms of this process."""
+    global _stats
+    _stats = _Stats()
+
+
+class InstrumentationMiddleware(object):
+    """
+    Records the time, the queries and the spans of every request
+    (see the module). Used only when settings.INSTRUMENTATION is True.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'INSTRUMENTATION', False):
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        _local.recording = _Recording()
+        connection.use_debug_cursor = True
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recording = getattr(_local, 'recording', None)
+        if recording is not None:
+            recording.view = '%s.%s' % (view_func.__module__, view_func.__name__)
+
+    def process_response(self, request, response):
+        recording = getattr(_local, 'recording', None)
+        if recording is None:
+            return response
+        _local.recording = None
+
+        ms = 1000 * (time.time() - recording.start)
+        queries = connection.queries[recording.first_query:]
+        db_ms = 1000 * sum(float(query['time']) for query in queries)
+        connection.use_debug_cursor = recording.use_debug_cursor
+
+        view = recording.view or 'unresolved'
+        _stats.add(view, ms, db_ms, len(queries), recording.spans)
+        logger.info(json.dumps(OrderedDict([
+            ('method', request.method),
+            ('path', request.path),
+            ('view', view),
+            ('status', response.status_code),
+            ('ms', round(ms, 2)),
+            ('queries', len(queries)),
+            ('db_ms', round(db_ms, 2)),
+            ('spans', [OrderedDict([('name', name), ('ms', round(span_ms, 2)), ('queries', span_queries)])
+                       for name, span_ms, span_queries in recording.spans]),
+        ])))
+        return response
@@ -0,0 +1,270 @@
+"""
+Bulk import of hotels with their tags and rooms (see the import_inventory
+command).
+
+Every record of the input is a hotel: its name, stars, location, text,
+tags and rooms. The rooms are given as ranges of numbers with a type,
+e.g. "101-160 Double" or "12 Single". In CSV the tags are separated by
+'|' and the room ranges by ';':
+
+    name,stars,location,text,tags,rooms
+    Hilton,5,"Sofia, Bulgaria",Nice,Pool|Spa,101-160 Double;201-210 Suite
+
+In JSON Lines every line is an object with the same keys, the tags and
+the rooms being lists.
+
+The input is read one record at a time and the rooms of a range are made
+only while they are inserted, so the memory used does not depend on the
+size of the input. The rooms are inserted with bulk_create, in chunks,
+and the hotels are written in transactions of about ROOMS_PER_TRANSACTION
+rooms. An invalid record is reported and skipped before anything of it
+is written.
+"""
+
+import csv
+import io
+import json
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction, reset_queries
+from django.utils import six
+
+from hotels.models import Tag, Hotel, RoomType, Room
+from hotels import cache
+
+# rooms written by one INSERT
+ROOMS_PER_INSERT = 1000
+
+# rooms written by one transaction (about, the rooms of a hotel are not split)
+ROOMS_PER_TRANSACTION = 20000
+
+CSV_COLUMNS = ['name', 'stars', 'location', 'text', 'tags', 'rooms']
+
+ROOM_RANGE = re.compile(r'^\s*(\d+)(?:\s*-\s*(\d+))?\s+(\S.*?)\s*$')
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+def parse_room_range(value):
+    """
+    Args:
+    value (string) -> range of rooms, e.g. "101-160 Double" or "12 Single"
+
+    Returns: (first number, last number, room type) tuple
+
+    Raises InvalidRecord if the range is not valid.
+    """
+    match = ROOM_RANGE.match(value)
+    if match is None:
+        raise InvalidRecord("invalid room range %r" % value)
+
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    room_type = match.group(3)
+    if not 1 <= first <= last:
+        raise InvalidRecord("invalid room numbers in %r" % value)
+    if len(room_type) > RoomType._meta.get_field('type').max_length:
+        raise InvalidRecord("too long room type in %r" % value)
+    return first, last, room_type
+
+
+def _csv_rows(input_file):
+    if six.PY2:
+        for row in csv.reader(input_file):
+            yield [cell.decode('utf-8') for cell in row]
+    else:
+        for row in csv.reader(io.TextIOWrapper(input_file, encoding='utf-8', newline='')):
+            yield row
+
+
+def read_records(input_file, format):
+    """
+    Reads the records one at a time.
+
+    Args:
+    input_file (binary file) -> the input
+    format (string) -> 'csv' or 'jsonl'
+
+    Returns: generator of (line number, record or InvalidRecord) tuples,
+    the records being dicts with the keys in CSV_COLUMNS
+    """
+    if format == 'csv':
+        rows = _csv_rows(input_file)
+        header = [column.strip().lower() for column in next(rows, [])]
+        missing = set(CSV_COLUMNS) - set(header)
+        if missing:
+            yield 1, InvalidRecord("missing columns %s" % ", ".join(sorted(missing)))
+            return
+
+        for line, row in enumerate(rows, 2):
+            if not any(row):
+                continue
+            if len(row) != len(header):
+                yield line, InvalidRecord("%d columns instead of %d" % (len(row), len(header)))
+                continue
+            record = dict(zip(header, row))
+            record['tags'] = [tag for tag in record['tags'].split('|') if tag.strip()]
+            record['rooms'] = [rooms for rooms in record['rooms'].split(';') if rooms.strip()]
+            yield line, record
+
+    else:
+        for line, text in enumerate(input_file, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text.decode('utf-8'))
+            except ValueError as error:
+                yield line, InvalidRecord("invalid JSON: %s" % error)
+                continue
+            if not isinstance(record, dict):
+                yield line, InvalidRecord("not an object")
+                continue
+            yield line, record
+
+
+def validate_record(record):
+    """
+    Checks a record before anything of it is written.
+
+    Returns: (Hotel object (not saved), list of tag names, list of room ranges) tuple
+
+    Raises InvalidRecord if the record is not valid.
+    """
+    tags = record.get('tags') or []
+    room_ranges = record.get('rooms') or []
+    if not isinstance(tags, list) or not isinstance(room_ranges, list):
+        raise InvalidRecord("tags and rooms should be lists")
+
+    try:
+        hotel = Hotel(name=record.get('name'), stars=record.get('stars'), location=record.get('location'), text=record.get('text'))
+        hotel.full_clean()
+    except ValidationError as error:
+        raise InvalidRecord("; ".join("%s: %s" % (field, " ".join(messages)) for field, messages in sorted(error.message_dict.items())))
+
+    tags = [tag.strip() for tag in tags]
+    if any(len(tag) > Tag._meta.get_field('tag').max_length for tag in tags):
+        raise InvalidRecord("too long tag")
+
+    room_ranges = sorted(parse_room_range(rooms) for rooms in room_ranges)
+    for previous, current in zip(room_ranges, room_ranges[1:]):
+        if current[0] <= previous[1]:
+            raise InvalidRecord("room %d is in more than one range" % current[0])
+
+    return hotel, tags, room_ranges
+
+
+def _batches(records, report, rooms_per_transaction):
+    """
+    Validates the records and groups the valid ones in batches of about
+    rooms_per_transaction rooms (a batch has at least one hotel).
+    """
+    batch = []
+    batch_rooms = 0
+    for line, record in records:
+        if not isinstance(record, InvalidRecord):
+            try:
+                record = validate_record(record)
+            except InvalidRecord as error:
+                record = error
+        if isinstance(record, InvalidRecord):
+            if report:
+                report(line, record)
+            continue
+
+        batch.append(record)
+        batch_rooms += sum(last - first + 1 for first, last, room_type in record[2])
+        if batch_rooms >= rooms_per_transaction:
+            yield batch
+            batch = []
+            batch_rooms = 0
+    if batch:
+        yield batch
+
+
+class Importer(object):
+    """
+    Writes batches of validated records to the database, each batch in
+    one transaction. The rooms of consecutive hotels are made only while
+    they are inserted, rooms_per_insert at a time.
+    """
+
+    def __init__(self, rooms_per_insert=ROOMS_PER_INSERT):
+        self.rooms_per_insert = rooms_per_insert
+        self.tags = dict()          # name -> id
+        self.room_types = dict()    # name -> id
+        self.hotels = 0
+        self.rooms = 0
+
+    def _tag_id(self, name):
+        # the names are not unique, the first one is used
+        if name not in self.tags:
+            tag = Tag.objects.filter(tag=name).order_by('id').first() or Tag.objects.create(tag=name)
+            self.tags[name] = tag.id
+        return self.tags[name]
+
+    def _room_type_id(self, name):
+        if name not in self.room_types:
+            room_type = RoomType.objects.filter(type=name).order_by('id').first() or RoomType.objects.create(type=name)
+            self.room_types[name] = room_type.id
+        return self.room_types[name]
+
+    def write(self, batch):
+        """
+        Args:
+        batch (list of the results of validate_record) -> the hotels with their tags and rooms
+        """
+        rooms = []
+        with transaction.atomic():
+            for hotel, tags, room_ranges in batch:
+                hotel.save()
+                if tags:
+                    hotel.tags.add(*[self._tag_id(tag) for tag in tags])
+
+                for first, last, room_type in room_ranges:
+                    room_type_id = self._room_type_id(room_type)
+                    for number in range(first, last + 1):
+                        rooms.append(Room(number=number, type_id=room_type_id, hotel_id=hotel.id))
+                        if len(rooms) == self.rooms_per_insert:
+                            Room.objects.bulk_create(rooms)
+                            rooms = []
+            Room.objects.bulk_create(rooms)
+
+        self.hotels += len(batch)
+        self.rooms += sum(last - first + 1 for hotel, tags, room_ranges in batch for first, last, room_type in room_ranges)
+
+        # the rooms are inserted without signals: the hotels are new,
+        # but they might have been cached while still empty
+        for hotel, tags, room_ranges in batch:
+            cache.invalidate_room_types(hotel.id)
+
+        if settings.DEBUG:
+            reset_queries()     # or all the queries are kept in memory
+
+
+def import_inventory(input_file, format, report=None, rooms_per_insert=ROOMS_PER_INSERT, rooms_per_transaction=ROOMS_PER_TRANSACTION):
+    """
+    Imports the hotels in the input.
+
+    Args:
+    input_file (binary file) -> the input
+    format (string) -> 'csv' or 'jsonl'
+    report (function) -> called with (line number, InvalidRecord) for every
+        skipped record and with (importer, seconds since the start) after
+        every transaction (optional)
+    rooms_per_insert (int) -> rooms written by one INSERT
+    rooms_per_transaction (int) -> rooms written by one transaction (about)
+
+    Returns: the Importer, with the numbers of imported hotels and rooms
+    """
+    importer = Importer(rooms_per_insert)
+    start = time.time()
+    for batch in _batches(read_records(input_file, format), report, rooms_per_transaction):
+        importer.write(batch)
+        if report:
+            report(importer, time.time() - start)
+    return importer
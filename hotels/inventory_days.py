@@ -0,0 +1,218 @@
+"""
+Daily inventory of the hotels: for every hotel, room type and day the
+number of reserved rooms and of all rooms (InventoryDay).
+
+A reservation takes a room on all days from its start_date to its
+end_date, both included, like in the scheduling. The rows are made
+for the days with reservations; the days without a row have no room
+reserved.
+
+The rows are updated when the reservations are saved or deleted and the
+totals when the rooms change (see hotels.signals); reservations moved to
+another room of the same type (see helper_views.move_reservations) do
+not change them. The reconcile_inventory command builds them again from
+the reservations.
+
+With them, "are there k rooms of a type left on every day from d1 to d2"
+is one indexed range query instead of an interval overlap join.
+
+Every change of the rooms or the reservations of a hotel also moves its
+Hotel.occupancy_version forward (see occupancy_changed), e.g. for the
+ETags of the availability search and of the calendar. It is written in
+the transaction of the change, so every process sees it together with
+the change, and not at all if the change is rolled back.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction, IntegrityError
+from django.db.models import F, Count, Sum
+
+from hotels.models import Hotel, Room, Reservation, InventoryDay
+
+# rows written by one INSERT or changed by one UPDATE
+DAYS_PER_INSERT = 500
+
+
+def _days(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def _to_date(value):
+    return Reservation._meta.get_field('start_date').to_python(value)
+
+
+def count_days(reservations):
+    """
+    Counts the reserved rooms per day.
+
+    Args:
+    reservations (iterable of (hotel id, room type id, start date, end date) tuples)
+
+    Returns: dict (hotel id, room type id, date) -> number of reservations on that day
+    """
+    booked = dict()
+    for hotel_id, room_type_id, start_date, end_date in reservations:
+        for day in _days(start_date, end_date):
+            key = (hotel_id, room_type_id, day)
+            booked[key] = booked.get(key, 0) + 1
+    return booked
+
+
+def _total(hotel_id, room_type_id):
+    return Room.objects.filter(hotel__id=hotel_id, type__id=room_type_id).count()
+
+
+def book(hotel_id, room_type_id, start_date, end_date, rooms=1):
+    """
+    Adds reserved rooms (or removes them, if rooms is negative)
+    on the days start_date - end_date.
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    room_type_id (int) -> database id of the room type
+    start_date (date) -> first day
+    end_date (date) -> last day
+    rooms (int) -> number of reserved rooms to add
+    """
+    book_many(hotel_id, [(room_type_id, start_date, end_date)], rooms)
+
+
+def book_many(hotel_id, reservations, rooms=1):
+    """
+    Adds (or removes) many reservations of the hotel at once, with one
+    UPDATE for every room type and number of reservations on a day
+    instead of one for every reservation (e.g. for a batch, see
+    helper_views.reserve_batch).
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    reservations (list of (room type id, start date, end date) tuples) -> the reservations
+    rooms (int) -> 1 to add them, -1 to remove them
+    """
+    booked = count_days((hotel_id, room_type_id, _to_date(start_date), _to_date(end_date))
+                        for room_type_id, start_date, end_date in reservations)
+    changes = dict()    # (room type id, rooms on the day) -> list of days
+    for (hotel, room_type_id, day), count in booked.items():
+        changes.setdefault((room_type_id, count * rooms), []).append(day)
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                for (room_type_id, change), days in sorted(changes.items()):
+                    for i in range(0, len(days), DAYS_PER_INSERT):
+                        rows = InventoryDay.objects.filter(hotel__id=hotel_id, room_type__id=room_type_id, date__in=days[i:i + DAYS_PER_INSERT])
+                        existing = set(rows.values_list('date', flat=True))
+                        rows.update(booked=F('booked') + change)
+                        missing = [day for day in days[i:i + DAYS_PER_INSERT] if day not in existing]
+                        if missing and change > 0:
+                            total = _total(hotel_id, room_type_id)
+                            InventoryDay.objects.bulk_create([InventoryDay(hotel_id=hotel_id, room_type_id=room_type_id, date=day, total=total, booked=change)
+                                                              for day in missing])
+            return
+        except IntegrityError:
+            # a concurrent reservation added some of the missing days, try again
+            if attempt:
+                raise
+
+
+def update_totals(hotel_id, room_type_id):
+    """
+    Sets the number of all rooms of the type in the hotel
+    (e.g. after a room is added or removed).
+    """
+    InventoryDay.objects.filter(hotel__id=hotel_id, room_type__id=room_type_id).update(total=_total(hotel_id, room_type_id))
+
+
+def expected_days(hotel_id):
+    """
+    Computes the inventory of the hotel from its reservations and rooms.
+
+    Returns: dict (room type id, date) -> (total, booked)
+    """
+    # through the rooms and not the copies in the reservations,
+    # which are updated after a room is saved (see Room.save)
+    reservations = Reservation.objects.filter(room__hotel__id=hotel_id).values_list('room__hotel', 'room__type', 'start_date', 'end_date')
+    totals = dict()
+    for room_type_id in Room.objects.filter(hotel__id=hotel_id).values_list('type', flat=True):
+        totals[room_type_id] = totals.get(room_type_id, 0) + 1
+    return dict(((room_type_id, day), (totals.get(room_type_id, 0), booked))
+                for (hotel, room_type_id, day), booked in count_days(reservations.iterator()).items())
+
+
+def rebuild(hotel_id):
+    """
+    Builds the inventory of the hotel again from its reservations.
+
+    Returns: the number of written rows
+    """
+    days = sorted(expected_days(hotel_id).items())
+    with transaction.atomic():
+        InventoryDay.objects.filter(hotel__id=hotel_id).delete()
+        for i in range(0, len(days), DAYS_PER_INSERT):
+            InventoryDay.objects.bulk_create([InventoryDay(hotel_id=hotel_id, room_type_id=room_type_id, date=day, total=total, booked=booked)
+                                              for (room_type_id, day), (total, booked) in days[i:i + DAYS_PER_INSERT]])
+    return len(days)
+
+
+def differences(hotel_id):
+    """
+    Compares the inventory of the hotel with its reservations.
+
+    Returns: list of (room type id, date, stored (total, booked), expected (total, booked))
+    tuples for the days which differ; None stands for a missing row
+    """
+    expected = expected_days(hotel_id)
+    stored = dict(((room_type_id, day), (total, booked)) for room_type_id, day, total, booked
+                  in InventoryDay.objects.filter(hotel__id=hotel_id).values_list('room_type', 'date', 'total', 'booked')
+                  if booked)  # the rows left after the reservations on the day are deleted are like missing ones
+    return [(room_type_id, day, stored.get((room_type_id, day)), expected.get((room_type_id, day)))
+            for room_type_id, day in sorted(set(expected) | set(stored))
+            if stored.get((room_type_id, day)) != expected.get((room_type_id, day))]
+
+
+def fully_booked(hotel_id, room_type, start_date, end_date, rooms=1):
+    """
+    Checks if the hotel cannot have rooms more reservations of the type
+    on some of the days start_date - end_date, the days checked by
+    helper_views.get_free_rooms. If so, they cannot be made even by
+    moving the other reservations (see helper_views.interval_scheduling).
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    room_type (string) -> type of the rooms
+    start_date (date) -> start date
+    end_date (date) -> end date
+    rooms (int) -> number of the new reservations
+
+    Returns: True if some day has fewer than rooms free rooms of the type
+    (False means the reservations may be possible)
+    """
+    return InventoryDay.objects.filter(hotel__id=hotel_id, room_type__type=room_type, date__gte=start_date, date__lte=end_date,
+                                       booked__gt=F('total') - rooms).exists()
+
+
+def occupancy_changed(hotel_ids):
+    """
+    Moves forward the occupancy version of the hotels
+    (when their rooms or their reservations change).
+
+    Args:
+    hotel_ids (list of int) -> database ids of the hotels
+    """
+    Hotel.objects.filter(id__in=list(hotel_ids)).update(occupancy_version=F('occupancy_version') + 1)
+
+
+def occupancy_version(hotel_id=None):
+    """
+    Returns: the occupancy version of the hotel, or of all hotels if
+    hotel_id is None (their number and the sum of their versions, which
+    changes with the version of any of them)
+    """
+    if hotel_id is not None:
+        return Hotel.objects.filter(id=hotel_id).values_list('occupancy_version', flat=True).first()
+    versions = Hotel.objects.aggregate(count=Count('id'), sum=Sum('occupancy_version'))
+    return "%s:%s" % (versions['count'], versions['sum'] or 0)
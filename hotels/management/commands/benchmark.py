@@ -0,0 +1,80 @@
+import json
+import random
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hotels.benchmarks import Rollback, generator, scenarios
+
+
+class Command(BaseCommand):
+    args = '[scenario scenario ...]'
+    help = ('Times the hot paths (%s, all by default) on synthetic hotels with reservations (rolled back at the end) '
+            'and reports the latency percentiles and the numbers of queries.' % ", ".join(scenarios.SCENARIOS))
+    option_list = BaseCommand.option_list + (
+        make_option('--hotels', type='int', default=20, help='Number of synthetic hotels (default 20)'),
+        make_option('--types', type='int', default=3, help='Room types in every hotel (default 3)'),
+        make_option('--rooms-per-type', type='int', default=20, help='Rooms of every type in every hotel (default 20)'),
+        make_option('--years', type='int', default=2, help='Years of reservations (default 2)'),
+        make_option('--occupancy', type='float', default=0.7, help='Part of the days on which a room is taken (default 0.7)'),
+        make_option('--runs', type='int', default=100, help='Runs of every scenario (default 100)'),
+        make_option('--seed', type='int', default=0, help='Seed of the random generator'),
+        make_option('--output', help='Write the results to this JSON file'),
+        make_option('--compare', help='Compare the results with the ones in this JSON file'),
+    )
+
+    def handle(self, *args, **options):
+        names = list(args) or list(scenarios.SCENARIOS)
+        unknown = [name for name in names if name not in scenarios.SCENARIOS]
+        if unknown:
+            raise CommandError("Unknown scenarios: %s" % ", ".join(unknown))
+        if not 1 <= options['types'] <= len(generator.ROOM_TYPES):
+            raise CommandError("--types should be between 1 and %d" % len(generator.ROOM_TYPES))
+
+        parameters = dict((name, options[name]) for name in ['hotels', 'types', 'rooms_per_type', 'years', 'occupancy', 'runs', 'seed'])
+        try:
+            with transaction.atomic():
+                results = self.benchmark(random.Random(options['seed']), names, parameters)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        if options['compare']:
+            with open(options['compare']) as previous:
+                self.compare(json.load(previous), results)
+
+    def benchmark(self, rand, names, parameters):
+        data = generator.generate(rand, parameters['hotels'], parameters['types'], parameters['rooms_per_type'],
+                                  parameters['years'], parameters['occupancy'])
+        self.stdout.write("Generated %d hotels, %d rooms and %d reservations (occupancy %.2f) in %.1f s" % (
+            len(data['hotels']), data['rooms'], data['reservations'], data['occupancy'], data['seconds']))
+
+        results = {
+            'parameters': parameters,
+            'data': dict((name, data[name]) for name in ['rooms', 'reservations', 'occupancy']),
+            'scenarios': dict(),
+        }
+        for name in names:
+            result = scenarios.run(name, data, rand, parameters['runs'])
+            results['scenarios'][name] = result
+            self.stdout.write("%-24s %s  queries mean %5.1f max %3d" % (
+                name, "  ".join("%s %7.2f ms" % (key, value) for key, value in result['ms'].items()),
+                result['queries']['mean'], result['queries']['max']))
+        return results
+
+    def compare(self, previous, results):
+        if previous.get('parameters') != results['parameters']:
+            self.stderr.write("The parameters differ from the compared results")
+        for name, result in sorted(results['scenarios'].items()):
+            before = previous.get('scenarios', dict()).get(name)
+            if before is None:
+                continue
+            self.stdout.write("%-24s p50 %+6.1f %%  p95 %+6.1f %%  queries %+.1f" % (
+                name,
+                100.0 * (result['ms']['p50'] - before['ms']['p50']) / before['ms']['p50'] if before['ms']['p50'] else 0,
+                100.0 * (result['ms']['p95'] - before['ms']['p95']) / before['ms']['p95'] if before['ms']['p95'] else 0,
+                result['queries']['mean'] - before['queries']['mean']))
@@ -0,0 +1,73 @@
+import random
+import time
+from datetime import date, timedelta
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hotels.models import Hotel, RoomType, Room, Reservation
+from hotels.helper_views import lock_rooms, get_free_rooms, choose_best_room, interval_scheduling, reserve_batch
+from hotels.benchmarks import Rollback
+
+
+class Command(BaseCommand):
+    help = 'Compares a batch of reservations with making them one by one, on a synthetic hotel (rolled back at the end).'
+    option_list = BaseCommand.option_list + (
+        make_option('--rooms', type='int', default=50, help='Rooms of each type (default 50)'),
+        make_option('--types', type='int', default=2, help='Room types (default 2)'),
+        make_option('--reservations', type='int', default=2000, help='Reservations in the batch (default 2000)'),
+        make_option('--days', type='int', default=365, help='Days over which the reservations are spread (default 365)'),
+        make_option('--seed', type='int', default=0, help='Seed of the random generator'),
+    )
+
+    def handle(self, *args, **options):
+        rand = random.Random(options['seed'])
+        with transaction.atomic():
+            user = User.objects.create(username='benchmark-ingest-%d' % rand.randint(0, 10 ** 9))
+            hotel = Hotel.objects.create(name='Benchmark', stars=3, location='Benchmark', text='!!!')
+            room_types = []
+            for i in range(options['types']):
+                room_type = RoomType.objects.create(type='Benchmark type %d' % i)
+                Room.objects.bulk_create([Room(number=i * options['rooms'] + number + 1, type=room_type, hotel=hotel)
+                                          for number in range(options['rooms'])])
+                room_types.append(room_type.type)
+
+            items = []
+            for i in range(options['reservations']):
+                start_date = date.today() + timedelta(days=rand.randint(1, options['days']))
+                end_date = start_date + timedelta(days=rand.randint(0, 14))
+                items.append({'hotel': hotel.id, 'room_type': rand.choice(room_types), 'start_date': start_date, 'end_date': end_date})
+
+        try:
+            for name, reserve in [('one by one', self.one_by_one), ('batch', reserve_batch)]:
+                try:
+                    with transaction.atomic():
+                        start = time.time()
+                        results = reserve(items, user)
+                        seconds = time.time() - start
+                        accepted = sum(1 for result in results if result['accepted'])
+                        self.stdout.write("%-10s %6.2f s  %5d accepted  %d in the database" % (
+                            name, seconds, accepted, Reservation.objects.filter(hotel=hotel).count()))
+                        raise Rollback()
+                except Rollback:
+                    pass
+        finally:
+            hotel.delete()
+            user.delete()
+
+    def one_by_one(self, items, user):
+        """The reservations as views.reserve makes them, each in its own transaction."""
+        results = []
+        for item in items:
+            with transaction.atomic():
+                lock_rooms(item['hotel'], [item['room_type']])
+                free_rooms = get_free_rooms(item['hotel'], item['start_date'], item['end_date'], [item['room_type']])[item['room_type']]
+                if free_rooms:
+                    room = choose_best_room(free_rooms, item['start_date'], item['end_date'])
+                    Reservation(start_date=item['start_date'], end_date=item['end_date'], user=user, room=room).save()
+                    results.append({'accepted': True})
+                else:
+                    results.append({'accepted': bool(interval_scheduling(item['hotel'], item['room_type'], item['start_date'], item['end_date'], user))})
+        return results
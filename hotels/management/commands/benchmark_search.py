@@ -0,0 +1,69 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hotels.models import Hotel
+from hotels import search
+from hotels.benchmarks import Rollback
+from hotels.benchmarks.generator import synthetic_hotel
+
+
+class Command(BaseCommand):
+    help = 'Compares the search index with icontains scans on synthetic hotels (they are rolled back at the end).'
+    option_list = BaseCommand.option_list + (
+        make_option('--hotels', type='int', default=100000, help='Number of synthetic hotels (default 100000)'),
+        make_option('--queries', type='int', default=200, help='Number of searches of each kind (default 200)'),
+        make_option('--seed', type='int', default=0, help='Seed of the random generator'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(random.Random(options['seed']), options['hotels'], options['queries'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def benchmark(self, rand, hotels_count, queries_count):
+        first_id = (Hotel.objects.order_by('-id').values_list('id', flat=True)[:1] or [0])[0] + 1
+
+        start = time.time()
+        hotels = []
+        for i in range(hotels_count):
+            hotels.append(synthetic_hotel(rand))
+            if len(hotels) == 1000:
+                Hotel.objects.bulk_create(hotels)
+                hotels = []
+        Hotel.objects.bulk_create(hotels)
+        search.index_hotels(Hotel.objects.filter(id__gte=first_id))
+        self.stdout.write("Generated and indexed %d hotels in %.1f s" % (hotels_count, time.time() - start))
+
+        samples = list(Hotel.objects.filter(id__gte=first_id).values_list('name', 'location')[:1000])
+        for field in ['name', 'location']:
+            queries = []
+            for i in range(queries_count):
+                value = rand.choice(samples)[0 if field == 'name' else 1]
+                length = rand.randint(3, 8)
+                offset = rand.randint(0, max(len(value) - length, 0))
+                queries.append(value[offset:offset + length])
+
+            timings = dict(icontains=[], index=[])
+            for query in queries:
+                start = time.time()
+                expected = set(Hotel.objects.filter(**{field + '__icontains': query}).values_list('id', flat=True))
+                timings['icontains'].append(time.time() - start)
+
+                start = time.time()
+                found = set(search.search_hotels(Hotel.objects.all(), **{field: query}).values_list('id', flat=True))
+                timings['index'].append(time.time() - start)
+
+                if found != expected:
+                    self.stderr.write("Different results for %s %r" % (field, query))
+
+            for kind in ['icontains', 'index']:
+                times = sorted(timings[kind])
+                self.stdout.write("%-8s %-9s mean %7.2f ms  median %7.2f ms  p95 %7.2f ms" % (
+                    field, kind, 1000 * sum(times) / len(times), 1000 * times[len(times) // 2], 1000 * times[int(len(times) * 0.95)]))
@@ -0,0 +1,81 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from hotels.models import Hotel, Tag
+from hotels import search
+from hotels.benchmarks import Rollback
+
+
+class Command(BaseCommand):
+    help = 'Compares the tag filters with joins on synthetic hotels with many tags (they are rolled back at the end).'
+    option_list = BaseCommand.option_list + (
+        make_option('--hotels', type='int', default=20000, help='Number of synthetic hotels (default 20000)'),
+        make_option('--tags', type='int', default=60, help='Number of synthetic tags (default 60)'),
+        make_option('--tags-per-hotel', type='int', default=20, help='Number of tags of every hotel (default 20)'),
+        make_option('--queries', type='int', default=100, help='Number of searches of each kind (default 100)'),
+        make_option('--seed', type='int', default=0, help='Seed of the random generator'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(random.Random(options['seed']), options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def distinct_joins(self, hotels, tags, match):
+        """The filters with DISTINCT: one join per tag (all) or one join with all of the tags (any)."""
+        if match == search.MATCH_ANY_TAG:
+            return hotels.filter(tags__in=tags).distinct()
+        for tag in tags:
+            hotels = hotels.filter(tags=tag)
+        return hotels.distinct()
+
+    def benchmark(self, rand, options):
+        first_id = (Hotel.objects.order_by('-id').values_list('id', flat=True)[:1] or [0])[0] + 1
+
+        start = time.time()
+        tags = []
+        for i in range(options['tags']):
+            tag = Tag(tag='Synthetic tag %d' % i)
+            tag.save()
+            tags.append(tag.id)
+
+        Hotel.objects.bulk_create([Hotel(name='Hotel %d' % i, stars=rand.randint(1, 5), location='Location %d' % i, text='!!!')
+                                   for i in range(options['hotels'])])
+        hotel_tags = []
+        for hotel_id in Hotel.objects.filter(id__gte=first_id).values_list('id', flat=True):
+            # a skewed distribution, so some tags are much more common than others
+            hotel_tag_ids = set()
+            while len(hotel_tag_ids) < min(options['tags_per_hotel'], len(tags)):
+                hotel_tag_ids.add(tags[min(int(rand.expovariate(3.0 / len(tags))), len(tags) - 1)])
+            hotel_tags += [Hotel.tags.through(hotel_id=hotel_id, tag_id=tag_id) for tag_id in hotel_tag_ids]
+        Hotel.tags.through.objects.bulk_create(hotel_tags, batch_size=500)
+        self.stdout.write("Generated %d hotels with %d tags in %.1f s" % (options['hotels'], len(hotel_tags), time.time() - start))
+
+        for match in [search.MATCH_ALL_TAGS, search.MATCH_ANY_TAG]:
+            timings = dict(distinct=[], filter=[])
+            for i in range(options['queries']):
+                query_tags = rand.sample(tags, rand.randint(1, 4))
+                hotels = Hotel.objects.filter(stars__gte=rand.randint(1, 5))
+
+                start = time.time()
+                expected = set(self.distinct_joins(hotels, query_tags, match).values_list('id', flat=True))
+                timings['distinct'].append(time.time() - start)
+
+                start = time.time()
+                found = set(search.filter_by_tags(hotels, query_tags, match).values_list('id', flat=True))
+                timings['filter'].append(time.time() - start)
+
+                if found != expected:
+                    self.stderr.write("Different results for %s of %r" % (match, query_tags))
+
+            for kind in ['distinct', 'filter']:
+                times = sorted(timings[kind])
+                self.stdout.write("%-4s %-8s mean %7.2f ms  median %7.2f ms  p95 %7.2f ms" % (
+                    match, kind, 1000 * sum(times) / len(times), 1000 * times[len(times) // 2], 1000 * times[int(len(times) * 0.95)]))
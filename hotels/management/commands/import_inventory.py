@@ -0,0 +1,47 @@
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hotels import inventory
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Imports hotels with their tags and rooms from a CSV or JSON Lines file ("-" for the standard input).'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=['csv', 'jsonl'], help='Format of the file (by default from its extension)'),
+        make_option('--rooms-per-insert', type='int', default=inventory.ROOMS_PER_INSERT, help='Rooms written by one INSERT'),
+        make_option('--rooms-per-transaction', type='int', default=inventory.ROOMS_PER_TRANSACTION, help='Rooms written by one transaction'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give the file to import")
+        path = args[0]
+
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in ['csv', 'jsonl']:
+            raise CommandError("Unknown format %r, use --format" % file_format)
+
+        self.skipped = 0
+        input_file = getattr(sys.stdin, 'buffer', sys.stdin) if path == '-' else open(path, 'rb')
+        try:
+            importer = inventory.import_inventory(input_file, file_format, self.report,
+                                                  options['rooms_per_insert'], options['rooms_per_transaction'])
+        finally:
+            if path != '-':
+                input_file.close()
+
+        self.stdout.write("Imported %d hotels and %d rooms, skipped %d records" % (importer.hotels, importer.rooms, self.skipped))
+
+    def report(self, *progress):
+        if isinstance(progress[1], inventory.InvalidRecord):
+            line, error = progress
+            self.skipped += 1
+            self.stderr.write("Line %d skipped: %s" % (line, error))
+        else:
+            importer, seconds = progress
+            self.stdout.write("%d hotels, %d rooms in %.1f s (%d rooms/s)" % (
+                importer.hotels, importer.rooms, seconds, importer.rooms / max(seconds, 0.001)))
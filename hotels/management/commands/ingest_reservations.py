@@ -0,0 +1,62 @@
+import json
+import sys
+import time
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from hotels.helper_views import reserve_batch
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ('Makes the reservations in a JSON Lines file ("-" for the standard input), each line being '
+            '{"hotel": id, "room_type": type, "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}. '
+            'Writes the result of every line as JSON Lines.')
+    option_list = BaseCommand.option_list + (
+        make_option('--user', help='Username of the owner of the reservations'),
+        make_option('--batch-size', type='int', default=10000, help='Reservations placed together (default 10000)'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give the file with the reservations")
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError("Unknown user %r, use --user" % options['user'])
+
+        input_file = sys.stdin if args[0] == '-' else open(args[0], 'rb')
+        start = time.time()
+        total = accepted = 0
+        try:
+            batch = []
+            for line, text in enumerate(input_file, 1):
+                if text.strip():
+                    batch.append((line, text))
+                if len(batch) == options['batch_size']:
+                    accepted += self.ingest(batch, user)
+                    total += len(batch)
+                    batch = []
+            accepted += self.ingest(batch, user)
+            total += len(batch)
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+
+        self.stderr.write("%d of %d reservations accepted in %.1f s" % (accepted, total, time.time() - start))
+
+    def ingest(self, batch, user):
+        items = []
+        for line, text in batch:
+            try:
+                items.append(json.loads(text.decode('utf-8') if isinstance(text, bytes) else text))
+            except ValueError:
+                items.append(None)  # rejected as invalid
+
+        results = reserve_batch(items, user)
+        for (line, text), result in zip(batch, results):
+            result['line'] = line
+            self.stdout.write(json.dumps(result, sort_keys=True))
+        return sum(1 for result in results if result['accepted'])
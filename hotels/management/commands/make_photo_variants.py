@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hotels.models import Photo
+from hotels import images
+
+
+class Command(BaseCommand):
+    help = 'Makes the resized variants of the photos which have none (of all photos with --all).'
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', default=False, help='Make the variants of all photos again'),
+    )
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.all()
+        if not options['all']:
+            photos = photos.filter(photovariant__isnull=True)
+
+        made = 0
+        for photo_id in photos.values_list('id', flat=True).distinct():
+            try:
+                made += images.make_variants(photo_id) or 0
+            except (IOError, ValueError) as error:
+                self.stderr.write("Photo %s: %s" % (photo_id, error))
+        self.stdout.write("Made %d photo variants" % made)
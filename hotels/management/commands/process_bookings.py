@@ -0,0 +1,38 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+
+from hotels.models import BookingRequest
+from hotels import booking_queue
+
+
+class Command(BaseCommand):
+    args = '[hotel_id hotel_id ...]'
+    help = ('Makes the queued reservation requests of the given hotels (all hotels with requests by default), '
+            'one after another (see hotels/booking_queue.py). Run one worker for every hotel or group of hotels.')
+    option_list = BaseCommand.option_list + (
+        make_option('--batch', type='int', default=booking_queue.BATCH_SIZE, help='Requests of a hotel claimed at once (default %d)' % booking_queue.BATCH_SIZE),
+        make_option('--sleep', type='float', default=1.0, help='Seconds to wait when there are no requests (default 1)'),
+        make_option('--once', action='store_true', default=False, help='Stop when there are no requests, instead of waiting for more'),
+    )
+
+    def handle(self, *args, **options):
+        worker = booking_queue.worker_name()
+        processed = 0
+
+        while True:
+            hotel_ids = [int(hotel_id) for hotel_id in args] or \
+                sorted(set(BookingRequest.objects.filter(status=BookingRequest.PENDING).values_list('hotel', flat=True)))
+            round_processed = 0
+            for hotel_id in hotel_ids:
+                booking_queue.requeue_stale(hotel_id)
+                round_processed += booking_queue.process_batch(hotel_id, worker, options['batch'])
+            processed += round_processed
+
+            if not round_processed:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write("Processed %d booking requests" % processed)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from hotels.models import Hotel
+from hotels import search
+
+
+class Command(BaseCommand):
+    help = 'Writes again the search index of all hotels.'
+
+    def handle(self, *args, **options):
+        indexed = search.index_hotels(Hotel.objects.all())
+        self.stdout.write("Indexed %d hotels" % indexed)
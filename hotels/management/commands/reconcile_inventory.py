@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hotels.models import Hotel
+from hotels import inventory_days
+
+
+class Command(BaseCommand):
+    args = '[hotel_id hotel_id ...]'
+    help = 'Builds the daily inventory of the given hotels (all hotels by default) again from their reservations.'
+    option_list = BaseCommand.option_list + (
+        make_option('--check', action='store_true', default=False, help='Only report the days which differ, without writing'),
+    )
+
+    def handle(self, *args, **options):
+        hotel_ids = [int(hotel_id) for hotel_id in args] or Hotel.objects.values_list('id', flat=True)
+
+        for hotel_id in hotel_ids:
+            if options['check']:
+                differences = inventory_days.differences(hotel_id)
+                for room_type_id, day, stored, expected in differences:
+                    self.stdout.write("Hotel %d, room type %d, %s: %s instead of %s (total, booked)" % (hotel_id, room_type_id, day, stored, expected))
+                self.stdout.write("Hotel %d: %d days differ" % (hotel_id, len(differences)))
+            else:
+                self.stdout.write("Hotel %d: %d days" % (hotel_id, inventory_days.rebuild(hotel_id)))
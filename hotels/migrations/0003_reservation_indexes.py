@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'Reservation.hotel'
+        db.add_column(u'hotels_reservation', 'hotel',
+                      self.gf('django.db.models.fields.related.ForeignKey')(to=orm['hotels.Hotel'], null=True, db_index=False),
+                      keep_default=False)
+
+        # Adding field 'Reservation.room_type'
+        db.add_column(u'hotels_reservation', 'room_type',
+                      self.gf('django.db.models.fields.related.ForeignKey')(to=orm['hotels.RoomType'], null=True),
+                      keep_default=False)
+
+        # Copying the hotel and the type of the room to the reservations
+        db.execute("UPDATE hotels_reservation SET "
+                   "hotel_id = (SELECT hotel_id FROM hotels_room WHERE hotels_room.id = hotels_reservation.room_id), "
+                   "room_type_id = (SELECT type_id FROM hotels_room WHERE hotels_room.id = hotels_reservation.room_id)")
+
+        # Changing field 'Reservation.hotel'
+        db.alter_column(u'hotels_reservation', 'hotel_id', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['hotels.Hotel'], db_index=False))
+
+        # Changing field 'Reservation.room_type'
+        db.alter_column(u'hotels_reservation', 'room_type_id', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['hotels.RoomType']))
+
+        # Adding index on 'Reservation', fields ['hotel', 'room_type', 'start_date', 'end_date']
+        db.create_index(u'hotels_reservation', ['hotel_id', 'room_type_id', 'start_date', 'end_date'])
+
+        # Adding index on 'Reservation', fields ['room', 'start_date', 'end_date']
+        db.create_index(u'hotels_reservation', ['room_id', 'start_date', 'end_date'])
+
+        # Adding index on 'Hotel', fields ['name']
+        db.create_index(u'hotels_hotel', ['name'])
+
+        # Adding index on 'Hotel', fields ['stars']
+        db.create_index(u'hotels_hotel', ['stars'])
+
+        # Adding index on 'Hotel', fields ['location']
+        db.create_index(u'hotels_hotel', ['location'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'Hotel', fields ['location']
+        db.delete_index(u'hotels_hotel', ['location'])
+
+        # Removing index on 'Hotel', fields ['stars']
+        db.delete_index(u'hotels_hotel', ['stars'])
+
+        # Removing index on 'Hotel', fields ['name']
+        db.delete_index(u'hotels_hotel', ['name'])
+
+        # Removing index on 'Reservation', fields ['room', 'start_date', 'end_date']
+        db.delete_index(u'hotels_reservation', ['room_id', 'start_date', 'end_date'])
+
+        # Removing index on 'Reservation', fields ['hotel', 'room_type', 'start_date', 'end_date']
+        db.delete_index(u'hotels_reservation', ['hotel_id', 'room_type_id', 'start_date', 'end_date'])
+
+        # Deleting field 'Reservation.hotel'
+        db.delete_column(u'hotels_reservation', 'hotel_id')
+
+        # Deleting field 'Reservation.room_type'
+        db.delete_column(u'hotels_reservation', 'room_type_id')
+
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'hotels.hotel': {
+            'Meta': {'object_name': 'Hotel'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'location': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '25', 'db_index': 'True'}),
+            'stars': ('django.db.models.fields.IntegerField', [], {'db_index': 'True'}),
+            'tags': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['hotels.Tag']", 'symmetrical': 'False'}),
+            'text': ('django.db.models.fields.CharField', [], {'max_length': '150'})
+        },
+        u'hotels.photo': {
+            'Meta': {'object_name': 'Photo'},
+            'hotel': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hotels.Hotel']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image': ('django.db.models.fields.files.ImageField', [], {'max_length': '100'})
+        },
+        u'hotels.reservation': {
+            'Meta': {'object_name': 'Reservation', 'index_together': "[['hotel', 'room_type', 'start_date', 'end_date'], ['room', 'start_date', 'end_date']]"},
+            'end_date': ('django.db.models.fields.DateField', [], {}),
+            'hotel': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hotels.Hotel']", 'db_index': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'room': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hotels.Room']"}),
+            'room_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hotels.RoomType']"}),
+            'start_date': ('django.db.models.fields.DateField', [], {}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']"})
+        },
+        u'hotels.room': {
+            'Meta': {'unique_together': "(('number', 'hotel'),)", 'object_name': 'Room'},
+            'hotel': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hotels.Hotel']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'number': ('django.db.models.fields.IntegerField', [], {}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['hotels.RoomType']"})
+        },
+        u'hotels.roomtype': {
+            'Meta': {'object_name': 'RoomType'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '30'})
+        },
+        u'hotels.tag': {
+            'Meta': {'object_name': 'Tag'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'tag': ('django.db.models.fields.CharField', [], {'max_length': '30'})
+        }
+    }
+
+    complete_apps = ['hotels']
\ No newline at end of file
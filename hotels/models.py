@@ -11,11 +11,14 @@ class Tag(models.Model):
 
 
 class Hotel(models.Model):
-    name = models.CharField(max_length=25)
-    stars = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
-    location = models.CharField(max_length=50)
+    name = models.CharField(max_length=25, db_index=True)
+    stars = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)], db_index=True)
+    location = models.CharField(max_length=50, db_index=True)
     text = models.CharField(max_length=150)
     tags = models.ManyToManyField(Tag)
+    # moves forward whenever the rooms or the reservations of the hotel change,
+    # in the same transaction (see inventory_days.occupancy_changed)
+    occupancy_version = models.IntegerField(default=0, editable=False)
     
     def __str__(self):
         return "{0} ({1} stars) - {2}".format(self.name, self.stars, self.location)
@@ -24,9 +27,73 @@ class Hotel(models.Model):
         return "/hotels/hotel-info/%i/" % self.id
 
 
+class HotelSearchTerm(models.Model):
+    """
+    Inverted index of the hotels for the search (see hotels/search.py):
+    the trigrams of the name and the location and the words of the text.
+    """
+    NAME, LOCATION, TEXT = 'n', 'l', 't'
+
+    hotel = models.ForeignKey(Hotel)
+    field = models.CharField(max_length=1)
+    term = models.CharField(max_length=30)
+
+    class Meta:
+        index_together = [["field", "term", "hotel"]]
+
+
 class Photo(models.Model):
     image = models.ImageField(upload_to='static/images/hotels/')
     hotel = models.ForeignKey(Hotel)
+    # size of the original, known after its variants are made (see hotels/images.py)
+    width = models.IntegerField(null=True, blank=True)
+    height = models.IntegerField(null=True, blank=True)
+
+    def _variant(self, size, format):
+        # from the prefetched variants, if any
+        for variant in self.photovariant_set.all():
+            if variant.size == size and variant.format == format:
+                return variant
+        return None
+
+    @property
+    def thumbnail(self):
+        return self._variant(PhotoVariant.THUMBNAIL, PhotoVariant.JPEG)
+
+    @property
+    def thumbnail_webp(self):
+        return self._variant(PhotoVariant.THUMBNAIL, PhotoVariant.WEBP)
+
+    @property
+    def medium(self):
+        return self._variant(PhotoVariant.MEDIUM, PhotoVariant.JPEG)
+
+    @property
+    def medium_webp(self):
+        return self._variant(PhotoVariant.MEDIUM, PhotoVariant.WEBP)
+
+
+class PhotoVariant(models.Model):
+    """
+    Resized and compressed copy of a photo, served instead of the original.
+    """
+    THUMBNAIL = 't'
+    MEDIUM = 'm'
+    SIZES = ((THUMBNAIL, 'thumbnail'), (MEDIUM, 'medium'))
+
+    JPEG = 'JPEG'
+    WEBP = 'WEBP'
+    FORMATS = ((JPEG, 'JPEG'), (WEBP, 'WebP'))
+
+    photo = models.ForeignKey(Photo)
+    size = models.CharField(max_length=1, choices=SIZES)
+    format = models.CharField(max_length=4, choices=FORMATS)
+    image = models.ImageField(upload_to='static/images/hotels/variants/')
+    width = models.IntegerField()
+    height = models.IntegerField()
+
+    def __str__(self):
+        return "{0} {1} {2}x{3}".format(self.get_size_display(), self.format, self.width, self.height)
 
 
 class RoomType(models.Model):
@@ -44,6 +111,11 @@ class Room(models.Model):
     def __str__(self):
         return "{0}, {1} @ {2}".format(self.number, self.type.type, self.hotel.name)
     
+    def save(self, *args, **kwargs):
+        super(Room, self).save(*args, **kwargs)
+        # keep the copies in the reservations of the room up to date
+        Reservation.objects.filter(room=self).exclude(hotel=self.hotel_id, room_type=self.type_id).update(hotel=self.hotel_id, room_type=self.type_id)
+
     class Meta:
         unique_together = ("number", "hotel")
 
@@ -53,7 +125,79 @@ class Reservation(models.Model):
 	end_date = models.DateField()
 	user = models.ForeignKey(User)
 	room = models.ForeignKey(Room)
+	# copies of room.hotel and room.type (set on save, so not in the forms),
+	# so that the availability queries do not join Room;
+	# hotel is indexed by the first index in Meta.index_together
+	hotel = models.ForeignKey(Hotel, db_index=False, editable=False)
+	room_type = models.ForeignKey(RoomType, editable=False)
 	
 	def __str__(self):
 	    return "{0} - from {1} to {2} in {3}".format(self.user, self.start_date, self.end_date, self.room)
+	
+	def save(self, *args, **kwargs):
+	    room = self.room
+	    if room.id != self.room_id:     # room_id was changed directly
+	        room = Room.objects.get(id=self.room_id)
+	    self.hotel_id = room.hotel_id
+	    self.room_type_id = room.type_id
+	    super(Reservation, self).save(*args, **kwargs)
+	
+	class Meta:
+	    index_together = [
+	        ["hotel", "room_type", "start_date", "end_date"],
+	        ["room", "start_date", "end_date"],
+	    ]
+
+
+class InventoryDay(models.Model):
+    """
+    Number of the reserved rooms (booked) and of all rooms (total) of a
+    type in a hotel on a day, kept up to date from the reservations
+    (see hotels/inventory_days.py). Days without reservations have no row.
+    """
+    hotel = models.ForeignKey(Hotel, db_index=False)
+    room_type = models.ForeignKey(RoomType)
+    date = models.DateField()
+    total = models.IntegerField()
+    booked = models.IntegerField()
+
+    class Meta:
+        unique_together = ("hotel", "room_type", "date")
+
+
+class BookingRequest(models.Model):
+    """
+    Reservation request waiting for a worker of its hotel, when
+    settings.BOOKING_QUEUE is on (see hotels/booking_queue.py).
+    rooms is a JSON object room type -> number of rooms.
+    """
+    PENDING = 'p'
+    PROCESSING = 'w'
+    DONE = 'd'
+    FAILED = 'f'
+    STATUSES = ((PENDING, 'pending'), (PROCESSING, 'processing'), (DONE, 'done'), (FAILED, 'failed'))
+
+    hotel = models.ForeignKey(Hotel, db_index=False)
+    user = models.ForeignKey(User)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    rooms = models.TextField()
+    status = models.CharField(max_length=1, choices=STATUSES, default=PENDING)
+    # the worker which claimed the request and when
+    worker = models.CharField(max_length=50, blank=True)
+    claimed = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{0} - {1} from {2} to {3} in hotel {4}".format(self.get_status_display(), self.rooms, self.start_date, self.end_date, self.hotel_id)
+
+    class Meta:
+        # hotel is indexed by the first index
+        index_together = [
+            ["hotel", "status", "id"],
+            ["worker", "status"],
+        ]
+
 
+# connect the signal handlers
+from hotels import signals
@@ -0,0 +1,150 @@
+"""
+Cache of the read-heavy hotel pages: the rendered content of hotel_info
+and the hotels on the pages of the unfiltered index.
+
+The entries are stored in the cache settings.PAGE_CACHE. Their keys
+contain a generation number, so a whole group of entries is invalidated
+at once by moving its generation forward, without knowing their keys:
+- the listing generation, of the pages of the index
+- the hotels generation, of the content of all hotel pages
+The content of one hotel is invalidated by deleting its key.
+
+The signals in hotels.signals invalidate the entries when a hotel, its
+photos or its tags change. Hits and misses are counted in the cache too,
+see stats().
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+LISTING = 'listing'
+HOTELS = 'hotels'
+
+# seconds before a cached page is built again
+PAGE_CACHE_TIMEOUT = 10 * 60
+
+
+def _cache():
+    return get_cache(getattr(settings, 'PAGE_CACHE', 'default'))
+
+
+def _generations(cache, names):
+    """
+    Returns: dict name -> current generation
+
+    A generation missing from the cache (e.g. evicted) starts from the
+    current time, so it never goes back to a number used before.
+    """
+    keys = ['pages:generation:%s' % name for name in names]
+    found = cache.get_many(keys)
+    generations = dict()
+    for name, key in zip(names, keys):
+        if key not in found:
+            cache.add(key, int(time.time() * 1000), None)
+            found[key] = cache.get(key)
+        generations[name] = found[key]
+    return generations
+
+
+def _next_generation(cache, name):
+    key = 'pages:generation:%s' % name
+    try:
+        cache.incr(key)
+    except ValueError:  # not in the cache
+        cache.add(key, int(time.time() * 1000), None)
+
+
+def _count(cache, name, hit):
+    key = 'pages:%s:%s' % ('hits' if hit else 'misses', name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def _cached(name, key, compute):
+    cache = _cache()
+    value = cache.get(key)
+    _count(cache, name, value is not None)
+    if value is None:
+        value = compute()
+        cache.set(key, value, PAGE_CACHE_TIMEOUT)
+    return value
+
+
+def _hotel_key(cache, hotel_id):
+    return 'pages:hotel:%s:%s' % (_generations(cache, [HOTELS])[HOTELS], hotel_id)
+
+
+def listing_page(page_num, after, compute):
+    """
+    Returns the hotels on a page of the unfiltered index from the cache,
+    or calls compute and stores its result.
+
+    Args:
+    page_num (int) -> number of the page
+    after (int) -> id of the last hotel before the page in keyset mode, or None
+    compute (function) -> returns the hotels on the page (picklable)
+    """
+    key = 'pages:listing:%s:%s:%s' % (_generations(_cache(), [LISTING])[LISTING], page_num, after)
+    return _cached(LISTING, key, compute)
+
+
+def hotel_content(hotel_id, compute):
+    """
+    Returns the rendered content of the page of a hotel from the cache,
+    or calls compute and stores its result.
+
+    Args:
+    hotel_id (int) -> database id of the hotel
+    compute (function) -> renders the content (a string)
+    """
+    return _cached(HOTELS, _hotel_key(_cache(), hotel_id), compute)
+
+
+def listing_generation():
+    """
+    Returns: the generation of the pages of the index, which changes
+    whenever a hotel or its tags change
+    """
+    return _generations(_cache(), [LISTING])[LISTING]
+
+
+def invalidate_hotel(hotel_id):
+    """
+    Invalidates the page of the hotel and the pages of the index
+    (e.g. when the hotel or its tags change).
+    """
+    cache = _cache()
+    cache.delete(_hotel_key(cache, hotel_id))
+    _next_generation(cache, LISTING)
+
+
+def invalidate_hotel_content(hotel_id):
+    """
+    Invalidates only the page of the hotel (e.g. when its photos change).
+    """
+    cache = _cache()
+    cache.delete(_hotel_key(cache, hotel_id))
+
+
+def invalidate_all():
+    """
+    Invalidates the pages of all hotels and of the index
+    (e.g. when a tag, which can be in any hotel, changes).
+    """
+    cache = _cache()
+    _next_generation(cache, HOTELS)
+    _next_generation(cache, LISTING)
+
+
+def stats():
+    """
+    Returns: dict name -> {'hits': int, 'misses': int} for the listing and the hotels
+    """
+    cache = _cache()
+    counters = cache.get_many(['pages:%s:%s' % (kind, name) for kind in ['hits', 'misses'] for name in [LISTING, HOTELS]])
+    return dict((name, dict((kind, counters.get('pages:%s:%s' % (kind, name), 0)) for kind in ['hits', 'misses']))
+                for name in [LISTING, HOTELS])
@@ -0,0 +1,89 @@
+"""
+Calendar of the free rooms of a hotel: for every room type and every day
+of a window the number of rooms which are free on that day (see
+views.calendar).
+
+The reservations of the hotel which touch the window are loaded with one
+query, their days counted by the database from the first day of the
+window (see DAYS_FROM_SQL), and put in a room x day matrix with NumPy: every reservation adds
+1 on its first day and -1 after its last day of its row (a difference
+array), and the cumulative sum along the days gives the number of
+reservations of the room on every day. A room is free on a day when it
+has none; the free rooms are then summed per type.
+
+A reservation takes its room on all days from its start_date to its
+end_date, both included, like in the scheduling and hotels.inventory_days.
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy
+from django.db import connection
+
+from hotels.models import Room, Reservation
+
+# the window of a calendar, in days: by default and the longest one
+CALENDAR_DAYS = 90
+MAX_CALENDAR_DAYS = 366
+
+# SQL for the number of days from the first day of the window to a date,
+# so that the database sends numbers instead of dates to parse
+DAYS_FROM_SQL = {
+    'sqlite': "CAST(julianday(%s) - julianday(%%s) AS INTEGER)",
+    'mysql': "DATEDIFF(%s, %%s)",
+    'postgresql': "(%s - %%s::date)",
+}
+
+
+def _reservation_days(hotel_id, first_day, last_day):
+    """
+    Returns: list of (room id, first day, last day) tuples of the reservations
+    of the hotel which touch the window, the days counted from first_day
+    """
+    reservations = Reservation.objects.filter(hotel__id=hotel_id, start_date__lte=last_day, end_date__gte=first_day)
+    days_from = DAYS_FROM_SQL.get(connection.vendor)
+    if days_from is None:
+        return [(room_id, (start_date - first_day).days, (end_date - first_day).days)
+                for room_id, start_date, end_date in reservations.values_list('room', 'start_date', 'end_date')]
+
+    first_day = connection.ops.value_to_db_date(first_day)
+    reservations = reservations.extra(select=OrderedDict([('start_day', days_from % 'start_date'), ('end_day', days_from % 'end_date')]),
+                                      select_params=[first_day, first_day])
+    return list(reservations.values_list('room', 'start_day', 'end_day'))
+
+
+def free_rooms_by_day(hotel_id, first_day, days):
+    """
+    Args:
+    hotel_id (int) -> database id of the hotel
+    first_day (date) -> first day of the window
+    days (int) -> number of days in the window
+
+    Returns: dict room type -> (number of rooms, list of the numbers of free
+    rooms on every day of the window)
+    """
+    rooms = list(Room.objects.filter(hotel__id=hotel_id).order_by('id').values_list('id', 'type__type'))
+    if not rooms:
+        return dict()
+    reservations = _reservation_days(hotel_id, first_day, first_day + timedelta(days=days - 1))
+
+    changes = numpy.zeros((len(rooms), days + 1), dtype=numpy.int32)
+    if reservations:
+        reservations = numpy.array(reservations, dtype=numpy.int64).reshape(-1, 3)
+        # the rooms are ordered by id, so the row of a room is found by bisection
+        rows = numpy.searchsorted(numpy.array([room_id for room_id, room_type in rooms]), reservations[:, 0])
+        starts = numpy.maximum(reservations[:, 1], 0)
+        ends = numpy.minimum(reservations[:, 2], days - 1) + 1
+        # add.at, unlike changes[rows, starts] += 1, adds once for every reservation
+        numpy.add.at(changes, (rows, starts), 1)
+        numpy.add.at(changes, (rows, ends), -1)
+    free = numpy.cumsum(changes[:, :days], axis=1) == 0
+
+    types = sorted(set(room_type for room_id, room_type in rooms))
+    index_of_type = dict((room_type, i) for i, room_type in enumerate(types))
+    type_of_row = numpy.array([index_of_type[room_type] for room_id, room_type in rooms])
+    free_by_type = numpy.zeros((len(types), days), dtype=numpy.int32)
+    numpy.add.at(free_by_type, type_of_row, free)
+
+    return dict((room_type, (int((type_of_row == i).sum()), free_by_type[i].tolist())) for i, room_type in enumerate(types))
@@ -0,0 +1,319 @@
+"""
+Scheduling algorithms working on plain Python values.
+
+Nothing here touches the database, so the algorithms can be tested and
+benchmarked without the ORM. helper_views feeds them with data loaded
+from the models and writes the results back.
+
+An interval is a tuple (key, start, end). key identifies the interval
+(e.g. a reservation id), start and end are comparable values (dates or
+numbers). Two intervals conflict if one starts while the other one is
+still running, the end day included.
+"""
+
+import heapq
+
+
+def partition_intervals(intervals, rooms):
+    """
+    Algorithm name: Interval Partitioning.
+
+    Assigns every interval to a room so that conflicting intervals
+    get different rooms.
+
+    Args:
+    intervals (list of (key, start, end) tuples) -> the intervals; ties on
+        start are processed in the given order
+    rooms (list of room ids) -> the available rooms
+
+    Returns: dict key -> room id, or None if the intervals cannot fit
+
+    The intervals are processed by start. A min-heap keeps the end of the
+    intervals currently occupying a room, so the rooms released before the
+    next start are returned to the pool of free rooms. Out of the free rooms
+    the one with the highest id is taken.
+
+    Complexity: O(n log n + m log m) for n intervals and m rooms.
+    """
+    free_rooms = [-room for room in rooms]  # max-heap of room ids
+    heapq.heapify(free_rooms)
+    occupied = []   # min-heap of (end, room id)
+
+    schedule = dict()
+    for key, start, end in sorted(intervals, key=lambda interval: interval[1]):
+        while occupied and occupied[0][0] < start:
+            heapq.heappush(free_rooms, -heapq.heappop(occupied)[1])
+
+        if not free_rooms:
+            return None     # the intervals cannot fit
+
+        room = -heapq.heappop(free_rooms)
+        heapq.heappush(occupied, (end, room))
+        schedule[key] = room
+
+    return schedule
+
+
+def select_intervals(fixed, candidates, rooms_count):
+    """
+    Algorithm name: Interval Selection on k machines.
+
+    Chooses as many of the candidate intervals as possible, so that they
+    fit together with the fixed intervals in rooms_count rooms.
+
+    Args:
+    fixed (list of (key, start, end) tuples) -> intervals which must be kept
+        (they should fit in the rooms by themselves)
+    candidates (list of (key, start, end) tuples) -> intervals which may be dropped
+    rooms_count (int) -> number of rooms
+
+    Returns: set of the keys of the chosen candidates
+
+    The intervals are processed by start (the fixed ones first on ties),
+    keeping the ones which still run. Whenever they are more than the
+    rooms, the running candidate which ends last is dropped: it blocks a
+    room for the longest time, so dropping it leaves the most room for
+    the intervals which come next.
+
+    Complexity: O(n log n) for n intervals.
+    """
+    intervals = [(start, 0, end, key) for key, start, end in fixed]
+    intervals += [(start, 1, end, key) for key, start, end in candidates]
+    intervals.sort(key=lambda interval: interval[:2])
+
+    # the ends can be any comparable values (e.g. dates), so the max-heap
+    # of the candidates is ordered by the rank of their end
+    by_end = sorted((index for index, interval in enumerate(intervals) if interval[1]), key=lambda index: intervals[index][2])
+    end_rank = dict((index, rank) for rank, index in enumerate(by_end))
+
+    running = []                # min-heap of (end, index), the dropped ones included
+    running_candidates = []     # max-heap of (-end rank, index) of the running candidates
+    dropped = set()             # indexes of the dropped candidates
+    ended = set()               # indexes of the intervals which ended
+    running_count = 0           # running intervals, without the dropped ones
+
+    for index, (start, is_candidate, end, key) in enumerate(intervals):
+        while running and running[0][0] < start:
+            ended_index = heapq.heappop(running)[1]
+            ended.add(ended_index)
+            if ended_index not in dropped:
+                running_count -= 1
+
+        heapq.heappush(running, (end, index))
+        if is_candidate:
+            heapq.heappush(running_candidates, (-end_rank[index], index))
+        running_count += 1
+
+        if running_count > rooms_count:
+            while running_candidates and running_candidates[0][1] in ended:
+                heapq.heappop(running_candidates)
+            if not running_candidates:
+                raise ValueError("the fixed intervals do not fit in the rooms")
+            dropped.add(heapq.heappop(running_candidates)[1])
+            running_count -= 1
+
+    return set(intervals[index][3] for index in range(len(intervals)) if intervals[index][1] and index not in dropped)
+
+
+def assign_rooms(pinned, movable, new, rooms):
+    """
+    Algorithm name: Interval Partitioning with pinned intervals and
+    preferred rooms.
+
+    Puts the new intervals in the rooms together with the ones already
+    there, moving as few of them as it can to another room.
+
+    Args:
+    pinned (list of (key, start, end, room id) tuples) -> intervals which
+        keep their room (e.g. the reservations of guests who checked in);
+        they start before all the other intervals
+    movable (list of (key, start, end, room id) tuples) -> intervals which
+        may change their room, with their current one
+    new (list of (key, start, end) tuples) -> the intervals to add
+    rooms (list of room ids) -> the rooms
+
+    Returns: dict key -> room id of the movable and the new intervals,
+    or None if they cannot fit
+
+    The intervals are processed by start (on ties the movable ones first),
+    like in partition_intervals. A room taken so far holds nothing after
+    the interval in it, so all the rooms free at a start are as good for
+    the intervals which follow: they fit if and only if there is a free
+    room at every start, whichever of the free rooms are taken. A pinned
+    room is free after its last pinned interval (with pinned intervals
+    starting later, even the feasibility would be NP-hard).
+
+    Of the free rooms a movable interval takes its current room if it can.
+    Otherwise, and for the new intervals, the room whose next own interval
+    (a movable one which was there before) starts the latest is taken,
+    so the rooms which their own intervals need the soonest are left
+    for them. A max-heap of the free rooms is ordered by that start, with
+    lazy deletion of the entries of the rooms which were taken.
+
+    No move is made when the new intervals fit in rooms which are free for
+    them, but in general the number of moves is not always the smallest:
+    that is a precoloring extension of an interval graph, which is NP-hard.
+
+    Complexity: O((n + m) log (n + m)) for n intervals and m rooms.
+    """
+    intervals = [(start, 0, end, key, room) for key, start, end, room in movable]
+    intervals += [(start, 1, end, key, None) for key, start, end in new]
+    intervals.sort(key=lambda interval: interval[:2])
+
+    # the indexes of the own intervals of every room, in order
+    own = dict((room, []) for room in rooms)
+    for index, (start, is_new, end, key, room) in enumerate(intervals):
+        if room in own:
+            own[room].append(index)
+    next_own = dict((room, 0) for room in rooms)    # position in own[room]
+
+    def next_own_index(room):
+        position = next_own[room]
+        return own[room][position] if position < len(own[room]) else len(intervals)
+
+    # a room is freed after the last of its pinned intervals
+    pinned_until = dict()
+    for key, start, end, room in pinned:
+        if room in own:
+            pinned_until[room] = max(end, pinned_until.get(room, end))
+    occupied = [(end, room) for room, end in pinned_until.items()]  # min-heap of (end, room id)
+    heapq.heapify(occupied)
+
+    free = set()
+    free_by_next_own = []   # max-heap of (-next own index, -room id), with stale entries
+
+    def add_free(room):
+        free.add(room)
+        heapq.heappush(free_by_next_own, (-next_own_index(room), -room))
+
+    for room in rooms:
+        if room not in pinned_until:
+            add_free(room)
+
+    schedule = dict()
+    for index, (start, is_new, end, key, current_room) in enumerate(intervals):
+        while occupied and occupied[0][0] < start:
+            add_free(heapq.heappop(occupied)[1])
+
+        if current_room in own:
+            next_own[current_room] += 1     # this interval is not waited for any more
+
+        if current_room in free:
+            room = current_room
+        else:
+            # the entries of the rooms which were taken are skipped; the
+            # next own interval of a free room does not change while it is
+            # free, it would take the room
+            while free_by_next_own and -free_by_next_own[0][1] not in free:
+                heapq.heappop(free_by_next_own)
+            if not free_by_next_own:
+                return None     # no free room, the intervals cannot fit
+            room = -heapq.heappop(free_by_next_own)[1]
+
+        free.remove(room)
+        heapq.heappush(occupied, (end, room))
+        schedule[key] = room
+
+    return schedule
+
+
+# limits of min_moves_placement: moved intervals for one new interval,
+# and rooms tried in the whole search
+MAX_MOVES = 4
+MAX_STEPS = 20000
+
+
+class _SearchLimit(Exception):
+    pass
+
+
+def min_moves_placement(pinned, movable, new, rooms, max_moves=MAX_MOVES, max_steps=MAX_STEPS):
+    """
+    Algorithm name: Augmenting path search with iterative deepening.
+
+    Puts the new intervals in the rooms, one after another, each moving
+    the fewest intervals which are already there.
+
+    Args:
+    pinned (list of (key, start, end, room id) tuples) -> intervals which
+        keep their room
+    movable (list of (key, start, end, room id) tuples) -> intervals which
+        may change their room, with their current one
+    new (list of (key, start, end) tuples) -> the intervals to add
+    rooms (list of room ids) -> the rooms
+    max_moves (int) -> most moved intervals for one new interval
+    max_steps (int) -> most rooms tried in the whole search
+
+    Returns: dict key -> room id of the new and of the moved intervals
+    (the moves), or None if some new interval needs more than max_moves
+    moves or the search takes more than max_steps steps
+
+    A new interval is put in a room, and the intervals there which conflict
+    with it are taken out and put in another room in the same way, until
+    none is left: a path of moves. Every interval is moved at most once,
+    which does not leave out any placement: in the final one the intervals
+    in a room do not conflict, so an interval put in its final room takes
+    out only intervals which move too. The paths are searched with at most
+    0 moves, then 1, and so on (iterative deepening), so the first one found
+    has the fewest moves. Only the intervals in conflict are looked at.
+
+    Complexity: exponential in max_moves in the worst case, bounded by
+    max_steps; a placement with few moves in a hotel with few rooms of the
+    type is found after a few steps.
+    """
+    contents = dict((room, dict()) for room in rooms)    # room id -> dict key -> (start, end)
+    fixed = set()   # pinned, new and moved intervals, which stay where they are
+    for key, start, end, room in pinned:
+        if room in contents:
+            contents[room][key] = (start, end)
+            fixed.add(key)
+    for key, start, end, room in movable:
+        contents[room][key] = (start, end)
+    steps = [0]
+
+    def search(pending, budget, placed):
+        # pending: list of (key, start, end, room id it left) of the intervals
+        # to put in a room; budget: how many more intervals may be taken out
+        if not pending:
+            return True
+        key, start, end, origin = pending[0]
+
+        options = []
+        for room in rooms:
+            if room == origin:
+                continue
+            steps[0] += 1
+            if steps[0] > max_steps:
+                raise _SearchLimit()
+            blockers = [other for other, (other_start, other_end) in contents[room].items() if other_start <= end and start <= other_end]
+            if len(blockers) <= budget and not any(other in fixed for other in blockers):
+                options.append((len(blockers), room, blockers))
+        options.sort(key=lambda option: option[:2])
+
+        for count, room, blockers in options:
+            taken_out = [(other,) + contents[room].pop(other) + (room,) for other in blockers]
+            contents[room][key] = (start, end)
+            fixed.add(key)
+            if search(pending[1:] + taken_out, budget - count, placed):
+                placed[key] = room
+                return True
+            del contents[room][key]
+            fixed.discard(key)
+            for other, other_start, other_end, other_room in taken_out:
+                contents[room][other] = (other_start, other_end)
+        return False
+
+    schedule = dict()
+    try:
+        for key, start, end in new:
+            for budget in range(max_moves + 1):
+                placed = dict()
+                if search([(key, start, end, None)], budget, placed):
+                    schedule.update(placed)
+                    break
+            else:
+                return None     # not with max_moves moves
+    except _SearchLimit:
+        return None
+
+    return schedule
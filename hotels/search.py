@@ -0,0 +1,180 @@
+"""
+Search of hotels by name, location and text with an inverted index.
+
+The index (HotelSearchTerm) keeps the trigrams (3 consecutive characters,
+lowercased) of the name and the location of every hotel and the words of
+its text. It is updated when a hotel is saved (see hotels.signals).
+
+A hotel can contain a string only if it has all of its trigrams, so the
+candidates are the hotels having its rarest trigrams, found in the index,
+and only they are checked with the (slow) substring comparison. Strings
+shorter than a trigram are searched by scanning the hotels.
+"""
+
+import re
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from hotels.models import Hotel, HotelSearchTerm
+
+# how the tags of a search are matched (see filter_by_tags)
+MATCH_ALL_TAGS = 'all'
+MATCH_ANY_TAG = 'any'
+
+TRIGRAM_LENGTH = 3
+
+# trigrams of a searched string which the candidates must have (the rarest ones)
+CANDIDATE_TRIGRAMS = 2
+
+# if even the rarest trigram is in more hotels than this,
+# scanning the hotels is faster than going through the index
+MAX_CANDIDATES = 1000
+
+# index rows written by one INSERT when indexing many hotels
+TERMS_PER_INSERT = 500
+
+
+def trigrams(value):
+    """
+    Returns: set of the trigrams of the lowercased value
+    """
+    value = value.lower()
+    return set(value[i:i + TRIGRAM_LENGTH] for i in range(len(value) - TRIGRAM_LENGTH + 1))
+
+
+def words(value):
+    """
+    Returns: set of the lowercased words of the value
+    """
+    max_length = HotelSearchTerm._meta.get_field('term').max_length
+    return set(word[:max_length] for word in re.findall(r'\w+', value.lower(), re.UNICODE))
+
+
+def _terms(hotel_id, name, location, text):
+    terms = []
+    for field, field_terms in [(HotelSearchTerm.NAME, trigrams(name)), (HotelSearchTerm.LOCATION, trigrams(location)), (HotelSearchTerm.TEXT, words(text))]:
+        terms += [HotelSearchTerm(hotel_id=hotel_id, field=field, term=term) for term in field_terms]
+    return terms
+
+
+def index_hotel(hotel):
+    """
+    Writes the index entries of the hotel, replacing the old ones.
+    """
+    with transaction.atomic():
+        HotelSearchTerm.objects.filter(hotel=hotel).delete()
+        HotelSearchTerm.objects.bulk_create(_terms(hotel.id, hotel.name, hotel.location, hotel.text))
+
+
+def index_hotels(hotels):
+    """
+    Writes the index entries of many hotels (e.g. after bulk_create,
+    which does not send signals), replacing the old ones.
+
+    Args:
+    hotels (queryset of Hotel objects) -> the hotels to index
+
+    Returns: number of the indexed hotels
+    """
+    indexed = 0
+    with transaction.atomic():
+        HotelSearchTerm.objects.filter(hotel__in=hotels.values('id')).delete()
+        terms = []
+        for hotel_id, name, location, text in hotels.values_list('id', 'name', 'location', 'text').iterator():
+            terms += _terms(hotel_id, name, location, text)
+            indexed += 1
+            if len(terms) >= TERMS_PER_INSERT:
+                HotelSearchTerm.objects.bulk_create(terms)
+                terms = []
+        HotelSearchTerm.objects.bulk_create(terms)
+    return indexed
+
+
+def _with_terms(hotels, field, terms, limit=None):
+    """
+    Keeps the hotels having the terms in the field.
+
+    With limit, only that many of the terms (the rarest ones) are required,
+    which is enough to pick few candidates: the index entries of each term
+    are counted first, with one grouped query.
+    """
+    counts = dict(HotelSearchTerm.objects.filter(field=field, term__in=terms).values_list('term').annotate(Count('id')))
+    if len(counts) < len(terms):
+        return hotels.none()    # some term is in no hotel
+    if limit and min(counts.values()) > MAX_CANDIDATES:
+        return hotels   # not selective, the caller will scan
+
+    for term in sorted(terms, key=lambda term: counts[term])[:limit]:
+        hotels = hotels.filter(id__in=HotelSearchTerm.objects.filter(field=field, term=term).values('hotel'))
+    return hotels
+
+
+def search_hotels(hotels, name='', location='', text=''):
+    """
+    Filters the hotels which contain name in their name, location in
+    their location (both case insensitive, like icontains) and all the
+    words of text in their text, and ranks them.
+
+    Args:
+    hotels (queryset of Hotel objects) -> the hotels to search in
+    name (string) -> part of the name
+    location (string) -> part of the location
+    text (string) -> words of the text
+
+    Returns: queryset of the found hotels, ordered by rank (best first) and id
+
+    A match at the start of the name (location) ranks highest, then a match
+    at the start of a word and then any other match.
+    """
+    rank = []
+    rank_params = []
+    for field_name, field, value in [('name', HotelSearchTerm.NAME, name), ('location', HotelSearchTerm.LOCATION, location)]:
+        if not value:
+            continue
+
+        if len(value) >= TRIGRAM_LENGTH:
+            hotels = _with_terms(hotels, field, trigrams(value), CANDIDATE_TRIGRAMS)
+        hotels = hotels.filter(**{field_name + '__icontains': value})
+
+        # case insensitive LIKE, as used by icontains
+        like = "UPPER(%s.%s) %s" % (connection.ops.quote_name(Hotel._meta.db_table), connection.ops.quote_name(field_name), connection.operators['icontains'])
+        rank.append("(CASE WHEN {0} THEN 3 WHEN {0} THEN 2 ELSE 1 END)".format(like))
+        value = connection.ops.prep_for_like_query(value)
+        rank_params += [value + '%', '% ' + value + '%']
+
+    text_words = words(text)
+    if text_words:
+        hotels = _with_terms(hotels, HotelSearchTerm.TEXT, text_words)
+
+    if not rank:
+        return hotels.order_by('id')
+    return hotels.extra(select={'search_rank': " + ".join(rank)}, select_params=rank_params).order_by('-search_rank', 'id')
+
+
+def filter_by_tags(hotels, tags, match=MATCH_ALL_TAGS):
+    """
+    Filters the hotels having all (or any) of the tags.
+
+    Args:
+    hotels (queryset of Hotel objects) -> the hotels to filter
+    tags (list of Tag objects or ids) -> the tags; no tags filter nothing
+    match (string) -> MATCH_ALL_TAGS or MATCH_ANY_TAG
+
+    Returns: queryset of the hotels, each one once
+
+    For all of the tags the relation table is joined once per tag. A hotel
+    has a tag at most once, so every join keeps one row per hotel and the
+    result needs no DISTINCT (which would be a sort of all the found hotels).
+    For any of the tags the hotels are looked up in the relation table with
+    a subquery, which does not repeat them either.
+    """
+    tag_ids = sorted(set(getattr(tag, 'id', tag) for tag in tags))
+    if not tag_ids:
+        return hotels
+
+    if match == MATCH_ANY_TAG:
+        return hotels.filter(id__in=Hotel.tags.through.objects.filter(tag__in=tag_ids).values('hotel'))
+    for tag_id in tag_ids:
+        hotels = hotels.filter(tags=tag_id)
+    return hotels
@@ -0,0 +1,142 @@
+"""
+Signal handlers which keep the derived data (see hotels.search,
+hotels.cache, hotels.page_cache, hotels.images, hotels.inventory_days)
+in sync with the models. Imported at the end of hotels.models.
+"""
+
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from hotels.models import Tag, Hotel, Photo, RoomType, Room, Reservation
+from hotels import search, cache, page_cache, images, inventory_days
+
+
+@receiver(post_init, sender=Reservation)
+def remember_reservation_hotel(sender, instance, **kwargs):
+    # the hotel the reservation had when loaded, to change its occupancy too if it changes
+    instance._loaded_hotel_id = instance.hotel_id
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def reservation_occupancy_changed(sender, instance, **kwargs):
+    inventory_days.occupancy_changed(set([instance._loaded_hotel_id, instance.hotel_id]) - set([None]))
+    instance._loaded_hotel_id = instance.hotel_id
+
+
+def _booked_days(reservation):
+    if reservation.hotel_id is None:
+        return None
+    return (reservation.hotel_id, reservation.room_type_id, reservation.start_date, reservation.end_date)
+
+
+@receiver(post_init, sender=Reservation)
+def remember_reservation_days(sender, instance, **kwargs):
+    # the days the reservation had when loaded, to free them if they change
+    instance._loaded_days = _booked_days(instance)
+
+
+@receiver(post_save, sender=Reservation)
+def book_reservation_days(sender, instance, **kwargs):
+    days = _booked_days(instance)
+    if days != instance._loaded_days:
+        if instance._loaded_days is not None:
+            inventory_days.book(*instance._loaded_days, rooms=-1)
+        inventory_days.book(*days, rooms=1)
+    instance._loaded_days = days
+
+
+@receiver(post_delete, sender=Reservation)
+def free_reservation_days(sender, instance, **kwargs):
+    if instance._loaded_days is not None:
+        inventory_days.book(*instance._loaded_days, rooms=-1)
+
+
+@receiver(post_init, sender=Room)
+def remember_room_hotel(sender, instance, **kwargs):
+    # the hotel the room had when loaded, to invalidate it too if it changes
+    instance._loaded_hotel_id = instance.hotel_id
+    instance._loaded_type_id = instance.type_id
+
+
+@receiver(post_save, sender=Room)
+def update_room_inventory(sender, instance, created, **kwargs):
+    # before invalidate_room_hotel, which forgets the hotel it was loaded with
+    loaded = (instance._loaded_hotel_id, instance._loaded_type_id)
+    if not created and loaded != (instance.hotel_id, instance.type_id):
+        # Room.save moved the reservations of the room to the new hotel or type
+        for hotel_id in set([loaded[0], instance.hotel_id]):
+            inventory_days.rebuild(hotel_id)
+    else:
+        inventory_days.update_totals(instance.hotel_id, instance.type_id)
+    instance._loaded_type_id = instance.type_id
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_hotel(sender, instance, **kwargs):
+    hotel_ids = set([instance._loaded_hotel_id, instance.hotel_id]) - set([None])
+    inventory_days.occupancy_changed(hotel_ids)
+    for hotel_id in hotel_ids:
+        cache.invalidate_room_types(hotel_id)
+    instance._loaded_hotel_id = instance.hotel_id
+
+
+@receiver(post_delete, sender=Room)
+def update_deleted_room_inventory(sender, instance, **kwargs):
+    # its reservations were deleted before it, freeing their days
+    inventory_days.update_totals(instance.hotel_id, instance.type_id)
+
+
+@receiver(post_save, sender=RoomType)
+@receiver(post_delete, sender=RoomType)
+def invalidate_room_types(sender, instance, **kwargs):
+    # a room type can be in any hotel
+    cache.invalidate_room_types()
+
+
+@receiver(post_save, sender=Hotel)
+def index_hotel(sender, instance, **kwargs):
+    search.index_hotel(instance)
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_delete, sender=Hotel)
+def invalidate_hotel_pages(sender, instance, **kwargs):
+    page_cache.invalidate_hotel(instance.id)
+
+
+@receiver(m2m_changed, sender=Hotel.tags.through)
+def invalidate_hotel_tags_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is a tag, in any number of hotels
+        page_cache.invalidate_all()
+    else:
+        page_cache.invalidate_hotel(instance.id)
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def invalidate_photo_pages(sender, instance, **kwargs):
+    page_cache.invalidate_hotel_content(instance.hotel_id)
+
+
+@receiver(post_init, sender=Photo)
+def remember_photo_image(sender, instance, **kwargs):
+    # the image the photo had when loaded, to make new variants if it changes
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_save, sender=Photo)
+def process_photo(sender, instance, created, **kwargs):
+    if created or instance.image.name != instance._loaded_image:
+        images.process_photo(instance.id)
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_pages(sender, instance, **kwargs):
+    page_cache.invalidate_all()
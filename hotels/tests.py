@@ -1,11 +1,34 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, Client
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.cache import cache
+from unittest import skipIf, skipUnless
 
 from django.contrib.auth import authenticate, login, logout
 from datetime import date, timedelta
-from django.contrib.auth.models import User
+import base64
+import json
+import logging
+import random
+import threading
+import os
+import shutil
+import tempfile
+from PIL import Image
+from django.contrib.auth.models import User, Group
 
 from hotels.models import *
 from hotels.helper_views import *
+from hotels.helper_views import _free_rooms_queryset
+from hotels.scheduling import partition_intervals, select_intervals, assign_rooms, min_moves_placement
+import itertools
+from hotels.cache import LRUCache, room_types_of_hotel
+from hotels import page_cache, images, inventory, inventory_days, room_calendar, instrumentation, booking_queue
+from django.core.management import call_command
+from django.utils import six
+from hotels.forms import ReservationForm
+from hotels.search import search_hotels, index_hotels
+from hotels.benchmarks import Rollback, generator
 
 
 class SearchTest(TestCase):
@@ -83,6 +106,23 @@ class SearchTest(TestCase):
         names = set(hotel.name for hotel in response.context['hotels_list'])
         self.assertEqual(names, set(['Sheraton', 'Continental']))
 
+    def test_search_tags_all_or_any(self):
+        c = Client()
+
+        # all of the tags, each hotel once
+        response = c.get('/hotels/', {'name': '', 'stars': 1, 'location': '', 'tags': self.tags_ids, 'tag_match': 'all'})
+        self.assertEqual([hotel.name for hotel in response.context['hotels_list']], ['Continental'])
+
+        response = c.get('/hotels/', {'name': '', 'stars': 1, 'location': '', 'tags': self.tags_ids[::2]})
+        names = [hotel.name for hotel in response.context['hotels_list']]
+        self.assertEqual(sorted(names), ['Belgrade', 'Continental', 'Lazur'])
+
+        # any of the tags, each hotel once
+        response = c.get('/hotels/', {'name': '', 'stars': 4, 'location': '', 'tags': self.tags_ids[1:], 'tag_match': 'any', 'count': 1})
+        names = [hotel.name for hotel in response.context['hotels_list']]
+        self.assertEqual(sorted(names), ['Continental', 'Sheraton'])
+        self.assertEqual(response.context['count'], 2)
+
 
 class LoginTest(TestCase):
     def setUp(self):
@@ -217,6 +257,53 @@ class ReservationsTest(TestCase):
 
 
 
+@skipIf(connection.vendor == 'sqlite', "needs a database server with concurrent connections and row locks")
+class ConcurrentReservationsTest(TransactionTestCase):
+    THREADS = 8
+    REQUESTS_PER_THREAD = 4
+
+    def setUp(self):
+        rt1 = RoomType(type='RoomType1')
+        rt1.save()
+        h = Hotel(name='TestHotel', stars=3, location='Test site', text='!!!')
+        h.save()
+        self.h_id = h.id
+        for number in range(1, 6):
+            Room(number=number, type=rt1, hotel=h).save()
+
+        for i in range(self.THREADS):
+            User.objects.create_user('tester%d' % i, 'tester%d@email.com' % i, 'testerpass')
+
+    def test_no_double_booking(self):
+        errors = []
+
+        def book(i):
+            try:
+                c = Client()
+                c.post('/hotels/login/', {'username': 'tester%d' % i, 'password': 'testerpass'})
+                for j in range(self.REQUESTS_PER_THREAD):
+                    start_date = date(2014, 7, 1) + timedelta(days=j)
+                    c.post('/hotels/reserve/' + str(self.h_id) + '/', {'start_date': start_date.isoformat(), 'end_date': (start_date + timedelta(days=2)).isoformat(), 'RoomType1': 1})
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        reservations = list(Reservation.objects.all())
+        self.assertTrue(reservations)
+        for res1 in reservations:
+            for res2 in reservations:
+                if res1.id < res2.id and res1.room_id == res2.room_id:
+                    self.assertFalse(res1.start_date <= res2.end_date and res2.start_date <= res1.end_date)
+
+
 class AlgorithmsTest(TestCase):
     def setUp(self):
         rt1 = RoomType(type='RoomType1')
@@ -248,6 +335,33 @@ class AlgorithmsTest(TestCase):
         free_rooms = get_free_rooms_of_type(self.h_id, '2014-07-01', '2014-07-07', 'RoomType1')
         self.assertEqual(len(free_rooms), 1)
 
+    def test_get_free_rooms(self):
+        res1 = Reservation(start_date='2014-07-02', end_date='2014-07-04', user=self.test_user, room=self.r1)
+        res1.save()
+        res2 = Reservation(start_date='2014-07-03', end_date='2014-07-05', user=self.test_user, room=self.r4)
+        res2.save()
+
+        # all room types are answered with a single query
+        with self.assertNumQueries(1):
+            free_rooms = get_free_rooms(self.h_id, date(2014, 7, 1), date(2014, 7, 7), ['RoomType1', 'RoomType2'])
+        self.assertEqual(free_rooms['RoomType1'], [self.r2, self.r3])
+        self.assertEqual(free_rooms['RoomType2'], [])
+
+        # a reservation starting on the last day occupies the room,
+        # and one ending on the first day too
+        free_rooms = get_free_rooms(self.h_id, date(2014, 7, 1), date(2014, 7, 2), ['RoomType1'])
+        self.assertEqual(free_rooms['RoomType1'], [self.r2, self.r3])
+        free_rooms = get_free_rooms(self.h_id, date(2014, 7, 4), date(2014, 7, 6), ['RoomType1'])
+        self.assertEqual(free_rooms['RoomType1'], [self.r2, self.r3])
+        free_rooms = get_free_rooms(self.h_id, date(2014, 7, 5), date(2014, 7, 6), ['RoomType1'])
+        self.assertEqual(free_rooms['RoomType1'], [self.r1, self.r2, self.r3])
+
+    def test_no_double_booking_of_shared_day(self):
+        room_type = self.r1.type.type
+        self.assertTrue(reserve_rooms(self.h_id, {room_type: 3}, date(2030, 1, 3), date(2030, 1, 5), self.test_user))
+        self.assertFalse(reserve_rooms(self.h_id, {room_type: 1}, date(2030, 1, 1), date(2030, 1, 3), self.test_user))
+        self.assertTrue(reserve_rooms(self.h_id, {room_type: 1}, date(2030, 1, 1), date(2030, 1, 2), self.test_user))
+
     def test_best_room_choice(self):
         c = Client()
         response = c.post('/hotels/login/', {'username': 'tester', 'password': 'testerpass'})
@@ -262,6 +376,112 @@ class AlgorithmsTest(TestCase):
         best_room = choose_best_room([self.r1, self.r2, self.r3], date(2014, 7, 7), date(2014, 7, 8))
         self.assertEqual(best_room, self.r1)
 
+    def test_best_room_choice_matches_per_room_counts(self):
+        def choose_best_room_per_room(rooms, start_date, end_date):
+            # the original implementation: two COUNT queries per candidate room
+            busyness_of_rooms = []
+            for room in rooms:
+                starting = Reservation.objects.filter(room__id=room.id, start_date__gte=start_date + timedelta(days=3), start_date__lte=end_date + timedelta(days=3)).count()
+                ending = Reservation.objects.filter(room__id=room.id, end_date__gte=start_date + timedelta(days=3), end_date__lte=end_date + timedelta(days=3)).count()
+                busyness_of_rooms.append(starting + ending)
+            return rooms[busyness_of_rooms.index(max(busyness_of_rooms))]
+
+        rooms = [self.r1, self.r2, self.r3, self.r4]
+        rand = random.Random(42)
+        for i in range(60):
+            start = date(2014, 7, 1) + timedelta(days=rand.randint(0, 40))
+            end = start + timedelta(days=rand.randint(0, 5))
+            Reservation(start_date=start, end_date=end, user=self.test_user, room=rand.choice(rooms)).save()
+
+        for i in range(30):
+            start_date = date(2014, 7, 1) + timedelta(days=rand.randint(0, 40))
+            end_date = start_date + timedelta(days=rand.randint(0, 5))
+            candidates = rand.sample(rooms, rand.randint(1, len(rooms)))
+
+            expected = choose_best_room_per_room(candidates, start_date, end_date)
+            with self.assertNumQueries(1):
+                best_room = choose_best_room(candidates, start_date, end_date)
+            self.assertEqual(best_room, expected)
+
+    def test_move_reservations(self):
+        res1 = Reservation(start_date='2014-07-02', end_date='2014-07-04', user=self.test_user, room=self.r1)
+        res1.save()
+        res2 = Reservation(start_date='2014-07-05', end_date='2014-07-06', user=self.test_user, room=self.r2)
+        res2.save()
+
+        with self.assertNumQueries(1):
+            updated = move_reservations({res1.id: self.r3.id, res2.id: self.r1.id})
+        self.assertEqual(updated, 2)
+        self.assertEqual(Reservation.objects.get(id=res1.id).room, self.r3)
+        self.assertEqual(Reservation.objects.get(id=res2.id).room, self.r1)
+
+    def test_interval_partitioning_is_windowed(self):
+        res1 = Reservation(start_date='2014-07-02', end_date='2014-07-04', user=self.test_user, room=self.r1)
+        res1.save()
+        res2 = Reservation(start_date='2014-07-02', end_date='2014-07-05', user=self.test_user, room=self.r2)
+        res2.save()
+        res3 = Reservation(start_date='2014-07-05', end_date='2014-07-06', user=self.test_user, room=self.r3)
+        res3.save()
+        # ended before the new reservation starts
+        res_past = Reservation(start_date='2014-06-28', end_date='2014-06-30', user=self.test_user, room=self.r1)
+        res_past.save()
+        # not connected to the new reservation by overlapping reservations
+        res_later = Reservation(start_date='2014-08-10', end_date='2014-08-12', user=self.test_user, room=self.r1)
+        res_later.save()
+
+        cluster = overlapping_cluster(self.h_id, 'RoomType1', date(2014, 7, 1), date(2014, 7, 3), date(2014, 7, 1))
+        self.assertEqual([res[0] for res in cluster], [res1.id, res2.id, res3.id])
+
+        result = interval_scheduling(self.h_id, 'RoomType1', '2014-07-01', '2014-07-03', self.test_user)
+        self.assertTrue(result)
+        self.assertEqual(Reservation.objects.get(id=res_past.id).room, self.r1)
+        self.assertEqual(Reservation.objects.get(id=res_later.id).room, self.r1)
+
+        new_res = Reservation.objects.get(start_date='2014-07-01', end_date='2014-07-03')
+        rooms = set(Reservation.objects.get(id=res.id).room_id for res in [res1, res2, new_res])
+        self.assertEqual(len(rooms), 3)
+
+    def test_assign_request(self):
+        c = Client()
+        response = c.post('/hotels/login/', {'username': 'tester', 'password': 'testerpass'})
+
+        today = date.today()
+        day = lambda days: today + timedelta(days=days)
+        # checked in, keeps room 12
+        res1 = Reservation(start_date=day(-1), end_date=day(2), user=self.test_user, room=self.r2)
+        res1.save()
+        res2 = Reservation(start_date=day(3), end_date=day(6), user=self.test_user, room=self.r1)
+        res2.save()
+        res3 = Reservation(start_date=day(7), end_date=day(9), user=self.test_user, room=self.r3)
+        res3.save()
+
+        # 2 rooms of the type are needed while only 13 is free: both fit
+        # only if res2 makes room in 11 by moving to 12 after res1
+        response = c.post('/hotels/reserve/' + str(self.h_id) + '/', {'start_date': day(2), 'end_date': day(4), 'RoomType1': 2, 'RoomType2': 1})
+        self.assertEqual(response.context['log'], "Success!")
+        self.assertEqual(Reservation.objects.get(id=res1.id).room, self.r2)
+        self.assertEqual(Reservation.objects.get(id=res2.id).room, self.r2)
+        self.assertEqual(Reservation.objects.get(id=res3.id).room, self.r3)
+        new_rooms = Reservation.objects.filter(start_date=day(2), end_date=day(4)).values_list('room', flat=True)
+        self.assertEqual(sorted(new_rooms), sorted([self.r1.id, self.r3.id, self.r4.id]))
+        self.assertEqual(inventory_days.differences(self.h_id), [])
+
+    def test_many_moves_keep_checked_in(self):
+        day = lambda days: date.today() + timedelta(days=days)
+        checked_in = Reservation.objects.create(start_date=day(-1), end_date=day(1), user=self.test_user, room=self.r1)
+        Reservation.objects.create(start_date=day(1), end_date=day(11), user=self.test_user, room=self.r3)
+        # one day in 12 and the next in 11: the new reservation fits only if
+        # 5 of them move, more than min_moves_placement does
+        for first in range(2, 12):
+            Reservation.objects.create(start_date=day(first), end_date=day(first), user=self.test_user, room=self.r1 if first % 2 else self.r2)
+
+        result = interval_scheduling(self.h_id, 'RoomType1', day(2), day(11), self.test_user)
+        self.assertTrue(result)
+        self.assertEqual(Reservation.objects.get(id=checked_in.id).room, self.r1)
+        for room in [self.r1, self.r2, self.r3]:
+            intervals = [(res.id, res.start_date, res.end_date) for res in Reservation.objects.filter(room=room)]
+            self.assertNotEqual(partition_intervals(intervals, [room.id]), None)
+
     def test_interval_partitioning(self):
         c = Client()
         response = c.post('/hotels/login/', {'username': 'tester', 'password': 'testerpass'})
@@ -279,6 +499,7 @@ class AlgorithmsTest(TestCase):
 
         result = interval_scheduling(self.h_id, 'RoomType1', '2014-07-01', '2014-07-06', self.test_user)
         self.assertTrue(result)
+        self.assertEqual(result.moved, len([r for r in [res1, res2, res3, res4, res5] if Reservation.objects.get(id=r.id).room_id != r.room_id]))
         self.assertEqual(len(Reservation.objects.filter(start_date__gte='2014-07-01', end_date__lte='2014-07-08')), 6)
 
         # assert conflicting reservations are assigned different rooms
@@ -300,3 +521,1102 @@ class AlgorithmsTest(TestCase):
     def tearDown(self):
         Reservation.objects.all().delete()
         User.objects.get(username='tester').delete()
+
+
+class ReserveBatchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('partner', 'partner@example.com', 'partner')
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        double = RoomType.objects.create(type='Double')
+        self.rooms = [Room.objects.create(number=number, type=double, hotel=self.hotel) for number in [1, 2]]
+        self.day = date.today() + timedelta(days=10)
+
+    def item(self, start, end, room_type='Double'):
+        return {'hotel': self.hotel.id, 'room_type': room_type,
+                'start_date': str(self.day + timedelta(days=start)), 'end_date': str(self.day + timedelta(days=end))}
+
+    def test_batch(self):
+        # a previous reservation, in the room which the batch needs for 2 - 3
+        previous = Reservation.objects.create(start_date=self.day + timedelta(days=2), end_date=self.day + timedelta(days=3), user=self.user, room=self.rooms[1])
+        Reservation.objects.create(start_date=self.day, end_date=self.day + timedelta(days=1), user=self.user, room=self.rooms[0])
+
+        items = [
+            self.item(0, 9),        # would block a room for the whole time
+            self.item(2, 5),
+            self.item(4, 8),
+            self.item(6, 9),
+            self.item(0, 1, room_type='Suite'),
+            {'hotel': self.hotel.id, 'room_type': 'Double', 'start_date': 'tomorrow', 'end_date': '2020-01-01'},
+            self.item(5, 4),
+        ]
+        results = reserve_batch(items, self.user)
+
+        self.assertEqual([result['accepted'] for result in results], [False, True, True, True, False, False, False])
+        self.assertEqual([result.get('reason') for result in results],
+                         ['no free room', None, None, None, 'no rooms of that type', 'invalid', 'invalid'])
+        self.assertEqual(Reservation.objects.count(), 5)
+
+        # every room holds reservations which do not conflict
+        for room in self.rooms:
+            intervals = [(res.id, res.start_date, res.end_date) for res in Reservation.objects.filter(room=room)]
+            self.assertNotEqual(partition_intervals(intervals, [room.id]), None)
+        self.assertEqual(set(Reservation.objects.values_list('hotel', flat=True)), set([self.hotel.id]))
+        self.assertTrue(Reservation.objects.filter(id=previous.id).exists())
+
+    def test_conflicting_reservations(self):
+        # more reservations on day 3 than there are rooms, e.g. made before the rooms were checked like now
+        for room, start, end in [(0, 1, 3), (0, 3, 5), (1, 2, 4)]:
+            Reservation.objects.create(start_date=self.day + timedelta(days=start), end_date=self.day + timedelta(days=end), user=self.user, room=self.rooms[room])
+        results = reserve_batch([self.item(2, 2), self.item(8, 9)], self.user)
+        self.assertEqual(results, [{'accepted': False, 'reason': 'conflicting reservations'}] * 2)
+        self.assertEqual(Reservation.objects.count(), 3)
+
+    def test_batch_keeps_rooms(self):
+        checked_in = Reservation.objects.create(start_date=date.today() - timedelta(days=1), end_date=self.day, user=self.user, room=self.rooms[0])
+        later = Reservation.objects.create(start_date=self.day + timedelta(days=1), end_date=self.day + timedelta(days=3), user=self.user, room=self.rooms[1])
+
+        # fits in a free room: no reservation changes its room
+        results = reserve_batch([self.item(4, 5)], self.user)
+        self.assertTrue(results[0]['accepted'])
+        self.assertEqual(Reservation.objects.get(id=checked_in.id).room, self.rooms[0])
+        self.assertEqual(Reservation.objects.get(id=later.id).room, self.rooms[1])
+        rooms = dict(Reservation.objects.values_list('id', 'room'))
+
+        # fits only if the later reservation moves after the checked in one,
+        # which keeps its room
+        results = reserve_batch([self.item(0, 3)], self.user)
+        self.assertEqual(results, [{'accepted': True, 'room': self.rooms[1].id}])
+        moved = [res_id for res_id, room_id in Reservation.objects.filter(id__in=list(rooms)).values_list('id', 'room') if rooms[res_id] != room_id]
+        self.assertEqual(moved, [later.id])
+        self.assertEqual(Reservation.objects.get(id=later.id).room, self.rooms[0])
+        self.assertEqual(inventory_days.differences(self.hotel.id), [])
+
+    def post_batch(self, items, username='partner', password='partner'):
+        # like a partner's machine: no session and no CSRF token
+        credentials = base64.b64encode(('%s:%s' % (username, password)).encode('utf-8')).decode('ascii')
+        return Client(enforce_csrf_checks=True).post('/hotels/reserve/batch/', json.dumps(items), content_type='application/json',
+                                                     HTTP_AUTHORIZATION='Basic ' + credentials)
+
+    def test_endpoint(self):
+        self.user.groups.add(Group.objects.create(name='partners'))
+        response = self.post_batch([self.item(0, 1), self.item(0, 1), self.item(1, 2)])
+        self.assertEqual([result['accepted'] for result in json.loads(response.content.decode('utf-8'))], [True, True, False])
+        self.assertEqual(set(Reservation.objects.values_list('user', flat=True)), set([self.user.id]))
+        self.assertEqual(self.post_batch({'hotel': 1}).status_code, 400)
+
+        self.assertEqual(self.post_batch([self.item(5, 6)], password='wrong').status_code, 401)
+        User.objects.create_user('guest', 'guest@example.com', 'guest')
+        self.assertEqual(self.post_batch([self.item(5, 6)], username='guest', password='guest').status_code, 403)
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.assertEqual(self.post_batch([self.item(5, 6)], username='admin', password='admin').status_code, 200)
+
+        # a session is not enough
+        c = Client()
+        c.login(username='admin', password='admin')
+        self.assertEqual(c.post('/hotels/reserve/batch/', json.dumps([self.item(7, 8)]), content_type='application/json').status_code, 401)
+        self.assertEqual(Reservation.objects.count(), 3)
+
+
+class AvailabilityTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'guest')
+        double = RoomType.objects.create(type='Double')
+        single = RoomType.objects.create(type='Single')
+        self.day = date.today() + timedelta(days=10)
+        self.hotels = []
+        # hotel i has i + 1 doubles and 1 single, the first double is taken on day 0 - 2
+        for i in range(5):
+            hotel = Hotel.objects.create(name='Hotel%d' % i, stars=3 + i % 3, location='Sofia' if i != 4 else 'Varna', text='!!!')
+            rooms = [Room.objects.create(number=number, type=double, hotel=hotel) for number in range(1, i + 2)]
+            Room.objects.create(number=100, type=single, hotel=hotel)
+            Reservation.objects.create(start_date=self.day, end_date=self.day + timedelta(days=2), user=self.user, room=rooms[0])
+            self.hotels.append(hotel)
+
+    def search(self, **params):
+        params.setdefault('start_date', str(self.day + timedelta(days=1)))
+        params.setdefault('end_date', str(self.day + timedelta(days=3)))
+        response = Client().get('/hotels/availability/', params)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response, json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def test_search(self):
+        response, results = self.search(rooms='Double:2,Single:1', location='Sofia')
+        self.assertEqual([hotel['name'] for hotel in results['hotels']], ['Hotel2', 'Hotel3'])
+        self.assertEqual(results['hotels'][0]['free_rooms'], {'Double': 2, 'Single': 1})
+        self.assertEqual(results['next_after'], None)
+
+        # the reservations end before the first day
+        response, results = self.search(rooms='Double:1', start_date=str(self.day + timedelta(days=3)))
+        self.assertEqual(len(results['hotels']), 5)
+
+        response, results = self.search(rooms='Double:2', stars=5)
+        self.assertEqual([hotel['name'] for hotel in results['hotels']], ['Hotel2'])
+
+    def test_set_based(self):
+        for i in range(10):
+            hotel = Hotel.objects.create(name='Extra%d' % i, stars=3, location='Sofia', text='!!!')
+            Room.objects.create(number=1, type=RoomType.objects.get(type='Double'), hotel=hotel)
+        hotels = search_hotels_by_form({'stars': None, 'tags': [], 'tag_match': '', 'name': '', 'location': ''})
+        with self.assertNumQueries(2):
+            page, has_next = available_hotels(hotels, self.day, self.day + timedelta(days=1), {'Double': 1, 'Single': 1}, per_page=3)
+        self.assertEqual([hotel.name for hotel, free_rooms in page], ['Hotel1', 'Hotel2', 'Hotel3'])
+        self.assertTrue(has_next)
+
+    def test_pages_and_etag(self):
+        response, results = self.search(rooms='Double:1')
+        self.assertEqual(len(results['hotels']), 4)
+
+        response, results = self.search(rooms='Double:1', after=self.hotels[1].id)
+        self.assertEqual([hotel['name'] for hotel in results['hotels']], ['Hotel2', 'Hotel3', 'Hotel4'])
+
+        etag = response['ETag']
+        self.assertEqual(Client().get('/hotels/availability/', {'rooms': 'Double:1', 'after': self.hotels[1].id,
+                                                                'start_date': str(self.day + timedelta(days=1)), 'end_date': str(self.day + timedelta(days=3))},
+                                      HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Reservation.objects.create(start_date=self.day, end_date=self.day + timedelta(days=5), user=self.user, room=Room.objects.filter(hotel=self.hotels[2], type__type='Double')[1])
+        response, results = self.search(rooms='Double:1', after=self.hotels[1].id)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_errors(self):
+        for params in [{'rooms': 'Double'}, {'rooms': 'Double:0'}, {'rooms': 'Double:1', 'end_date': str(self.day)}]:
+            params.setdefault('start_date', str(self.day + timedelta(days=1)))
+            params.setdefault('end_date', str(self.day + timedelta(days=3)))
+            response = Client().get('/hotels/availability/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue('errors' in json.loads(response.content.decode('utf-8')))
+
+
+class SchedulingTest(SimpleTestCase):
+    def naive_partition(self, intervals, rooms):
+        # the original quadratic algorithm from interval_scheduling, on tuples
+        intervals = sorted(intervals, key=lambda interval: interval[1])
+        rooms = sorted(rooms)
+        schedule = dict()
+        for i, (key, start, end) in enumerate(intervals):
+            taken_rooms = [schedule[k] for k, s, e in intervals[:i] if e >= start and s <= start]
+            room = None
+            for room_id in rooms:
+                if room_id not in taken_rooms:
+                    room = room_id
+            if room is None:
+                return None
+            schedule[key] = room
+        return schedule
+
+    def test_partition_matches_naive(self):
+        rand = random.Random(7)
+        for i in range(300):
+            rooms = rand.sample(range(1, 50), rand.randint(1, 6))
+            intervals = []
+            for key in range(rand.randint(0, 25)):
+                start = rand.randint(0, 30)
+                intervals.append((key, start, start + rand.randint(0, 6)))
+            self.assertEqual(partition_intervals(intervals, rooms), self.naive_partition(intervals, rooms))
+
+    def test_partition_touching_intervals_conflict(self):
+        self.assertEqual(partition_intervals([(1, 1, 3), (2, 3, 4)], [10]), None)
+        self.assertEqual(partition_intervals([(1, 1, 3), (2, 4, 5)], [10]), {1: 10, 2: 10})
+
+    def test_select_matches_brute_force(self):
+        def fits(intervals, rooms_count):
+            return partition_intervals(intervals, list(range(rooms_count))) is not None
+
+        rand = random.Random(11)
+        for i in range(300):
+            rooms_count = rand.randint(1, 3)
+            fixed = []
+            for key in range(rand.randint(0, 4)):
+                start = rand.randint(0, 10)
+                interval = ('fixed', key), start, start + rand.randint(0, 4)
+                if fits(fixed + [interval], rooms_count):
+                    fixed.append(interval)
+            candidates = []
+            for key in range(rand.randint(0, 7)):
+                start = rand.randint(0, 10)
+                candidates.append((key, start, start + rand.randint(0, 4)))
+
+            chosen = select_intervals(fixed, candidates, rooms_count)
+            self.assertTrue(fits(fixed + [candidate for candidate in candidates if candidate[0] in chosen], rooms_count))
+            best = max(count for count in range(len(candidates) + 1)
+                       if any(fits(fixed + list(subset), rooms_count) for subset in itertools.combinations(candidates, count)))
+            self.assertEqual(len(chosen), best)
+
+    def conflicts(self, placed):
+        return any(room1 == room2 and start1 <= end2 and start2 <= end1
+                   for (key1, start1, end1, room1), (key2, start2, end2, room2) in itertools.combinations(placed, 2))
+
+    def test_assign_matches_brute_force(self):
+        rand = random.Random(13)
+        for i in range(300):
+            rooms = rand.sample(range(1, 20), rand.randint(1, 3))
+            existing = []
+            for key in range(rand.randint(0, 5)):
+                start = rand.randint(0, 10)
+                interval = key, start, start + rand.randint(0, 4), rand.choice(rooms)
+                if not self.conflicts(existing + [interval]):
+                    existing.append(interval)
+            # the pinned intervals started first, like the reservations of the guests who checked in
+            pinned = [interval for interval in existing if interval[1] < 3 and rand.random() < 0.5]
+            movable = [interval for interval in existing if interval not in pinned]
+            start = rand.randint(3, 10)
+            new = [(('new', key), start, start + rand.randint(0, 4)) for key in range(rand.randint(1, 2))]
+
+            schedule = assign_rooms(pinned, movable, new, rooms)
+            intervals = [(key, start, end) for key, start, end, room in movable] + new
+            placements = [pinned + [interval + (room,) for interval, room in zip(intervals, assignment)]
+                          for assignment in itertools.product(rooms, repeat=len(intervals))]
+            feasible = [placed for placed in placements if not self.conflicts(placed)]
+            if schedule is None:
+                self.assertEqual(feasible, [])
+                continue
+            self.assertNotEqual(feasible, [])
+            self.assertEqual(set(schedule), set(key for key, start, end in intervals))
+            self.assertFalse(self.conflicts(pinned + [(key, start, end, schedule[key]) for key, start, end in intervals]))
+
+    def test_assign_keeps_rooms_when_new_fit(self):
+        movable = [(1, 0, 3, 10), (2, 4, 6, 10), (3, 0, 6, 11)]
+        schedule = assign_rooms([], movable, [('new', 2, 5)], [10, 11, 12])
+        self.assertEqual(schedule, {1: 10, 2: 10, 3: 11, 'new': 12})
+
+    def test_assign_moves_around_pinned(self):
+        # the new interval fits only if 2 leaves room 10 for room 11,
+        # which is free once the pinned 1 ends
+        movable = [(2, 2, 4, 10)]
+        self.assertEqual(assign_rooms([(1, 0, 3, 11)], movable, [('new', 0, 2)], [10, 11]), None)
+        schedule = assign_rooms([(1, 0, 1, 11)], movable, [('new', 0, 3)], [10, 11])
+        self.assertEqual(schedule, {2: 11, 'new': 10})
+
+    def test_min_moves_matches_brute_force(self):
+        rand = random.Random(17)
+        for i in range(300):
+            rooms = rand.sample(range(1, 20), rand.randint(1, 3))
+            existing = []
+            for key in range(rand.randint(0, 6)):
+                start = rand.randint(0, 10)
+                interval = key, start, start + rand.randint(0, 4), rand.choice(rooms)
+                if not self.conflicts(existing + [interval]):
+                    existing.append(interval)
+            pinned = [interval for interval in existing if rand.random() < 0.2]
+            movable = [interval for interval in existing if interval not in pinned]
+            start = rand.randint(0, 10)
+            new = ('new', start, start + rand.randint(0, 4))
+
+            schedule = min_moves_placement(pinned, movable, [new], rooms)
+            intervals = [(key, start, end) for key, start, end, room in movable] + [new]
+            moves = [sum(room != previous_room for (key, start, end, previous_room), room in zip(movable, assignment))
+                     for assignment in itertools.product(rooms, repeat=len(intervals))
+                     if not self.conflicts(pinned + [interval + (room,) for interval, room in zip(intervals, assignment)])]
+            if schedule is None:
+                # not possible, or with more moves than allowed
+                self.assertTrue(not moves or min(moves) > 4)
+                continue
+            self.assertEqual(len(schedule) - 1, min(moves))
+            placed = dict((key, (start, end, room)) for key, start, end, room in pinned + movable)
+            placed.update((key, (start, end, schedule[key])) for key, start, end in intervals if key in schedule)
+            self.assertFalse(self.conflicts([(key,) + value for key, value in placed.items()]))
+
+    def test_min_moves_limits(self):
+        movable = [(1, 0, 3, 10), (2, 4, 6, 11)]
+        self.assertEqual(min_moves_placement([], movable, [('new', 1, 5)], [10, 11], max_moves=2), {'new': 10, 1: 11})
+        self.assertEqual(min_moves_placement([], movable, [('new', 1, 5)], [10, 11], max_moves=0), None)
+        self.assertEqual(min_moves_placement([], movable, [('new', 1, 5)], [10, 11], max_steps=1), None)
+
+
+@skipUnless(connection.vendor in ('sqlite', 'mysql'), "EXPLAIN output is parsed for SQLite and MySQL only")
+class IndexesTest(TestCase):
+    def setUp(self):
+        rt1 = RoomType(type='RoomType1')
+        rt1.save()
+        h = Hotel(name='TestHotel', stars=3, location='Test site', text='!!!')
+        h.save()
+        self.h_id = h.id
+        self.r1 = Room(number=11, type=rt1, hotel=h)
+        self.r1.save()
+        self.test_user = User.objects.create_user('tester', 'tester@email.com', 'testerpass')
+        Reservation(start_date='2014-07-02', end_date='2014-07-04', user=self.test_user, room=self.r1).save()
+
+    def index_name(self, model, fields):
+        # name of the index on exactly these fields (in this order)
+        table = model._meta.db_table
+        columns = [model._meta.get_field(field).column for field in fields]
+        cursor = connection.cursor()
+        if connection.vendor == 'sqlite':
+            cursor.execute("PRAGMA index_list(%s)" % connection.ops.quote_name(table))
+            for index in [row[1] for row in cursor.fetchall()]:
+                cursor.execute("PRAGMA index_info(%s)" % connection.ops.quote_name(index))
+                if [row[2] for row in sorted(cursor.fetchall())] == columns:
+                    return index
+        else:
+            cursor.execute("SHOW INDEX FROM %s" % connection.ops.quote_name(table))
+            indexes = dict()
+            for row in cursor.fetchall():
+                indexes.setdefault(row[2], []).append((row[3], row[4]))
+            for index, index_columns in indexes.items():
+                if [column for seq, column in sorted(index_columns)] == columns:
+                    return index
+        self.fail("no index on %s(%s)" % (table, ", ".join(columns)))
+
+    def plan(self, queryset):
+        # the indexes the database will use for the query
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        if connection.vendor == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " ".join(row[-1] for row in cursor.fetchall())
+        cursor.execute("EXPLAIN " + sql, params)
+        names = [column[0] for column in cursor.description]
+        # with the tiny test tables MySQL may prefer a full scan, so the candidates are checked
+        return " ".join(str(dict(zip(names, row))['possible_keys']) for row in cursor.fetchall())
+
+    def test_free_rooms_query(self):
+        plan = self.plan(_free_rooms_queryset(self.h_id, date(2014, 7, 1), date(2014, 7, 5)))
+        self.assertIn(self.index_name(Reservation, ['hotel', 'room_type', 'start_date', 'end_date']), plan)
+
+    def test_overlapping_cluster_query(self):
+        queryset = Reservation.objects.filter(hotel__id=self.h_id, room_type__type='RoomType1', start_date__lte=date(2014, 7, 5), end_date__gte=date(2014, 7, 1))
+        self.assertIn(self.index_name(Reservation, ['hotel', 'room_type', 'start_date', 'end_date']), self.plan(queryset))
+
+    def test_room_reservations_query(self):
+        queryset = Reservation.objects.filter(room__id__in=[self.r1.id], start_date__lte=date(2014, 7, 5), end_date__gte=date(2014, 7, 1))
+        self.assertIn(self.index_name(Reservation, ['room', 'start_date', 'end_date']), self.plan(queryset))
+
+    def test_hotel_search_query(self):
+        self.assertIn(self.index_name(Hotel, ['stars']), self.plan(Hotel.objects.filter(stars__gte=4)))
+
+    def test_denormalized_fields(self):
+        res = Reservation.objects.get(room=self.r1)
+        self.assertEqual((res.hotel_id, res.room_type_id), (self.h_id, self.r1.type_id))
+
+        rt2 = RoomType(type='RoomType2')
+        rt2.save()
+        self.r1.type = rt2
+        self.r1.save()
+        self.assertEqual(Reservation.objects.get(id=res.id).room_type, rt2)
+
+    def test_denormalized_fields_not_in_admin_form(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        c = Client()
+        c.login(username='admin', password='admin')
+        response = c.get('/admin/hotels/reservation/add/')
+        self.assertEqual(sorted(response.context['adminform'].form.fields), ['end_date', 'room', 'start_date', 'user'])
+
+        response = c.post('/admin/hotels/reservation/add/', {'start_date': '2014-08-01', 'end_date': '2014-08-03',
+                                                             'user': self.test_user.id, 'room': self.r1.id})
+        self.assertEqual(response.status_code, 302)
+        res = Reservation.objects.get(start_date='2014-08-01')
+        self.assertEqual((res.hotel_id, res.room_type_id), (self.h_id, self.r1.type_id))
+
+
+class PaginationTest(TestCase):
+    def setUp(self):
+        for i in range(25):
+            Hotel(name='Hotel%d' % i, stars=i % 5 + 1, location='Sofia' if i % 2 else 'Varna', text='!!!').save()
+        self.ids = list(Hotel.objects.order_by('id').values_list('id', flat=True))
+
+    def test_pages(self):
+        c = Client()
+        response = c.get('/hotels/')
+        self.assertEqual([h.id for h in response.context['hotels_list']], self.ids[:10])
+        self.assertEqual(response.context['next'], 2)
+
+        response = c.get('/hotels/3/')
+        self.assertEqual([h.id for h in response.context['hotels_list']], self.ids[20:])
+        self.assertEqual(response.context['previous'], 2)
+        self.assertEqual(response.context['next'], None)
+
+        self.assertEqual(c.get('/hotels/0/').status_code, 404)
+
+    def test_keyset_pages(self):
+        c = Client()
+        response = c.get('/hotels/', {'after': self.ids[9]})
+        self.assertEqual([h.id for h in response.context['hotels_list']], self.ids[10:20])
+        self.assertEqual(response.context['next_after'], self.ids[19])
+
+        response = c.get('/hotels/', {'after': self.ids[19]})
+        self.assertEqual([h.id for h in response.context['hotels_list']], self.ids[20:])
+        self.assertFalse('next_after' in response.context)
+
+        # a deep page is one query, like the first one
+        with self.assertNumQueries(1):
+            page_of_hotels(Hotel.objects.all(), after=self.ids[19])
+
+    def test_search_pages(self):
+        c = Client()
+        response = c.get('/hotels/', {'name': '', 'stars': 1, 'location': 'Sofia', 'count': 1})
+        sofia_ids = [hotel_id for i, hotel_id in enumerate(self.ids) if i % 2]
+        self.assertEqual([h.id for h in response.context['hotels_list']], sofia_ids[:10])
+        self.assertEqual(response.context['count'], 12)
+        self.assertFalse('count' in response.context['query'])
+
+        response = c.get('/hotels/2/', {'name': '', 'stars': 1, 'location': 'Sofia'})
+        self.assertEqual([h.id for h in response.context['hotels_list']], sofia_ids[10:])
+        self.assertEqual(response.context['next'], None)
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.rand = random.Random(7)
+        syllables = ['ba', 'ro', 'sa', 'vi', 'le', 'tu', 'na', 'ka']
+        for i in range(60):
+            name = ''.join(self.rand.choice(syllables) for j in range(3)).capitalize() + ' ' + self.rand.choice(['Hotel', 'Inn', 'Palace'])
+            location = self.rand.choice(['Sofia', 'Varna', 'Plovdiv', 'Burgas'])
+            Hotel(name=name, stars=i % 5 + 1, location=location, text='Nice view, near the ' + self.rand.choice(['sea', 'park', 'center'])).save()
+
+    def test_index_on_save(self):
+        hotel = Hotel.objects.all()[0]
+        hotel.name = 'Zzyzx Resort'
+        hotel.save()
+        self.assertEqual(list(search_hotels(Hotel.objects.all(), name='zyzx')), [hotel])
+        self.assertEqual(list(search_hotels(Hotel.objects.all(), name='Zzyzx Resort')), [hotel])
+        self.assertEqual(list(search_hotels(Hotel.objects.all(), name='Resort Zzyzx')), [])
+
+    def test_same_as_icontains(self):
+        names = list(Hotel.objects.values_list('name', flat=True))
+        for i in range(50):
+            name = self.rand.choice(names)
+            length = self.rand.randint(1, 8)
+            offset = self.rand.randint(0, len(name) - 1)
+            value = name[offset:offset + length].swapcase()
+            expected = set(Hotel.objects.filter(name__icontains=value, location__icontains='a'))
+            self.assertEqual(set(search_hotels(Hotel.objects.all(), name=value, location='a')), expected)
+
+    def test_text_words(self):
+        expected = set(Hotel.objects.filter(text__icontains='sea'))
+        self.assertEqual(set(search_hotels(Hotel.objects.all(), text='SEA view')), expected)
+        self.assertEqual(list(search_hotels(Hotel.objects.all(), text='mountain view')), [])
+
+    def test_ranking(self):
+        Hotel.objects.all().delete()
+        for name in ['Grand Sofia', 'Sofiana', 'Old Sofiana', 'Casofia']:
+            Hotel(name=name, stars=3, location='Sofia', text='!!!').save()
+        found = [hotel.name for hotel in search_hotels(Hotel.objects.all(), name='sofia')]
+        self.assertEqual(found, ['Sofiana', 'Grand Sofia', 'Old Sofiana', 'Casofia'])
+
+    def test_rebuild(self):
+        HotelSearchTerm.objects.all().delete()
+        self.assertEqual(index_hotels(Hotel.objects.all()), 60)
+        hotel = Hotel.objects.order_by('id')[0]
+        self.assertTrue(hotel in search_hotels(Hotel.objects.all(), name=hotel.name[1:6]))
+
+
+@override_settings(PHOTO_WORKERS=0)
+class QueryBudgetTest(TestCase):
+    """
+    Every page is loaded with a fixed number of queries: the budget is the
+    same for any number of hotels, tags, photos, rooms and reservations.
+    """
+    # the session and the user are 2 of the queries of every page
+    BUDGETS = {
+        'index': 3,
+        'index_tags': 6,
+        'hotel_info': 2,
+        'reserve': 2,
+        'admin_rooms': 4,
+        'admin_reservations': 4,
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.tags = [Tag.objects.create(tag='Tag%d' % i) for i in range(4)]
+        self.room_types = [RoomType.objects.create(type=room_type) for room_type in ['Single', 'Double', 'Suite']]
+        self.hotels = []
+
+    def add_data(self, hotels_count):
+        """Adds hotels with tags, photos, rooms of all types and reservations."""
+        for i in range(hotels_count):
+            hotel = Hotel.objects.create(name='Hotel%d' % len(self.hotels), stars=3, location='Sofia', text='!!!')
+            hotel.tags.add(*self.tags)
+            for j in range(2):
+                Photo.objects.create(hotel=hotel, image='static/images/hotels/%d-%d.jpg' % (hotel.id, j))
+            for number, room_type in enumerate(self.room_types):
+                room = Room.objects.create(number=number + 1, type=room_type, hotel=hotel)
+                Reservation.objects.create(start_date=date.today(), end_date=date.today() + timedelta(days=2), user=self.admin, room=room)
+            self.hotels.append(hotel)
+
+    def count_queries(self, page):
+        """Counts the queries of the page, after loading it once to warm up the caches."""
+        c = Client()
+        c.login(username='admin', password='admin')
+        urls = {
+            'index': '/hotels/',
+            'index_tags': '/hotels/?name=&stars=1&location=&tags=%d&tags=%d' % (self.tags[0].id, self.tags[1].id),
+            'hotel_info': '/hotels/hotel-info/%d/' % self.hotels[0].id,
+            'reserve': '/hotels/reserve/%d/' % self.hotels[0].id,
+            'admin_rooms': '/admin/hotels/room/',
+            'admin_reservations': '/admin/hotels/reservation/',
+        }
+        c.get(urls[page])
+        with CaptureQueriesContext(connection) as queries:
+            response = c.get(urls[page])
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_budgets(self):
+        self.add_data(5)
+        small = dict((page, self.count_queries(page)) for page in self.BUDGETS)
+        self.add_data(10)
+        large = dict((page, self.count_queries(page)) for page in self.BUDGETS)
+
+        for page, budget in self.BUDGETS.items():
+            self.assertTrue(large[page] <= budget, "%s: %d queries, the budget is %d" % (page, large[page], budget))
+            self.assertEqual(small[page], large[page], "%s: the number of queries grows with the data" % page)
+
+
+class RoomTypesCacheTest(TestCase):
+    def setUp(self):
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        self.single = RoomType.objects.create(type='Single')
+        self.double = RoomType.objects.create(type='Double')
+        Room.objects.create(number=1, type=self.single, hotel=self.hotel)
+        Room.objects.create(number=2, type=self.single, hotel=self.hotel)
+
+    def test_form_without_queries(self):
+        room_types_of_hotel(self.hotel.id)
+        with self.assertNumQueries(0):
+            form = ReservationForm(None, extra=room_types_of_hotel(self.hotel.id))
+        self.assertEqual(list(form.fields), ['start_date', 'end_date', 'Single'])
+
+    def test_invalidation(self):
+        self.assertEqual(room_types_of_hotel(self.hotel.id), [self.single])
+
+        room = Room.objects.create(number=3, type=self.double, hotel=self.hotel)
+        self.assertEqual(room_types_of_hotel(self.hotel.id), [self.single, self.double])
+
+        # a room moved to another hotel
+        other_hotel = Hotel.objects.create(name='Sheraton', stars=5, location='Sofia', text='!!!')
+        room_types_of_hotel(other_hotel.id)
+        room.hotel = other_hotel
+        room.save()
+        self.assertEqual(room_types_of_hotel(self.hotel.id), [self.single])
+        self.assertEqual(room_types_of_hotel(other_hotel.id), [self.double])
+
+        self.single.type = 'Single bed'
+        self.single.save()
+        self.assertEqual(room_types_of_hotel(self.hotel.id)[0].type, 'Single bed')
+
+        room.delete()
+        self.assertEqual(room_types_of_hotel(other_hotel.id), [])
+
+    def test_lru(self):
+        lru = LRUCache(2, 60)
+        lru.set(1, 'a')
+        lru.set(2, 'b')
+        lru.get(1)
+        lru.set(3, 'c')     # 2 is the least recently used
+        self.assertEqual([lru.get(key) for key in [1, 2, 3]], ['a', None, 'c'])
+        self.assertEqual(len(lru), 2)
+
+        expired = LRUCache(2, -1)
+        expired.set(1, 'a')
+        self.assertEqual(expired.get(1, 'missing'), 'missing')
+
+
+@override_settings(PHOTO_WORKERS=0)
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tag = Tag.objects.create(tag='Pool')
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        self.hotel.tags.add(self.tag)
+        self.url = '/hotels/hotel-info/%d/' % self.hotel.id
+
+    def test_hotel_info(self):
+        c = Client()
+        self.assertContains(c.get(self.url), 'Pool')
+        with self.assertNumQueries(0):
+            self.assertContains(c.get(self.url), 'Hilton')
+        self.assertEqual(page_cache.stats()['hotels'], {'hits': 1, 'misses': 1})
+
+        self.hotel.name = 'Hilton Garden'
+        self.hotel.save()
+        self.assertContains(c.get(self.url), 'Hilton Garden')
+
+        Photo.objects.create(hotel=self.hotel, image='static/images/hotels/hilton.jpg')
+        self.assertContains(c.get(self.url), 'hilton.jpg')
+
+        self.hotel.tags.add(Tag.objects.create(tag='Spa'))
+        self.assertContains(c.get(self.url), 'Spa')
+
+        self.tag.tag = 'Outdoor pool'
+        self.tag.save()
+        self.assertContains(c.get(self.url), 'Outdoor pool')
+
+        self.tag.hotel_set.clear()
+        self.assertNotContains(c.get(self.url), 'Outdoor pool')
+
+        self.assertEqual(c.get('/hotels/hotel-info/%d/' % (self.hotel.id + 1)).status_code, 404)
+
+    def test_index(self):
+        c = Client()
+        c.get('/hotels/')
+        with self.assertNumQueries(1):     # the tags in the search form
+            response = c.get('/hotels/')
+        self.assertEqual([hotel.name for hotel in response.context['hotels_list']], ['Hilton'])
+        self.assertEqual([tag.tag for tag in response.context['hotels_list'][0].tags.all()], ['Pool'])
+        self.assertEqual(page_cache.stats()['listing'], {'hits': 1, 'misses': 1})
+
+        Hotel.objects.create(name='Sheraton', stars=5, location='Sofia', text='!!!')
+        response = c.get('/hotels/')
+        self.assertEqual([hotel.name for hotel in response.context['hotels_list']], ['Hilton', 'Sheraton'])
+
+        # filtered pages are not cached
+        c.get('/hotels/', {'name': 'Hil', 'stars': 1, 'location': ''})
+        self.assertEqual(page_cache.stats()['listing'], {'hits': 1, 'misses': 2})
+
+    def test_stats_for_staff_only(self):
+        c = Client()
+        self.assertFalse('misses' in c.get('/hotels/cache-stats/').content.decode('utf-8'))
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        c.login(username='admin', password='admin')
+        c.get(self.url)
+        response = c.get('/hotels/cache-stats/')
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['hotels'], {'hits': 0, 'misses': 1})
+
+
+class PhotoVariantsTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, PHOTO_WORKERS=0)
+        self.settings.enable()
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def add_photo(self, name, size, mode='RGB', format='JPEG'):
+        os.makedirs(os.path.join(self.media_root, 'static', 'images', 'hotels'))
+        rand = random.Random(size[0])
+        image = Image.new(mode, size)
+        image.putdata([(rand.randint(0, 255), rand.randint(0, 255), rand.randint(0, 255), 255)[:len(mode)] for i in range(size[0] * size[1])])
+        image.save(os.path.join(self.media_root, 'static', 'images', 'hotels', name), format)
+        return Photo.objects.create(hotel=self.hotel, image='static/images/hotels/' + name)
+
+    def test_variants(self):
+        photo = self.add_photo('big.jpg', (1000, 600))
+        photo = Photo.objects.get(id=photo.id)
+        self.assertEqual((photo.width, photo.height), (1000, 600))
+
+        variants = dict(((variant.size, variant.format), variant) for variant in photo.photovariant_set.all())
+        formats = [PhotoVariant.JPEG, PhotoVariant.WEBP] if images.webp_supported() else [PhotoVariant.JPEG]
+        self.assertEqual(set(variants), set((size, format) for size in [PhotoVariant.THUMBNAIL, PhotoVariant.MEDIUM] for format in formats))
+
+        thumbnail = variants[PhotoVariant.THUMBNAIL, PhotoVariant.JPEG]
+        self.assertEqual((thumbnail.width, thumbnail.height), (200, 120))
+        self.assertEqual(Image.open(thumbnail.image.path).size, (200, 120))
+        medium = variants[PhotoVariant.MEDIUM, PhotoVariant.JPEG]
+        self.assertEqual((medium.width, medium.height), (800, 480))
+        self.assertTrue(thumbnail.image.size < medium.image.size < os.path.getsize(photo.image.path))
+
+        response = Client().get('/hotels/hotel-info/%d/' % self.hotel.id)
+        self.assertContains(response, '/%s 200w' % thumbnail.image.url)
+        self.assertContains(response, 'width="200" height="120"')
+
+    def test_small_and_transparent(self):
+        # not enlarged, and converted for JPEG
+        photo = self.add_photo('small.png', (150, 100), mode='RGBA', format='PNG')
+        self.assertEqual(set((variant.width, variant.height) for variant in photo.photovariant_set.all()), set([(150, 100)]))
+
+    def test_new_image(self):
+        photo = self.add_photo('first.jpg', (400, 400))
+        old_paths = [variant.image.path for variant in photo.photovariant_set.all()]
+        Image.new('RGB', (300, 600)).save(os.path.join(self.media_root, 'static', 'images', 'hotels', 'second.jpg'))
+        photo = Photo.objects.get(id=photo.id)
+        photo.image = 'static/images/hotels/second.jpg'
+        photo.save()
+        self.assertEqual(set((variant.width, variant.height) for variant in photo.photovariant_set.all()), set([(100, 200), (300, 600)]))
+
+        # the files of the old variants are deleted with them
+        self.assertFalse(any(os.path.exists(path) for path in old_paths))
+        images.make_variants(photo.id)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'static', 'images', 'hotels', 'variants'))),
+                         sorted(os.path.basename(variant.image.name) for variant in photo.photovariant_set.all()))
+
+    def test_without_variants(self):
+        photo = Photo.objects.create(hotel=self.hotel, image='static/images/hotels/missing.jpg')
+        self.assertEqual(photo.photovariant_set.count(), 0)
+        self.assertContains(Client().get('/hotels/hotel-info/%d/' % self.hotel.id), '<img src="/static/images/hotels/missing.jpg"')
+
+
+class ImportInventoryTest(TestCase):
+    CSV = (
+        'name,stars,location,text,tags,rooms\n'
+        'Hilton,5,"Sofia, Bulgaria",Nice,Pool|Spa,101-160 Double;201-210 Suite;1 Single\n'
+        'Bad stars,7,Sofia,Nice,,1-2 Single\n'
+        'Overlapping,3,Varna,Nice,,1-10 Single;5-6 Double\n'
+        'Lazur,3,"Burgas, Bulgaria",Nice,Pool,1-5 Single\n'
+    )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        return path
+
+    def test_csv(self):
+        RoomType.objects.create(type='Single')
+        stdout, stderr = six.StringIO(), six.StringIO()
+        call_command('import_inventory', self.write('hotels.csv', self.CSV), stdout=stdout, stderr=stderr)
+
+        self.assertEqual(sorted(Hotel.objects.values_list('name', flat=True)), ['Hilton', 'Lazur'])
+        hilton = Hotel.objects.get(name='Hilton')
+        self.assertEqual(hilton.location, 'Sofia, Bulgaria')
+        self.assertEqual(sorted(tag.tag for tag in hilton.tags.all()), ['Pool', 'Spa'])
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(dict((room_type.type, room_type.room_set.count()) for room_type in RoomType.objects.all()),
+                         {'Single': 6, 'Double': 60, 'Suite': 10})
+        self.assertEqual(Room.objects.filter(hotel=hilton).count(), 71)
+        self.assertEqual(list(search_hotels(Hotel.objects.all(), name='ilto')), [hilton])
+
+        self.assertTrue('Imported 2 hotels and 76 rooms, skipped 2 records' in stdout.getvalue())
+        self.assertTrue('Line 3 skipped: stars' in stderr.getvalue())
+        self.assertTrue('Line 4 skipped: room 5 is in more than one range' in stderr.getvalue())
+
+    def test_jsonl_in_chunks(self):
+        lines = ['{"name": "Hotel%d", "stars": 4, "location": "Sofia", "text": "Nice", "rooms": ["1-25 Double"]}' % i for i in range(4)]
+        lines.insert(2, '{"name": "Broken"')
+        with open(self.write('hotels.jsonl', "\n".join(lines)), 'rb') as input_file:
+            progress = []
+            with CaptureQueriesContext(connection) as queries:
+                importer = inventory.import_inventory(input_file, 'jsonl', lambda first, second: progress.append((getattr(first, 'rooms', first), second)), rooms_per_insert=10, rooms_per_transaction=50)
+
+        self.assertEqual((importer.hotels, importer.rooms), (4, 100))
+        self.assertEqual(Room.objects.count(), 100)
+        # the rooms of 2 hotels per transaction, 10 per INSERT
+        self.assertEqual(len([query for query in queries if 'INSERT INTO "hotels_room"' in query['sql']]), 10)
+        self.assertEqual([line for line, error in progress if isinstance(error, inventory.InvalidRecord)], [3])
+        self.assertEqual([rooms for rooms, seconds in progress if not isinstance(seconds, inventory.InvalidRecord)], [50, 100])
+
+    def test_room_ranges(self):
+        self.assertEqual(inventory.parse_room_range('101-160 Double'), (101, 160, 'Double'))
+        self.assertEqual(inventory.parse_room_range(' 12  Junior suite '), (12, 12, 'Junior suite'))
+        for value in ['160-101 Double', '0-3 Single', '101-160', 'Double']:
+            self.assertRaises(inventory.InvalidRecord, inventory.parse_room_range, value)
+
+
+class InventoryDaysTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'guest')
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        self.double = RoomType.objects.create(type='Double')
+        self.rooms = [Room.objects.create(number=number, type=self.double, hotel=self.hotel) for number in [1, 2]]
+        self.day = date.today() + timedelta(days=10)
+
+    def reserve(self, start, end, room=0):
+        return Reservation.objects.create(start_date=self.day + timedelta(days=start), end_date=self.day + timedelta(days=end),
+                                          user=self.user, room=self.rooms[room])
+
+    def booked(self):
+        return dict(((day - self.day).days, (total, booked)) for day, total, booked
+                    in InventoryDay.objects.filter(hotel=self.hotel, booked__gt=0).values_list('date', 'total', 'booked'))
+
+    def test_reservations(self):
+        first = self.reserve(0, 2)
+        self.reserve(4, 6, room=1)
+        self.assertEqual(self.booked(), dict((day, (2, 1)) for day in [0, 1, 2, 4, 5, 6]))
+
+        # rearranges the previous reservations, without changing the days
+        self.assertTrue(interval_scheduling(self.hotel.id, 'Double', self.day + timedelta(days=1), self.day + timedelta(days=5), self.user))
+        self.assertEqual(self.booked(), dict([(0, (2, 1)), (1, (2, 2)), (2, (2, 2)), (3, (2, 1)), (4, (2, 2)), (5, (2, 2)), (6, (2, 1))]))
+
+        first.end_date = self.day + timedelta(days=1)
+        first.save()
+        self.assertEqual(self.booked()[2], (2, 1))
+        first.delete()
+        self.assertFalse(0 in self.booked())
+
+        Room.objects.create(number=3, type=self.double, hotel=self.hotel)
+        self.assertEqual(self.booked()[1], (3, 1))
+        self.assertEqual(inventory_days.differences(self.hotel.id), [])
+
+    def test_batch_and_room_changes(self):
+        results = reserve_batch([{'hotel': self.hotel.id, 'room_type': 'Double', 'start_date': str(self.day + timedelta(days=start)),
+                                  'end_date': str(self.day + timedelta(days=end))} for start, end in [(0, 1), (0, 2), (1, 3)]], self.user)
+        self.assertEqual([result['accepted'] for result in results], [True, True, False])
+        self.assertEqual(self.booked(), {0: (2, 2), 1: (2, 2), 2: (2, 1)})
+
+        # the reservations go with the room to the other type
+        room = Room.objects.get(id=self.rooms[0].id)
+        room.type = RoomType.objects.create(type='Suite')
+        room.save()
+        self.assertEqual(inventory_days.differences(self.hotel.id), [])
+        self.assertEqual(set(InventoryDay.objects.filter(booked__gt=0).values_list('room_type__type', 'total')), set([('Double', 1), ('Suite', 1)]))
+
+    def test_reconcile(self):
+        self.reserve(0, 2)
+        self.reserve(1, 3, room=1)
+        InventoryDay.objects.filter(date=self.day + timedelta(days=1)).update(booked=5)
+        InventoryDay.objects.filter(date=self.day + timedelta(days=3)).delete()
+
+        stdout = six.StringIO()
+        call_command('reconcile_inventory', str(self.hotel.id), check=True, stdout=stdout)
+        self.assertTrue('Hotel %d: 2 days differ' % self.hotel.id in stdout.getvalue())
+        self.assertEqual(self.booked()[1], (2, 5))
+
+        call_command('reconcile_inventory', stdout=six.StringIO())
+        self.assertEqual(self.booked(), {0: (2, 1), 1: (2, 2), 2: (2, 2), 3: (2, 1)})
+        self.assertEqual(inventory_days.differences(self.hotel.id), [])
+
+    def test_occupancy_version(self):
+        version = inventory_days.occupancy_version(self.hotel.id)
+        versions = inventory_days.occupancy_version()
+        self.reserve(0, 1)
+        self.assertEqual(inventory_days.occupancy_version(self.hotel.id), version + 1)
+        self.assertNotEqual(inventory_days.occupancy_version(), versions)
+
+        # in the database, not in the cache of this process
+        cache.clear()
+        self.assertEqual(inventory_days.occupancy_version(self.hotel.id), version + 1)
+
+        # the bulk queries too, and not the rolled back changes
+        self.assertTrue(reserve_batch([{'hotel': self.hotel.id, 'room_type': 'Double', 'start_date': self.day, 'end_date': self.day}], self.user)[0]['accepted'])
+        self.assertEqual(inventory_days.occupancy_version(self.hotel.id), version + 2)
+        with transaction.atomic():
+            self.reserve(3, 4)
+            transaction.set_rollback(True)
+        self.assertEqual(inventory_days.occupancy_version(self.hotel.id), version + 2)
+
+        Room.objects.create(number=3, type=self.double, hotel=self.hotel)
+        self.assertEqual(inventory_days.occupancy_version(self.hotel.id), version + 3)
+
+    def test_fully_booked(self):
+        self.reserve(0, 1)
+        self.reserve(2, 4, room=1)
+        self.reserve(4, 5)
+        start, end = self.day + timedelta(days=1), self.day + timedelta(days=3)
+        self.assertFalse(inventory_days.fully_booked(self.hotel.id, 'Double', start, end, 1))
+        self.assertTrue(inventory_days.fully_booked(self.hotel.id, 'Double', start, end, 2))
+        # the last day is checked too, like in get_free_rooms
+        self.assertFalse(inventory_days.fully_booked(self.hotel.id, 'Double', self.day + timedelta(days=2), self.day + timedelta(days=3), 1))
+        self.assertTrue(inventory_days.fully_booked(self.hotel.id, 'Double', self.day + timedelta(days=3), self.day + timedelta(days=4), 1))
+
+        # rejected before locking the rooms
+        c = Client()
+        c.login(username='guest', password='guest')
+        with CaptureQueriesContext(connection) as queries:
+            response = c.post('/hotels/reserve/%d/' % self.hotel.id, {'start_date': str(start), 'end_date': str(end), 'Double': 2})
+        self.assertEqual(response.context['log'], "Not enough free rooms!")
+        self.assertFalse(any('"hotels_reservation"' in query['sql'] for query in queries))
+        self.assertEqual(Reservation.objects.count(), 3)
+
+
+class CalendarTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'guest')
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        double = RoomType.objects.create(type='Double')
+        single = RoomType.objects.create(type='Single')
+        self.rooms = [Room.objects.create(number=number, type=double if number <= 3 else single, hotel=self.hotel) for number in range(1, 6)]
+        self.day = date.today() + timedelta(days=10)
+
+    def test_free_rooms(self):
+        random.seed(11)
+        for room in self.rooms:
+            start = -5
+            while start < 40:
+                start += random.randint(0, 4)
+                end = start + random.randint(0, 6)
+                Reservation.objects.create(start_date=self.day + timedelta(days=start), end_date=self.day + timedelta(days=end), user=self.user, room=room)
+                start = end + 1
+
+        calendar = room_calendar.free_rooms_by_day(self.hotel.id, self.day, 30)
+        for room_type, rooms in [('Double', self.rooms[:3]), ('Single', self.rooms[3:])]:
+            expected = [sum(1 for room in rooms if not room.reservation_set.filter(start_date__lte=self.day + timedelta(days=day),
+                                                                                  end_date__gte=self.day + timedelta(days=day)).exists())
+                        for day in range(30)]
+            self.assertEqual(calendar[room_type], (len(rooms), expected))
+
+    def test_endpoint(self):
+        Reservation.objects.create(start_date=self.day, end_date=self.day + timedelta(days=1), user=self.user, room=self.rooms[0])
+        c = Client()
+        # with the occupancy version of the ETag
+        with self.assertNumQueries(4):
+            response = c.get('/hotels/calendar/%d/' % self.hotel.id, {'start_date': str(self.day - timedelta(days=1)), 'days': 4})
+        results = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(results['days'][0], str(self.day - timedelta(days=1)))
+        self.assertEqual(results['rooms'], {'Double': 3, 'Single': 2})
+        self.assertEqual(results['free_rooms'], {'Double': [3, 2, 2, 3], 'Single': [2, 2, 2, 2]})
+
+        self.assertEqual(len(json.loads(c.get('/hotels/calendar/%d/' % self.hotel.id).content.decode('utf-8'))['days']), room_calendar.CALENDAR_DAYS)
+        self.assertEqual(c.get('/hotels/calendar/%d/' % self.hotel.id, {'days': 1000}).status_code, 400)
+        self.assertEqual(c.get('/hotels/calendar/%d/' % (self.hotel.id + 1)).status_code, 404)
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_generator_is_deterministic(self):
+        generated = []
+        for i in range(2):
+            try:
+                with transaction.atomic():
+                    data = generator.generate(random.Random(5), hotels=2, room_types=2, rooms_per_type=4, years=1, occupancy_rate=0.6)
+                    reservations = Reservation.objects.filter(hotel__id__in=data['hotels']).order_by('id')
+                    generated.append((data['rooms'], data['locations'],
+                                      [(res.room.number, res.start_date, res.end_date) for res in reservations.select_related('room')]))
+                    self.assertEqual(inventory_days.differences(data['hotels'][0]), [])
+                    self.assertTrue(0.4 < data['occupancy'] < 0.8)
+                    raise Rollback()
+            except Rollback:
+                pass
+        self.assertEqual(generated[0], generated[1])
+        self.assertEqual(generated[0][0], 16)
+
+    def test_command(self):
+        output = os.path.join(self.directory, 'results.json')
+        stdout = six.StringIO()
+        call_command('benchmark', 'get_free_rooms_of_type', 'reserve', hotels=2, types=2, rooms_per_type=3, years=1, runs=5,
+                     output=output, stdout=stdout)
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(sorted(results['scenarios']), ['get_free_rooms_of_type', 'reserve'])
+        self.assertEqual(results['scenarios']['get_free_rooms_of_type']['runs'], 5)
+        self.assertEqual(results['scenarios']['get_free_rooms_of_type']['queries']['max'], 1)
+        self.assertTrue(set(['mean', 'p50', 'p95', 'p99', 'max']) <= set(results['scenarios']['reserve']['ms']))
+        # the synthetic data is rolled back
+        self.assertEqual(Hotel.objects.count(), 0)
+        self.assertEqual(Reservation.objects.count(), 0)
+
+        call_command('benchmark', 'get_free_rooms_of_type', hotels=2, types=2, rooms_per_type=3, years=1, runs=5, compare=output, stdout=stdout)
+        self.assertTrue('p50' in stdout.getvalue().splitlines()[-1])
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'guest')
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        double = RoomType.objects.create(type='Double')
+        self.rooms = [Room.objects.create(number=number, type=double, hotel=self.hotel) for number in [1, 2]]
+        self.day = date.today() + timedelta(days=10)
+
+    def reserve(self, start, end):
+        c = Client()
+        c.login(username='guest', password='guest')
+        c.post('/hotels/reserve/%d/' % self.hotel.id, {'start_date': str(self.day + timedelta(days=start)),
+                                                       'end_date': str(self.day + timedelta(days=end)), 'Double': 1})
+
+    def test_requests(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('hotels.instrumentation')
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            with self.settings(INSTRUMENTATION=True):
+                self.reserve(0, 2)
+                Reservation.objects.create(start_date=self.day + timedelta(days=3), end_date=self.day + timedelta(days=5), user=self.user, room=self.rooms[1])
+                # needs the reservations to be rearranged
+                self.reserve(1, 4)
+        finally:
+            logger.removeHandler(handler)
+
+        logged = [json.loads(record.getMessage()) for record in records]
+        reserves = [entry for entry in logged if entry['view'] == 'hotels.views.reserve']
+        self.assertEqual(len(reserves), 2)
+        self.assertEqual([span['name'] for span in reserves[0]['spans']], ['availability', 'availability', 'scoring', 'write-back'])
+        self.assertEqual([span['name'] for span in reserves[1]['spans']],
+                         ['availability', 'availability', 'scheduling/availability', 'scheduling/partitioning', 'scheduling/write-back', 'scheduling'])
+        self.assertTrue(reserves[1]['queries'] > sum(span['queries'] for span in reserves[1]['spans'] if span['name'] == 'scheduling') > 0)
+        self.assertTrue(reserves[1]['db_ms'] <= reserves[1]['ms'])
+
+        histograms = instrumentation.stats()['hotels.views.reserve']
+        self.assertEqual(histograms['ms']['count'], 2)
+        self.assertEqual(histograms['spans']['scheduling/partitioning']['ms']['count'], 1)
+        self.assertEqual(sum(histograms['queries']['buckets'].values()), 2)
+
+    def test_endpoint_and_disabled(self):
+        self.reserve(0, 2)
+        self.assertEqual(instrumentation.stats(), {})
+        self.assertTrue(instrumentation.span('availability') is instrumentation.span('scoring'))
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        with self.settings(INSTRUMENTATION=True):
+            c = Client()
+            c.login(username='admin', password='admin')
+            c.get('/hotels/')
+            response = c.get('/hotels/instrumentation/')
+        self.assertEqual(list(json.loads(response.content.decode('utf-8'))), ['hotels.views.index'])
+
+        c = Client()
+        c.login(username='guest', password='guest')
+        self.assertFalse('hotels.views.index' in c.get('/hotels/instrumentation/').content.decode('utf-8'))
+
+
+class BookingQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'guest')
+        self.hotel = Hotel.objects.create(name='Hilton', stars=5, location='Sofia', text='!!!')
+        double = RoomType.objects.create(type='Double')
+        self.rooms = [Room.objects.create(number=number, type=double, hotel=self.hotel) for number in [1, 2]]
+        self.day = date.today() + timedelta(days=10)
+        self.client.login(username='guest', password='guest')
+
+    def reserve(self, start, end, rooms=1):
+        with self.settings(BOOKING_QUEUE=True):
+            response = self.client.post('/hotels/reserve/%d/' % self.hotel.id, {'start_date': str(self.day + timedelta(days=start)),
+                                                                               'end_date': str(self.day + timedelta(days=end)), 'Double': rooms})
+        return response.context['log'], response.context['booking'] if 'booking' in response.context else None
+
+    def status(self, booking, client=None):
+        response = (client or self.client).get('/hotels/booking/%d/' % booking.id)
+        return response.status_code, json.loads(response.content.decode('utf-8')) if response.status_code == 200 else None
+
+    def test_queued_reservations(self):
+        log, first = self.reserve(0, 2, rooms=2)
+        self.assertEqual(log, booking_queue.MESSAGES[BookingRequest.PENDING])
+        log, second = self.reserve(1, 3)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(self.status(first), (200, {'id': first.id, 'hotel': self.hotel.id, 'status': 'pending', 'done': False,
+                                                    'log': booking_queue.MESSAGES[BookingRequest.PENDING]}))
+
+        # the requests are made in the order they came
+        call_command('process_bookings', str(self.hotel.id), once=True, stdout=six.StringIO())
+        self.assertEqual(Reservation.objects.count(), 2)
+        self.assertEqual(self.status(first)[1]['log'], "Success!")
+        self.assertEqual(self.status(second)[1]['status'], 'failed')
+        self.assertEqual(self.status(second)[1]['log'], "Not enough free rooms!")
+        self.assertTrue(self.status(second)[1]['done'])
+        self.assertEqual(inventory_days.differences(self.hotel.id), [])
+        # rejected without queueing by the daily inventory
+        self.assertEqual(self.reserve(0, 1), ("Not enough free rooms!", None))
+
+        # only the user who made the request sees it
+        User.objects.create_user('other', 'other@example.com', 'other')
+        other = Client()
+        other.login(username='other', password='other')
+        self.assertEqual(self.status(first, other), (404, None))
+
+    def test_claim(self):
+        bookings = [booking_queue.enqueue(self.hotel.id, {'Double': 1}, self.day + timedelta(days=start), self.day + timedelta(days=start), self.user)
+                    for start in range(3)]
+        first = booking_queue.claim(self.hotel.id, 'first', limit=2)
+        self.assertEqual([booking.id for booking in first], [booking.id for booking in bookings[:2]])
+        second = booking_queue.claim(self.hotel.id, 'second')
+        self.assertEqual([booking.id for booking in second], [bookings[2].id])
+        self.assertEqual(booking_queue.claim(self.hotel.id, 'third'), [])
+
+        # the requests of a stopped worker are given to another one,
+        # and the stopped one cannot finish them any more
+        self.assertEqual(booking_queue.requeue_stale(self.hotel.id), 0)
+        self.assertEqual(booking_queue.requeue_stale(self.hotel.id, seconds=-1), 3)
+        third = booking_queue.claim(self.hotel.id, 'third')
+        self.assertEqual(len(third), 3)
+        self.assertFalse(booking_queue.process(first[0]))
+        self.assertTrue(booking_queue.process(third[0]))
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(BookingRequest.objects.get(id=bookings[0].id).status, BookingRequest.DONE)
@@ -10,4 +10,10 @@ urlpatterns = patterns('',
     url(r'^logout/$', 'django.contrib.auth.views.logout', {'next_page': '/hotels/'}),
     url(r'^hotel-info/(?P<hotel_id>\d+)/$', views.hotel_info, name='hotel-info'),
     url(r'^reserve/(?P<hotel_id>\d+)/$', views.reserve, name='reserve'),
+    url(r'^calendar/(?P<hotel_id>\d+)/$', views.calendar, name='calendar'),
+    url(r'^availability/$', views.availability, name='availability'),
+    url(r'^reserve/batch/$', views.reserve_batch_view, name='reserve-batch'),
+    url(r'^booking/(?P<booking_id>\d+)/$', views.booking_status, name='booking-status'),
+    url(r'^cache-stats/$', views.cache_stats, name='cache-stats'),
+    url(r'^instrumentation/$', views.instrumentation_stats, name='instrumentation'),
 )
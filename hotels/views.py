@@ -1,14 +1,26 @@
-from django.shortcuts import render, render_to_response, get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect
-from django.contrib.auth import authenticate, login, logout
+from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse, Http404
+from django.views.decorators.http import condition
+from django.views.decorators.csrf import csrf_exempt
+from django.contrib.auth import authenticate, login
+from django.conf import settings
 
-from hotels.models import Hotel, Tag, Room, RoomType, Photo
+from hotels.models import Hotel, BookingRequest
 
-from hotels.forms import SearchHotelForm, ReservationForm, AuthenticateUser, RegisterUser
+from hotels.forms import SearchHotelForm, AvailabilityForm, CalendarForm, ReservationForm, AuthenticateUser, RegisterUser
 
-from itertools import repeat
+import base64
+import hashlib
+import json
+import logging
 
 from hotels.helper_views import *
+from hotels import page_cache, room_calendar, instrumentation, booking_queue, inventory_days
+from hotels.cache import room_types_of_hotel
+
+logger = logging.getLogger(__name__)
 
 
 def index(request, page_num=1):
@@ -16,29 +28,197 @@ def index(request, page_num=1):
     form = SearchHotelForm(data)
     
     if form.is_valid():
-        if form.cleaned_data['tags']:
-            hotels_list = Hotel.objects.filter(name__icontains=form.cleaned_data['name'], stars__gte=form.cleaned_data['stars'], location__icontains=form.cleaned_data['location'], tags__contains=form.cleaned_data['tags']).distinct()
-        else:   # do not include tags in the query (because 'tags__contains=[]' return no hotels)
-            hotels_list = Hotel.objects.filter(name__icontains=form.cleaned_data['name'], stars__gte=form.cleaned_data['stars'], location__icontains=form.cleaned_data['location']).distinct()
+        unfiltered = False
+        hotels = search_hotels_by_form(form.cleaned_data)
     
     else:
-        page_num = int(page_num)
-        previous = page_num - 1
-        next = page_num + 1
-        
-        hotels_list = Hotel.objects.all()[((page_num - 1) * 10) : (page_num * 10 - 1)]
+        unfiltered = True
+        hotels = Hotel.objects.all()
         
         form = SearchHotelForm()
     
+    # pages are /hotels/<page_num>/, or in keyset mode /hotels/?after=<hotel id>
+    page_num = int(page_num)
+    if page_num < 1:
+        raise Http404
+    after = request.GET.get('after', '')
+    after = int(after) if after.isdigit() else None
+    # the tags of the hotels on the page are fetched with one more query
+    def get_page():
+        return page_of_hotels(hotels.prefetch_related('tags'), page_num, after)
+
+    # the pages of all hotels are the same for everyone, so they are cached
+    if unfiltered:
+        hotels_list, has_next = page_cache.listing_page(page_num, after, get_page)
+    else:
+        hotels_list, has_next = get_page()
+    
+    if after is None:
+        previous = page_num - 1
+        next = page_num + 1 if has_next else None
+    elif has_next:
+        next_after = hotels_list[-1].id
+    
+    # the total number of hotels is counted only on demand (?count=1)
+    with_count = bool(request.GET.get('count'))
+    if with_count:
+        count = hotels.count()
+    
+    # the search parameters, kept by the links to the other pages
+    query = request.GET.copy()
+    for param in ['after', 'count']:
+        query.pop(param, None)
+    query = query.urlencode()
+    
     return render(request, "index.html", locals())
 
 
-def hotel_info(request, hotel_id):
+def availability_etag(request):
+    # the results change only with the hotels or with the occupancy
+    key = "%s|%s|%s" % (request.GET.urlencode(), page_cache.listing_generation(), inventory_days.occupancy_version())
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+@condition(etag_func=availability_etag)
+def availability(request):
+    """
+    JSON availability search: the hotels matching the AvailabilityForm
+    criteria which have the rooms free (see helper_views.available_hotels),
+    a page at a time. The next page is ?...&after=<next_after>.
+    """
+    form = AvailabilityForm(request.GET)
+    if not form.is_valid():
+        return HttpResponse(json.dumps({'errors': form.errors}), status=400, content_type='application/json')
+
+    hotels = search_hotels_by_form(form.cleaned_data)
+    page, has_next = available_hotels(hotels, form.cleaned_data['start_date'], form.cleaned_data['end_date'],
+                                      form.cleaned_data['rooms'], form.cleaned_data['after'])
+    next_after = page[-1][0].id if has_next else None
+
+    def results():
+        yield '{"hotels": ['
+        for i, (hotel, free_rooms) in enumerate(page):
+            yield (', ' if i else '') + json.dumps({
+                'id': hotel.id,
+                'name': hotel.name,
+                'stars': hotel.stars,
+                'location': hotel.location,
+                'url': hotel.get_absolute_url(),
+                'free_rooms': free_rooms,
+            }, sort_keys=True)
+        yield '], "next_after": %s}' % json.dumps(next_after)
+
+    return StreamingHttpResponse(results(), content_type='application/json')
+
+
+def calendar_etag(request, hotel_id):
+    # the free rooms change only with the occupancy (or with the day, by default)
+    key = "%s|%s|%s|%s" % (hotel_id, request.GET.urlencode(), date.today(), inventory_days.occupancy_version(hotel_id))
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+@condition(etag_func=calendar_etag)
+def calendar(request, hotel_id):
+    """
+    JSON calendar of the hotel: the number of free rooms of every type
+    on every day of the window of the CalendarForm
+    (see room_calendar.free_rooms_by_day).
+    """
     hotel = get_object_or_404(Hotel, id=hotel_id)
-    photo_album = Photo.objects.filter(hotel=hotel_id)
+    form = CalendarForm(request.GET)
+    if not form.is_valid():
+        return HttpResponse(json.dumps({'errors': form.errors}), status=400, content_type='application/json')
+
+    start_date, days = form.cleaned_data['start_date'], form.cleaned_data['days']
+    free_rooms = room_calendar.free_rooms_by_day(hotel.id, start_date, days)
+    return HttpResponse(json.dumps({
+        'hotel': hotel.id,
+        'days': [str(start_date + timedelta(days=day)) for day in range(days)],
+        'rooms': dict((room_type, rooms) for room_type, (rooms, free) in free_rooms.items()),
+        'free_rooms': dict((room_type, free) for room_type, (rooms, free) in free_rooms.items()),
+    }, sort_keys=True), content_type='application/json')
+
+
+def hotel_info(request, hotel_id):
+    def render_content():
+        hotel = get_object_or_404(Hotel.objects.prefetch_related('tags', 'photo_set__photovariant_set'), id=hotel_id)
+        photo_album = hotel.photo_set.all()
+        return render_to_string("hotel-info-content.html", locals())
+
+    # the content does not depend on the user, so it is cached for everyone
+    content = page_cache.hotel_content(hotel_id, render_content)
     return render(request, "hotel-info.html", locals())
 
 
+def booking_status(request, booking_id):
+    """
+    JSON status of a queued reservation request of the user
+    (see hotels.booking_queue), polled by the reserve page.
+    """
+    booking = get_object_or_404(BookingRequest, id=booking_id, user__id=request.user.id)
+    return HttpResponse(json.dumps(booking_queue.status(booking), sort_keys=True), content_type='application/json')
+
+
+def basic_auth_user(request):
+    """
+    Returns: the active user whose username and password are in the
+    HTTP Basic Authorization header of the request, or None
+    """
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'basic':
+        return None
+    try:
+        username, password = base64.b64decode(auth[1].encode('ascii')).decode('utf-8').split(':', 1)
+    except (TypeError, ValueError):     # not base64, not UTF-8 or without ':'
+        return None
+    user = authenticate(username=username, password=password)
+    return user if user is not None and user.is_active else None
+
+
+@csrf_exempt
+def reserve_batch_view(request):
+    """
+    Makes the reservations in the JSON list posted by a partner
+    (see helper_views.reserve_batch) and returns the results as JSON.
+
+    The partners' machines call it without a session: every request has
+    the username and password of a staff user or of a user in the group
+    settings.PARTNERS_GROUP in HTTP Basic authentication, so it needs no
+    CSRF token (and a browser session of a user is not enough).
+    """
+    user = basic_auth_user(request)
+    if user is None:
+        response = HttpResponse('<h1>401: Unauthorized</h1>Wrong username or password!', status=401)
+        response['WWW-Authenticate'] = 'Basic realm="reservations"'
+        return response
+    if not (user.is_staff or user.groups.filter(name=getattr(settings, 'PARTNERS_GROUP', 'partners')).exists()):
+        return HttpResponse('<h1>403: Forbidden</h1>', status=403)
+
+    if request.method != 'POST':
+        return HttpResponse('<h1>405: Method Not Allowed</h1>', status=405)
+    try:
+        items = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        return HttpResponse('<h1>400: Bad Request</h1>Expected a JSON list of reservations!', status=400)
+
+    results = reserve_batch(items, user)
+    logger.info("Batch of %d reservations, %d accepted", len(items), sum(1 for result in results if result['accepted']))
+    return HttpResponse(json.dumps(results), content_type='application/json')
+
+
+@staff_member_required
+def cache_stats(request):
+    return HttpResponse(json.dumps(page_cache.stats()), content_type='application/json')
+
+
+@staff_member_required
+def instrumentation_stats(request):
+    # the histograms of the requests served by this process (see hotels.instrumentation)
+    return HttpResponse(json.dumps(instrumentation.stats()), content_type='application/json')
+
+
 def login_view(request):
     login_data = request.POST if request.POST else None
     login_form = AuthenticateUser(login_data)
@@ -67,8 +247,8 @@ def register(request):
 
 
 def reserve(request, hotel_id):
-    hotel = Hotel.objects.filter(id=hotel_id)
-    room_types = Room.objects.filter(hotel=hotel).values('type').distinct()
+    # the types of the rooms in this hotel, as objects (cached per process)
+    room_types = room_types_of_hotel(hotel_id)
     
     data = request.POST if request.POST else None
     form = ReservationForm(data, extra=room_types)
@@ -76,42 +256,23 @@ def reserve(request, hotel_id):
     
     if request.method == 'POST':
         if form.is_valid():
-            # get rooms by type
-            room_types = [RoomType.objects.get(id=rt['type']) for rt in room_types]
-
-            rooms_to_save = []	# rooms_to_save = [ roomtype1, roomtype1, ..., roomtype2, roomtype2, ... ]
-            free_rooms_of_type = []
-            reservations = []
-
-            for room in room_types:
-                rooms_to_save += list(repeat(room.type, form.cleaned_data[room.type]))
-                
-            # foreach room in rooms_to_save make a separate reservation
-            for room in rooms_to_save:
-                free_rooms_of_type = get_free_rooms_of_type(hotel_id, form.cleaned_data['start_date'], form.cleaned_data['end_date'], room)
-                
-                if not free_rooms_of_type:
-                    # the reservation is not possible,
-                    # but we try to rearrange the previous ones
-                    # and see if we can make them fit better
-                    if interval_scheduling(hotel_id, room, form.cleaned_data['start_date'], form.cleaned_data['end_date'], request.user):
-                        log = "Success!"
-                        continue
-                    # else
-                    # delete all reservations from the current user request
-                    # (because either they all succeed or none does)
-                    for res_id in reservations:
-                        r = Reservation.objects.get(id=res_id)
-                        r.delete()
-                    log = "Not enough free rooms!"
-                    return render(request, "reserve.html", locals())
-                else:
-                    best_room_for_this = choose_best_room(free_rooms_of_type, form.cleaned_data['start_date'], form.cleaned_data['end_date'])
-                    reservation = Reservation(start_date=form.cleaned_data['start_date'], end_date=form.cleaned_data['end_date'], user=request.user, room=best_room_for_this)
-                    reservation.save()
-                    reservations.append(reservation.id)
+            requested = dict((room.type, form.cleaned_data[room.type]) for room in room_types if form.cleaned_data[room.type])
+            start_date, end_date = form.cleaned_data['start_date'], form.cleaned_data['end_date']
+
+            if not getattr(settings, 'BOOKING_QUEUE', False):
+                if reserve_rooms(hotel_id, requested, start_date, end_date, request.user):
                     log = "Success!"
-                    
+                else:
+                    log = "Not enough free rooms!"
+            # a type with fewer free rooms than requested on some of the days
+            # rejects the request at once, the others wait for the worker
+            # of the hotel (see hotels.booking_queue)
+            elif request_fully_booked(hotel_id, requested, start_date, end_date):
+                log = "Not enough free rooms!"
+            else:
+                booking = booking_queue.enqueue(hotel_id, requested, start_date, end_date, request.user)
+                log = booking_queue.MESSAGES[booking.status]
+
         else:
             log = "Form is not valid!"
     